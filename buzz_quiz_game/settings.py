@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -78,6 +79,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between calls; the DB executor's worker
+        # threads each hold one (see game/db_executor.py)
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so one that reads
+            # before writing waits for busy_timeout instead of failing with
+            # "database is locked" (see GAME_SQLITE_PROFILE)
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -130,12 +141,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Channels settings
 ASGI_APPLICATION = 'buzz_quiz_game.asgi.application'
+# Messages a connection's channel may hold before the layer drops new ones
+# (Channels defaults to 100). Buzz order messages are throttled per buzz
+# window, so a connection gets a handful per round however many players buzz;
+# the rest is headroom for consumers that fall behind in games of several
+# hundred players. See "Large Games" in TESTING.md.
+CHANNEL_CAPACITY = 1000
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {
+            'capacity': CHANNEL_CAPACITY,
+        },
     },
 }
 
+# Multi-node mode: set GAME_REDIS_URL (e.g. redis://localhost:6379/0) to use the
+# Redis channel layer and keep state versions and buzz rankings in Redis
+GAME_REDIS_URL = os.environ.get('GAME_REDIS_URL')
+if GAME_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [GAME_REDIS_URL],
+                'capacity': CHANNEL_CAPACITY,
+            },
+        },
+    }
+
+# /metrics/ is only served in DEBUG mode, to staff users, and to scrapers that
+# send "Authorization: Bearer <GAME_METRICS_TOKEN>" when it is set
+GAME_METRICS_TOKEN = os.environ.get('GAME_METRICS_TOKEN')
+
+# Game settings without an entry above have their defaults in the module that
+# reads them; set one here only to change it. Dict-valued ones take just the
+# options being changed.
+#
+# GAME_STATE_CACHE_IDLE_TIMEOUT, GAME_EVENT_LOG_SIZE  game/state_cache.py
+# BUZZ_WRITE_BEHIND                                   game/buzz_writer.py
+# GAME_BROADCAST_COALESCE_WINDOW                      game/broadcast.py
+# GAME_BUZZ_BROADCAST_WINDOW                          game/broadcast.py
+# GAME_JSON_ENCODER                                   game/encoding.py
+# GAME_CLOCK_SYNC                                     game/clock.py
+# GAME_DB_EXECUTOR, GAME_ASYNC_ORM                    game/db_executor.py
+# GAME_SQLITE_PROFILE                                 game/sqlite.py
+# GAME_JOIN_ADMISSION                                 game/admission.py
+# GAME_LEADERBOARD_SIZE                               game/roles.py
+# GAME_SPECTATOR_TICKER                               game/spectators.py
+# GAME_INBOUND_RATE_LIMIT                             game/ratelimit.py
+# GAME_BINARY_PROTOCOL                                game/wire.py
+# GAME_STATE_ENDPOINT, GAME_METRICS_ENABLED           game/views.py
+# GAME_LOG_SAMPLING, GAME_FRAME_BUFFER_SIZE           game/logutils.py
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -146,11 +205,18 @@ LOGGING = {
             'style': '{',
         },
     },
+    'filters': {
+        'sampled': {
+            '()': 'game.logutils.MessageTypeSampler',
+        },
+    },
     'handlers': {
+        # Written from a background thread so logging never blocks the event loop
         'console': {
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            'class': 'game.logutils.QueueStreamHandler',
             'formatter': 'verbose',
+            'filters': ['sampled'],
         },
     },
     'loggers': {
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 from .models import GameSession, Player, BuzzEvent
 
 
@@ -7,6 +8,15 @@ class GameSessionAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'is_active', 'created_at', 'current_round', 'player_count')
     search_fields = ('code', 'name')
     list_filter = ('is_active', 'created_at')
+    
+    def get_queryset(self, request):
+        """Count players in the list query rather than once per row."""
+        return super().get_queryset(request).annotate(num_players=Count('players'))
+    
+    def player_count(self, obj):
+        return obj.num_players
+    
+    player_count.admin_order_field = 'num_players'
 
 
 @admin.register(Player)
@@ -14,17 +24,19 @@ class PlayerAdmin(admin.ModelAdmin):
     list_display = ('name', 'game_session', 'score', 'buzzer_sound')
     list_filter = ('game_session', 'buzzer_sound')
     search_fields = ('name', 'device_id')
+    list_select_related = ('game_session',)
 
 
 @admin.register(BuzzEvent)
 class BuzzEventAdmin(admin.ModelAdmin):
-    list_display = ('player', 'game_session', 'round_number', 'formatted_client_time', 'is_correct')
+    list_display = ('player', 'game_session', 'round_number', 'formatted_buzz_time', 'time_offset', 'is_correct')
     list_filter = ('game_session', 'round_number', 'is_correct')
+    list_select_related = ('player__game_session', 'game_session')
     
-    def formatted_client_time(self, obj):
-        """Format the timestamp for readability."""
+    def formatted_buzz_time(self, obj):
+        """Format the server-corrected timestamp for readability."""
         from datetime import datetime
-        dt = datetime.fromtimestamp(obj.client_timestamp / 1000)
+        dt = datetime.fromtimestamp(obj.corrected_timestamp / 1000)
         return dt.strftime('%H:%M:%S.%f')[:-3]
     
-    formatted_client_time.short_description = 'Buzz Time'
\ No newline at end of file
+    formatted_buzz_time.short_description = 'Buzz Time'
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""Join admission: batched player registration per game.
+
+When a room full of people scans the join QR code at once, registering
+each player separately costs several queries per join plus one per name
+collision. Instead, joins for a game are collected for a short window and
+admitted together by one database call:
+
+- names are allocated against an in-memory index of the names and
+  devices already registered in the game, loaded once per game;
+- new players are inserted with a single ``bulk_create`` and rejoining
+  devices updated with a single ``bulk_update``.
+
+Admission for a game always runs on that game's write lane (see
+``game/db_executor.py``), so batches for the same game never overlap and
+the index needs no locking of its own. If another process registers a
+name the index thought was free, the insert fails, the index is reloaded
+and the batch is retried.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from django.db import IntegrityError, transaction
+
+from .conf import SettingGroup
+from .db_executor import database_write
+from .metrics import registry
+from .models import Player
+from .state_cache import serialize_player
+
+logger = logging.getLogger('django.channels')
+
+admission_settings = SettingGroup('GAME_JOIN_ADMISSION', {
+    # Seconds to collect joins for a game before admitting them together;
+    # 0 admits each join on its own
+    'WINDOW': 0.02,
+    # Admit at once when this many joins are waiting
+    'MAX_BATCH': 200,
+    # Games whose name index is kept in memory, least recently used dropped first
+    'MAX_GAMES': 1000,
+})
+
+
+class NameIndex:
+    """Names and devices already registered in one game."""
+    __slots__ = ('names', 'devices')
+
+    def __init__(self, rows):
+        self.names = set()
+        self.devices: Dict[str, int] = {}
+        for player_id, name, device_id in rows:
+            self.names.add(name)
+            self.devices.setdefault(device_id, player_id)
+
+    @classmethod
+    def load(cls, game_id: int) -> 'NameIndex':
+        return cls(Player.objects.filter(game_session_id=game_id).values_list('id', 'name', 'device_id'))
+
+
+def allocate_name(names: set, name: str) -> str:
+    """Claim ``name``, or the first free ``name (n)``, in ``names`` and return it."""
+    original_name = name
+    suffix = 1
+    while name in names:
+        name = f"{original_name} ({suffix})"
+        suffix += 1
+    names.add(name)
+    return name
+
+
+class JoinRequest:
+    __slots__ = ('name', 'device_id', 'buzzer_sound', 'future')
+
+    def __init__(self, name: str, device_id: str, buzzer_sound: str, future: asyncio.Future):
+        self.name = name
+        self.device_id = device_id
+        self.buzzer_sound = buzzer_sound
+        self.future = future
+
+
+class JoinBatch:
+    """Joins for one game waiting to be admitted."""
+    __slots__ = ('game_code', 'game_id', 'requests', 'timer')
+
+    def __init__(self, game_code: str, game_id: int):
+        self.game_code = game_code
+        self.game_id = game_id
+        self.requests: List[JoinRequest] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class JoinAdmission:
+    """Collect joins per game and register each batch with one database call."""
+
+    def __init__(self):
+        self._pending: Dict[str, JoinBatch] = {}
+        # Keyed by game id: codes can be reused once a game is deleted
+        self._indexes: 'OrderedDict[int, NameIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'joins': 0, 'batches': 0, 'created': 0, 'rejoined': 0, 'retries': 0, 'max_batch': 0}
+
+    async def join(self, game_code: str, game_id: int, name: str, device_id: str,
+                   buzzer_sound: str) -> Optional[Dict[str, Any]]:
+        """Register a player, or update the one already joined from this device.
+
+        Returns the player as sent to clients, or None if the join failed.
+        """
+        if not name or not device_id:
+            return None
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(game_code)
+        if batch is None:
+            batch = self._pending[game_code] = JoinBatch(game_code, game_id)
+            window = admission_settings['WINDOW']
+            if window > 0:
+                batch.timer = loop.call_later(window, lambda: loop.create_task(self.flush(game_code)))
+        request = JoinRequest(name, device_id, buzzer_sound, loop.create_future())
+        batch.requests.append(request)
+        self.counters['joins'] += 1
+
+        if batch.timer is None or len(batch.requests) >= admission_settings['MAX_BATCH']:
+            await self.flush(game_code)
+        return await request.future
+
+    async def flush(self, game_code: str) -> None:
+        """Admit the joins waiting for a game now."""
+        batch = self._pending.pop(game_code, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+        try:
+            players = await database_write(self._admit)(batch)
+        except Exception as e:
+            logger.error(f"Error admitting {len(batch.requests)} joins to game {game_code}: {str(e)}")
+            players = [None] * len(batch.requests)
+        for request, player in zip(batch.requests, players):
+            if not request.future.done():
+                request.future.set_result(player)
+
+    def discard_game(self, game_id: int) -> None:
+        with self._lock:
+            self._indexes.pop(game_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+        self._pending.clear()
+
+    def _admit(self, batch: JoinBatch) -> List[Dict[str, Any]]:
+        """Register a batch of joins (sync, on the game's write lane)."""
+        for attempt in range(3):
+            index = self._get_index(batch)
+            try:
+                with transaction.atomic():
+                    return self._register(batch, index)
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+                # Someone else took a name the index had as free
+                self.counters['retries'] += 1
+                self.discard_game(batch.game_id)
+
+    def _get_index(self, batch: JoinBatch) -> NameIndex:
+        with self._lock:
+            index = self._indexes.get(batch.game_id)
+            if index is not None:
+                self._indexes.move_to_end(batch.game_id)
+                return index
+        index = NameIndex.load(batch.game_id)
+        with self._lock:
+            self._indexes[batch.game_id] = index
+            while len(self._indexes) > admission_settings['MAX_GAMES']:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _register(self, batch: JoinBatch, index: NameIndex) -> List[Dict[str, Any]]:
+        # Work on a copy of the names so a failed attempt leaves the index as it was
+        names = set(index.names)
+        rejoining = Player.objects.in_bulk([
+            index.devices[request.device_id] for request in batch.requests if request.device_id in index.devices
+        ])
+        by_device: Dict[str, Player] = {}
+        created: List[Player] = []
+        updated: Dict[int, Player] = {}
+        # Names given up by renames are only free for later batches, so no
+        # row in this one can clash with a name another row still holds
+        released = set()
+
+        for request in batch.requests:
+            player = by_device.get(request.device_id)
+            if player is None and request.device_id in index.devices:
+                player = rejoining.get(index.devices[request.device_id])
+            if player is None:
+                player = Player(
+                    game_session_id=batch.game_id,
+                    device_id=request.device_id,
+                    name=allocate_name(names, request.name),
+                    buzzer_sound=request.buzzer_sound
+                )
+                created.append(player)
+            else:
+                # A rejoin keeps its player; the name only changes if it is free
+                changed = player.buzzer_sound != request.buzzer_sound
+                player.buzzer_sound = request.buzzer_sound
+                if request.name != player.name and request.name not in names:
+                    released.add(player.name)
+                    names.add(request.name)
+                    player.name = request.name
+                    changed = True
+                if changed and player.pk is not None:
+                    updated[player.pk] = player
+            by_device[request.device_id] = player
+
+        if created:
+            Player.objects.bulk_create(created)
+        if updated:
+            Player.objects.bulk_update(list(updated.values()), ['name', 'buzzer_sound'])
+
+        index.names = names - released
+        for player in created:
+            index.devices[player.device_id] = player.pk
+
+        self.counters['batches'] += 1
+        self.counters['created'] += len(created)
+        self.counters['rejoined'] += len(updated)
+        self.counters['max_batch'] = max(self.counters['max_batch'], len(batch.requests))
+        logger.info(f"Admitted {len(batch.requests)} joins to game {batch.game_code}: "
+                    f"{len(created)} new, {len(updated)} rejoined", extra={'message_type': 'join_game'})
+        return [serialize_player(by_device[request.device_id]) for request in batch.requests]
+
+
+join_admission = JoinAdmission()
+
+
+def collect_admission_metrics():
+    counters = join_admission.counters
+    yield 'buzzquiz_joins_total', 'counter', 'Joins received', counters['joins']
+    yield 'buzzquiz_join_batches_total', 'counter', 'Join batches admitted', counters['batches']
+    yield 'buzzquiz_join_players_created_total', 'counter', 'Players created by joins', counters['created']
+    yield 'buzzquiz_join_retries_total', 'counter', 'Join batches retried after a name conflict', \
+        counters['retries']
+
+
+registry.add_collector(collect_admission_metrics)
@@ -0,0 +1,311 @@
+"""Performance benchmarks for GameConsumer handlers.
+
+Each benchmark fills a room with connected players, sends one message
+that exercises a handler and measures:
+
+- wall time until every socket that should hear of it has received the
+  frame its role gets,
+- database queries made while handling it,
+- bytes sent to all sockets as a result.
+
+Results are compared against ``benchmark_baselines.json``; see
+``game/tests.py`` for the regression tests and how to refresh baselines.
+"""
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import get_default_application
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+
+from .admission import join_admission
+from .broadcast import broadcast_coalescer
+from .buzz_index import buzz_index
+from .buzz_writer import buzz_writer
+from .models import GameSession, Player
+from .state_cache import game_state_cache
+
+ROOM_SIZES = (1, 10, 50)
+REPEATS = 5
+BASELINE_PATH = Path(__file__).with_name('benchmark_baselines.json')
+
+# Most queries each handler may make, at any room size. Unlike the recorded
+# baselines these are maintained by hand, so refreshing the baselines can't
+# quietly raise them.
+QUERY_BUDGETS = {
+    # Name index load and insert, plus the savepoint pair around the admission
+    # batch (inside the test transaction; BEGIN/COMMIT outside one)
+    'handle_join_game': 4,
+    'handle_buzz': 0,
+    'handle_judge_answer': 3,
+    'handle_start_round': 2,
+}
+
+# Settings that make handler costs deterministic: no coalescing delay, no
+# clock probes landing in a measurement and buzz rows only written when the
+# benchmark flushes them. Database calls stay on the calling thread, where
+# queries are counted and where the test transaction's rows are visible.
+BENCHMARK_SETTINGS = {
+    'GAME_BROADCAST_COALESCE_WINDOW': 0,
+    'GAME_BUZZ_BROADCAST_WINDOW': 0,
+    'GAME_CLOCK_SYNC': {'MAX_UNANSWERED': 0},
+    'GAME_DB_EXECUTOR': {'ENABLED': False},
+    'GAME_JOIN_ADMISSION': {'WINDOW': 0},
+    'BUZZ_WRITE_BEHIND': {'BATCH_SIZE': 100000, 'FLUSH_INTERVAL': 3600, 'MAX_QUEUE': 100000, 'OVERFLOW': 'block'},
+}
+
+
+def reset_realtime_state() -> None:
+    """Forget all per-process game state between benchmark runs."""
+    game_state_cache.clear()
+    buzz_index.clear()
+    join_admission.clear()
+    buzz_writer._pending = []
+    broadcast_coalescer._pending.clear()
+    broadcast_coalescer._buzz_windows.clear()
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries made on a connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Client:
+    """A connected socket that tallies the bytes it receives."""
+
+    def __init__(self, communicator: WebsocketCommunicator, player_id: Optional[int] = None):
+        self.communicator = communicator
+        self.player_id = player_id
+        self.bytes = 0
+
+    async def receive(self, timeout: float = 5) -> Dict[str, Any]:
+        message = await self.communicator.receive_output(timeout)
+        text = message.get('text') or message.get('bytes', b'').decode()
+        self.bytes += len(text)
+        return json.loads(text)
+
+    async def wait_for(self, message_type: str) -> None:
+        while (await self.receive())['type'] != message_type:
+            pass
+
+    async def drain(self) -> None:
+        while not await self.communicator.receive_nothing(timeout=0.001, interval=0.001):
+            await self.receive()
+
+
+class Room:
+    """A game with a host and ``size`` connected players."""
+
+    def __init__(self, size: int, queries: QueryCounter):
+        self.size = size
+        self.queries = queries
+        self.application = get_default_application()
+        self.game = None
+        self.host: Optional[Client] = None
+        self.players: List[Client] = []
+
+    @property
+    def clients(self) -> List[Client]:
+        return [self.host] + self.players
+
+    async def connect(self, role: str = 'player', player_id: Optional[int] = None) -> Client:
+        communicator = WebsocketCommunicator(self.application, f'/ws/game/{self.game.code}/?role={role}')
+        connected, _ = await communicator.connect()
+        assert connected
+        return Client(communicator, player_id)
+
+    async def setup(self) -> None:
+        await get_channel_layer().flush()
+        reset_realtime_state()
+        self.game = await sync_to_async(GameSession.objects.create)(code=f'BENCH{self.size}', name='Benchmark')
+        players = await sync_to_async(Player.objects.bulk_create)([
+            Player(game_session=self.game, name=f'Player {i}', device_id=f'bench-{i}')
+            for i in range(self.size)
+        ])
+        self.host = await self.connect('host')
+        for player in players:
+            client = await self.connect('player', player.id)
+            # Rejoin, so the consumer knows whose rank and standing to send
+            await client.communicator.send_json_to({
+                'type': 'join_game',
+                'name': player.name,
+                'device_id': player.device_id,
+                'buzzer_sound': player.buzzer_sound
+            })
+            self.players.append(client)
+        await self.drain()
+
+    async def drain(self) -> None:
+        await asyncio.sleep(0.01)
+        for client in self.clients:
+            await client.drain()
+
+    async def teardown(self) -> None:
+        await buzz_writer.flush()
+        for client in self.clients:
+            await client.communicator.disconnect()
+        await get_channel_layer().flush()
+
+    async def start_round(self) -> int:
+        await self.host.communicator.send_json_to({'type': 'start_round', 'is_host': True})
+        await self.drain()
+        state = game_state_cache.get(self.game.code)
+        return state.game['current_round']
+
+    def expect(self, host_type: str, player_type: Optional[str] = None) -> List[Tuple[Client, str]]:
+        """The host waiting for ``host_type`` and every player for ``player_type``."""
+        expected = [(self.host, host_type)]
+        if player_type:
+            expected += [(player, player_type) for player in self.players]
+        return expected
+    
+    async def measure(self, sender: Client, payload: Dict[str, Any],
+                      expected: List[Tuple[Client, str]]) -> Dict[str, float]:
+        """Send one message and measure the handler's cost until each client has the frame it expects."""
+        everyone = self.clients if sender in self.clients else self.clients + [sender]
+        bytes_before = sum(client.bytes for client in everyone)
+        queries_before = self.queries.count
+        started = time.perf_counter()
+        await sender.communicator.send_json_to(payload)
+        await asyncio.gather(*(client.wait_for(frame_type) for client, frame_type in expected))
+        wall_ms = (time.perf_counter() - started) * 1000
+        for client in everyone:
+            await client.drain()
+        return {
+            'wall_ms': wall_ms,
+            'queries': self.queries.count - queries_before,
+            'bytes': sum(client.bytes for client in everyone) - bytes_before,
+        }
+
+
+async def bench_join_game(room: Room, repeat: int) -> Dict[str, float]:
+    newcomer = await room.connect()
+    await room.drain()
+    await newcomer.drain()
+    result = await room.measure(newcomer, {
+        'type': 'join_game',
+        'name': f'Newcomer {repeat}',
+        'device_id': f'bench-new-{repeat}',
+        'buzzer_sound': 'default'
+    }, room.expect('state_patch', 'leaderboard') + [(newcomer, 'standing')])
+    await newcomer.communicator.disconnect()
+    await room.drain()
+    return result
+
+
+async def bench_buzz(room: Room, repeat: int) -> Dict[str, float]:
+    # Players only buzz once per round, so start another once all have
+    if repeat % len(room.players) == 0:
+        room.round = await room.start_round()
+    player = room.players[repeat % len(room.players)]
+    return await room.measure(player, {
+        'type': 'buzz',
+        'player_id': player.player_id,
+        'timestamp': int(time.time() * 1000),
+        'round': room.round
+    }, room.expect('buzz_order') + [(player, 'buzz_rank')])
+
+
+async def bench_judge_answer(room: Room, repeat: int) -> Dict[str, float]:
+    player = room.players[repeat % len(room.players)]
+    round_number = await room.start_round()
+    await player.communicator.send_json_to({
+        'type': 'buzz',
+        'player_id': player.player_id,
+        'timestamp': int(time.time() * 1000),
+        'round': round_number
+    })
+    await room.drain()
+    await buzz_writer.flush()
+    return await room.measure(room.host, {
+        'type': 'judge_answer',
+        'is_host': True,
+        'player_id': player.player_id,
+        'is_correct': True,
+        'round': round_number
+    }, room.expect('state_patch', 'leaderboard'))
+
+
+async def bench_start_round(room: Room, repeat: int) -> Dict[str, float]:
+    return await room.measure(room.host, {'type': 'start_round', 'is_host': True},
+                              room.expect('state_patch', 'round_state'))
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'handle_join_game': bench_join_game,
+    'handle_buzz': bench_buzz,
+    'handle_judge_answer': bench_judge_answer,
+    'handle_start_round': bench_start_round,
+}
+
+
+async def run_benchmark(name: str, size: int, queries: QueryCounter, repeats: int = REPEATS) -> Dict[str, float]:
+    """Run one handler benchmark and return median wall time and worst-case counts."""
+    room = Room(size, queries)
+    await room.setup()
+    try:
+        samples = [await BENCHMARKS[name](room, repeat) for repeat in range(repeats)]
+    finally:
+        await room.teardown()
+    return {
+        'wall_ms': round(statistics.median(s['wall_ms'] for s in samples), 2),
+        'queries': max(s['queries'] for s in samples),
+        'bytes': max(s['bytes'] for s in samples),
+    }
+
+
+def run_benchmarks(name: str, sizes=ROOM_SIZES) -> Dict[str, Dict[str, float]]:
+    """Benchmark a handler at each room size, keyed by size.
+
+    Must be called from synchronous code: consumers' database calls run on
+    the calling thread, which is where queries are counted.
+    """
+    queries = QueryCounter()
+
+    async def run_all():
+        return {str(size): await run_benchmark(name, size, queries) for size in sizes}
+
+    with connection.execute_wrapper(queries):
+        return async_to_sync(run_all)()
+
+
+def load_baselines() -> Dict[str, Dict[str, Dict[str, float]]]:
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text())
+
+
+def save_baselines(baselines: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    BASELINE_PATH.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+
+
+def find_regressions(result: Dict[str, float], baseline: Dict[str, float],
+                     time_factor: float = 3.0, time_slack_ms: float = 20.0,
+                     bytes_factor: float = 1.1) -> List[str]:
+    """Compare a result with its baseline.
+
+    Query counts must not grow at all. Bytes may grow by ``bytes_factor``
+    and wall time, which is noisy across machines, by ``time_factor``
+    plus ``time_slack_ms``.
+    """
+    regressions = []
+    if result['queries'] > baseline['queries']:
+        regressions.append(f"queries {result['queries']} > baseline {baseline['queries']}")
+    if result['bytes'] > baseline['bytes'] * bytes_factor:
+        regressions.append(f"bytes {result['bytes']} > baseline {baseline['bytes']} x {bytes_factor}")
+    if result['wall_ms'] > baseline['wall_ms'] * time_factor + time_slack_ms:
+        regressions.append(f"wall time {result['wall_ms']:.1f}ms > baseline {baseline['wall_ms']:.1f}ms "
+                           f"x {time_factor} + {time_slack_ms}ms")
+    return regressions
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from typing import Dict, Any, Optional
+
+from django.conf import settings
+
+from .encoding import encode_group_message, group_formats
+from .logutils import frame_recorder
+from .metrics import CHANNEL_LAYER_SEND_SECONDS, registry
+from .roles import PERSONAL_TYPES
+
+# Snapshots that may be merged (a newer one makes older pending ones moot)
+# and state patches that may be batched into one frame
+COALESCED_TYPES = ('game_state_message', 'state_patch_message', 'leaderboard_message')
+
+# Buzz order snapshots: the first after a quiet spell goes out at once, and
+# during a buzz storm only the latest is sent once per buzz window
+THROTTLED_TYPES = ('buzz_order_message', 'buzz_rank_message')
+
+
+class PendingBroadcast:
+    """Snapshots waiting to be sent to one group."""
+    __slots__ = ('channel_layer', 'messages', 'timer')
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class BuzzWindow:
+    """An open buzz window for one group and the latest message held back in it."""
+    __slots__ = ('channel_layer', 'message')
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.message: Optional[Dict[str, Any]] = None
+
+
+class BroadcastCoalescer:
+    """Merge bursts of game state, patch, leaderboard and buzz order broadcasts per game.
+
+    Snapshot messages sent within the coalescing window are merged, and
+    state patches batched, and sent once when the window closes. Buzz
+    order messages are throttled instead: one sent to a quiet group goes
+    out at once and opens a buzz window, and of those sent while it is
+    open only the latest goes out, when it closes. A round's buzz storm
+    therefore costs each group one send per buzz window rather than one
+    per buzz. Any other message type is treated as latency-critical:
+    pending messages are flushed first, to keep ordering, and the message
+    goes out immediately. Client frames are encoded once here, right
+    before the group send.
+    """
+
+    def __init__(self, window: Optional[float] = None, buzz_window: Optional[float] = None):
+        self.window = window
+        self.buzz_window = buzz_window
+        self._pending: Dict[str, PendingBroadcast] = {}
+        self._buzz_windows: Dict[str, BuzzWindow] = {}
+        self.coalesced = 0
+
+    def get_window(self) -> float:
+        if self.window is not None:
+            return self.window
+        return getattr(settings, 'GAME_BROADCAST_COALESCE_WINDOW', 0.1)
+
+    def get_buzz_window(self) -> float:
+        if self.buzz_window is not None:
+            return self.buzz_window
+        return getattr(settings, 'GAME_BUZZ_BROADCAST_WINDOW', 0.05)
+
+    async def group_send(self, channel_layer, group: str, message: Dict[str, Any]) -> None:
+        """Send a message to a group, coalescing snapshot types."""
+        message_type = message['type']
+        if message_type in THROTTLED_TYPES:
+            await self.throttle(channel_layer, group, message)
+            return
+        window = self.get_window()
+        if message_type not in COALESCED_TYPES or window <= 0:
+            await self.flush(group)
+            await self.send(channel_layer, group, message)
+            return
+
+        pending = self._pending.get(group)
+        if pending is None:
+            pending = self._pending[group] = PendingBroadcast(channel_layer)
+            loop = asyncio.get_running_loop()
+            pending.timer = loop.call_later(window, lambda: loop.create_task(self.flush(group)))
+        else:
+            self.coalesced += 1
+
+        messages = pending.messages
+        if message_type == 'leaderboard_message':
+            # Leaderboard changes merge, the later entry for a player winning
+            pending_board = messages.get('leaderboard_message')
+            if pending_board is not None:
+                players = {entry['id']: entry for entry in pending_board.get('players', [])}
+                players.update((entry['id'], entry) for entry in message.get('players', []))
+                message = {**pending_board, **message}
+                if players:
+                    message['players'] = list(players.values())
+            messages['leaderboard_message'] = message
+        elif message_type == 'game_state_message':
+            # A game state supersedes any patches it already includes
+            patches = messages.pop('state_patch_message', None)
+            messages['game_state_message'] = message
+            if patches:
+                newer = [p for p in patches['patches'] if p['version'] > message['version']]
+                if newer:
+                    messages['state_patch_message'] = {**patches, 'patches': newer}
+        elif 'state_patch_message' in messages:
+            pending_patches = messages['state_patch_message']
+            messages['state_patch_message'] = {
+                **pending_patches,
+                'patches': pending_patches['patches'] + message['patches']
+            }
+        else:
+            messages['state_patch_message'] = message
+
+    async def throttle(self, channel_layer, group: str, message: Dict[str, Any]) -> None:
+        """Send a buzz order message now, or hold it back until the group's buzz window closes."""
+        buzz_window = self._buzz_windows.get(group)
+        if buzz_window is not None:
+            if buzz_window.message is not None:
+                self.coalesced += 1
+            buzz_window.message = message
+            return
+        await self.flush(group)
+        self._open_buzz_window(channel_layer, group)
+        await self.send(channel_layer, group, message)
+
+    def _open_buzz_window(self, channel_layer, group: str) -> None:
+        window = self.get_buzz_window()
+        if window <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        self._buzz_windows[group] = BuzzWindow(channel_layer)
+        loop.call_later(window, lambda: loop.create_task(self._close_buzz_window(group)))
+
+    async def _close_buzz_window(self, group: str) -> None:
+        buzz_window = self._buzz_windows.pop(group, None)
+        if buzz_window is None or buzz_window.message is None:
+            return
+        # Still busy: send the latest and hold the next ones back for another window
+        self._open_buzz_window(buzz_window.channel_layer, group)
+        await self.send(buzz_window.channel_layer, group, buzz_window.message)
+
+    async def flush(self, group: str) -> None:
+        """Send any pending messages for a group now."""
+        pending = self._pending.pop(group, None)
+        if pending is not None:
+            if pending.timer:
+                pending.timer.cancel()
+            for message in pending.messages.values():
+                await self.send(pending.channel_layer, group, message)
+        buzz_window = self._buzz_windows.get(group)
+        if buzz_window is not None and buzz_window.message is not None:
+            message, buzz_window.message = buzz_window.message, None
+            await self.send(buzz_window.channel_layer, group, message)
+
+    @staticmethod
+    async def send(channel_layer, group: str, message: Dict[str, Any]) -> None:
+        if message['type'] in PERSONAL_TYPES:
+            # Each consumer builds its own frame from these
+            encoded = message
+            frame_recorder.record(group, 'out', message)
+        else:
+            encoded = encode_group_message(message, *group_formats(group))
+            frame_recorder.record(group, 'out', encoded.get('text', message))
+        started = time.perf_counter()
+        await channel_layer.group_send(group, encoded)
+        CHANNEL_LAYER_SEND_SECONDS.labels('group_send').observe(time.perf_counter() - started)
+
+
+broadcast_coalescer = BroadcastCoalescer()
+
+
+def collect_broadcast_metrics():
+    yield 'buzzquiz_broadcasts_coalesced_total', 'counter', 'Snapshot broadcasts merged into a pending one', \
+        broadcast_coalescer.coalesced
+
+
+registry.add_collector(collect_broadcast_metrics)
@@ -0,0 +1,146 @@
+import bisect
+import itertools
+from typing import Dict, Any, List, Optional, Tuple
+
+from .models import BuzzEvent
+
+
+class BuzzRecord:
+    """Compact in-memory record of a single buzz."""
+    __slots__ = ('sort_key', 'player_id', 'player_name', 'timestamp', 'is_correct')
+
+    def __init__(self, sort_key: Tuple[int, int], player_id: int, player_name: str,
+                 timestamp: int, is_correct: Optional[bool] = None):
+        self.sort_key = sort_key
+        self.player_id = player_id
+        self.player_name = player_name
+        self.timestamp = timestamp
+        self.is_correct = is_correct
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            # Rows are written behind, so buzzes are identified by arrival order
+            'id': self.sort_key[1],
+            'player_id': self.player_id,
+            'player_name': self.player_name,
+            'timestamp': self.timestamp,
+            'is_correct': self.is_correct
+        }
+
+
+class RoundBuzzes:
+    """Buzzes for one round, kept sorted by client timestamp then arrival.
+
+    Only a player's first buzz in a round counts; later ones are ignored.
+    """
+
+    def __init__(self):
+        self.records: List[BuzzRecord] = []
+        self._players = set()
+        self._arrival = itertools.count(1)
+
+    def has_buzzed(self, player_id: int) -> bool:
+        return player_id in self._players
+
+    def add(self, player_id: int, player_name: str, timestamp: int,
+            is_correct: Optional[bool] = None) -> Optional[BuzzRecord]:
+        """Insert a buzz at its ranked position and return its record, or None for a repeat."""
+        if player_id in self._players:
+            return None
+        self._players.add(player_id)
+        record = BuzzRecord((timestamp, next(self._arrival)), player_id,
+                            player_name, timestamp, is_correct)
+        bisect.insort(self.records, record, key=lambda r: r.sort_key)
+        return record
+
+    def set_correctness(self, player_id: int, is_correct: Optional[bool]) -> bool:
+        """Mark a player's buzzes as correct or incorrect."""
+        found = False
+        for record in self.records:
+            if record.player_id == player_id:
+                record.is_correct = is_correct
+                found = True
+        return found
+
+    def rank_of(self, player_id: int) -> Optional[int]:
+        """Return the 1-based position of a player's first buzz."""
+        for position, record in enumerate(self.records, start=1):
+            if record.player_id == player_id:
+                return position
+        return None
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [record.as_dict() for record in self.records]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+def round_buzz_rows(game_id: int, round_number: int):
+    """Query for a round's buzzes in ranked order."""
+    return BuzzEvent.objects.filter(
+        game_session_id=game_id,
+        round_number=round_number
+    ).order_by('corrected_timestamp', 'id').values_list(
+        'player_id', 'player__name', 'corrected_timestamp', 'is_correct'
+    )
+
+
+def load_round_buzzes(game_id: int, round_number: int) -> RoundBuzzes:
+    """Rebuild a round's buzz ranking from the database."""
+    buzzes = RoundBuzzes()
+    for player_id, name, timestamp, is_correct in round_buzz_rows(game_id, round_number):
+        buzzes.add(player_id, name, timestamp, is_correct)
+    return buzzes
+
+
+async def aload_round_buzzes(game_id: int, round_number: int) -> RoundBuzzes:
+    """``load_round_buzzes`` through Django's async ORM."""
+    buzzes = RoundBuzzes()
+    async for player_id, name, timestamp, is_correct in round_buzz_rows(game_id, round_number):
+        buzzes.add(player_id, name, timestamp, is_correct)
+    return buzzes
+
+
+class BuzzIndex:
+    """Per-game, per-round buzz rankings served from memory.
+
+    While a round is live this index is the source of truth for buzz
+    order; the database is only written to. A round that is not in
+    memory (e.g. after a restart) is rebuilt from the database once.
+    """
+
+    def __init__(self, rounds_kept: int = 2):
+        self.rounds_kept = rounds_kept
+        self._games: Dict[str, Dict[int, RoundBuzzes]] = {}
+
+    def get(self, code: str, round_number: int) -> Optional[RoundBuzzes]:
+        return self._games.get(code, {}).get(round_number)
+
+    def get_or_create(self, code: str, round_number: int) -> RoundBuzzes:
+        rounds = self._games.setdefault(code, {})
+        buzzes = rounds.get(round_number)
+        if buzzes is None:
+            buzzes = rounds[round_number] = RoundBuzzes()
+            # Only keep the most recent rounds; older ones stay in the database
+            for old_round in sorted(rounds)[:-self.rounds_kept]:
+                del rounds[old_round]
+        return buzzes
+
+    def install(self, code: str, round_number: int, buzzes: RoundBuzzes) -> RoundBuzzes:
+        """Install a round rebuilt from the database unless one is already live."""
+        current = self.get(code, round_number)
+        if current is not None:
+            return current
+        self.get_or_create(code, round_number)
+        self._games[code][round_number] = buzzes
+        return buzzes
+
+    def discard_game(self, code: str) -> None:
+        self._games.pop(code, None)
+
+    def clear(self) -> None:
+        self._games.clear()
+
+
+buzz_index = BuzzIndex()
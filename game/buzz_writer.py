@@ -0,0 +1,173 @@
+import asyncio
+import atexit
+import logging
+import time
+from typing import Dict, Any, List, Optional
+
+from django.utils import timezone
+
+from .conf import SettingGroup
+from .db_executor import database_write
+from .metrics import registry
+from .models import BuzzEvent
+
+logger = logging.getLogger('django.channels')
+
+writer_settings = SettingGroup('BUZZ_WRITE_BEHIND', {
+    # Flush as soon as this many buzzes are pending
+    'BATCH_SIZE': 50,
+    # ... or when the oldest pending buzz has waited this many seconds
+    'FLUSH_INTERVAL': 0.05,
+    # Upper bound on pending buzzes
+    'MAX_QUEUE': 1000,
+    # What to do when the queue is full: 'block' makes the sender wait for a
+    # flush, 'drop' discards the new row (it stays ranked in memory)
+    'OVERFLOW': 'block',
+})
+
+
+class BuzzWriter:
+    """Write-behind queue that persists buzz events in batches.
+
+    Buzzes are ranked in memory and broadcast straight away; the rows are
+    written with ``bulk_create`` when the batch fills up, when the flush
+    interval elapses, when a round ends and when the process shuts down.
+    """
+
+    def __init__(self):
+        self._pending: List[BuzzEvent] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'flushes': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'queue_depth': self.queue_depth, **self.counters}
+
+    async def enqueue(self, game_id: int, player_id: int, client_timestamp: int, round_number: int,
+                      corrected_timestamp: Optional[int] = None, time_offset: Optional[int] = None) -> bool:
+        """Queue a buzz for writing. Returns False if it was dropped.
+
+        ``corrected_timestamp`` is the buzz time in server time and
+        ``time_offset`` the client's estimated clock offset; without them
+        the client timestamp and the apparent offset on arrival are stored.
+        """
+        self._ensure_running()
+        if len(self._pending) >= writer_settings['MAX_QUEUE']:
+            if writer_settings['OVERFLOW'] == 'drop':
+                self.counters['dropped'] += 1
+                logger.warning(f"Buzz write queue full, dropping buzz for player {player_id}")
+                return False
+            await self.flush()
+
+        server_timestamp = int(timezone.now().timestamp() * 1000)
+        self._pending.append(BuzzEvent(
+            game_session_id=game_id,
+            player_id=player_id,
+            client_timestamp=client_timestamp,
+            server_timestamp=server_timestamp,
+            time_offset=server_timestamp - client_timestamp if time_offset is None else time_offset,
+            corrected_timestamp=client_timestamp if corrected_timestamp is None else corrected_timestamp,
+            round_number=round_number
+        ))
+        self.counters['enqueued'] += 1
+        self.counters['max_queue_depth'] = max(self.counters['max_queue_depth'], len(self._pending))
+        if len(self._pending) == 1 or len(self._pending) >= writer_settings['BATCH_SIZE']:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> int:
+        """Write every pending buzz now. Returns the number of rows written."""
+        self._ensure_running()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            return await database_write(self._write)(batch)
+
+    def flush_sync(self) -> int:
+        """Write pending buzzes from synchronous code (used at shutdown)."""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        return self._write(batch)
+
+    def _write(self, batch: List[BuzzEvent]) -> int:
+        started = time.perf_counter()
+        try:
+            BuzzEvent.objects.bulk_create(batch)
+        except Exception as e:
+            self.counters['failed'] += len(batch)
+            logger.error(f"Error writing {len(batch)} buzz events: {str(e)}")
+            return 0
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.counters['written'] += len(batch)
+        self.counters['flushes'] += 1
+        self.counters['last_flush_ms'] = elapsed_ms
+        self.counters['max_flush_ms'] = max(self.counters['max_flush_ms'], elapsed_ms)
+        self.counters['total_flush_ms'] += elapsed_ms
+        logger.debug(f"Flushed {len(batch)} buzz events in {elapsed_ms:.1f}ms")
+        return len(batch)
+
+    def _ensure_running(self) -> None:
+        """Start the background flusher on the current event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Sleep until the first buzz arrives, then give the batch up to
+            # the flush interval to fill
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            deadline = loop.time() + writer_settings['FLUSH_INTERVAL']
+            while 0 < len(self._pending) < writer_settings['BATCH_SIZE']:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+                if len(self._pending) == 1:
+                    # An explicit flush emptied the queue and a new batch
+                    # started, so it gets a full interval too
+                    deadline = loop.time() + writer_settings['FLUSH_INTERVAL']
+            if self._pending:
+                await self.flush()
+
+
+buzz_writer = BuzzWriter()
+atexit.register(buzz_writer.flush_sync)
+
+
+def collect_writer_metrics():
+    stats = buzz_writer.stats()
+    yield 'buzzquiz_buzz_writer_queue_depth', 'gauge', 'Buzz events waiting to be written', stats['queue_depth']
+    yield 'buzzquiz_buzz_writer_written_total', 'counter', 'Buzz events written', stats['written']
+    yield 'buzzquiz_buzz_writer_dropped_total', 'counter', 'Buzz events dropped by a full queue', stats['dropped']
+    yield 'buzzquiz_buzz_writer_failed_total', 'counter', 'Buzz events that failed to write', stats['failed']
+    yield 'buzzquiz_buzz_writer_flush_seconds_total', 'counter', 'Time spent writing buzz batches', \
+        stats['total_flush_ms'] / 1000
+
+
+registry.add_collector(collect_writer_metrics)
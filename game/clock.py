@@ -0,0 +1,139 @@
+"""Per-connection clock offset estimation.
+
+The server probes a client with a reading of its own clock and the client
+answers with that reading plus its own clock at the time of answering.
+For a probe sent at server time ``s0``, answered with client time ``c``
+and received back at ``s2``:
+
+    rtt = s2 - s0
+    offset = c - (s0 + s2) / 2      (client clock minus server clock)
+
+A sample's error is at most ``rtt / 2``, so, like NTP's clock filter, the
+estimate comes from the minimum-RTT sample in a sliding window, with a
+drift rate fitted across the window's better samples.
+"""
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+
+from .conf import SettingGroup
+
+clock_settings = SettingGroup('GAME_CLOCK_SYNC', {
+    # Samples kept in the sliding window
+    'WINDOW': 8,
+    # Seconds between probes while the estimate is settling ...
+    'MIN_INTERVAL': 1.0,
+    # ... doubling each time a sample agrees with it, up to this
+    'MAX_INTERVAL': 60.0,
+    # Slack in milliseconds, on top of the samples' own error bounds, for a
+    # sample to count as agreeing with the estimate
+    'TOLERANCE_MS': 5.0,
+    # Once this many probes in a row go unanswered, the interval doubles with
+    # each further probe, up to MAX_INTERVAL; 0 never probes
+    'MAX_UNANSWERED': 3,
+    # A corrected buzz time is never later than when the buzz arrived, nor
+    # more than this many milliseconds earlier
+    'MAX_BUZZ_DELAY_MS': 2000,
+})
+
+# Drift beyond this (1000 ppm) is a bad fit rather than a real clock
+MAX_DRIFT = 0.001
+
+
+class ClockSample(NamedTuple):
+    server_time: float  # Midpoint of the probe's round trip, server ms
+    rtt: float
+    offset: float
+
+
+class ClockEstimator:
+    """Estimate one client's clock offset and drift from probe round trips."""
+
+    def __init__(self):
+        self.samples: Deque[ClockSample] = deque(maxlen=clock_settings['WINDOW'])
+        self.interval = clock_settings['MIN_INTERVAL']
+        self.drift = 0.0
+        self.unanswered = 0
+        # Probes in flight: the server time sent to the client -> exact send time
+        self.outstanding: Dict[int, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.samples)
+
+    @property
+    def best(self) -> Optional[ClockSample]:
+        return min(self.samples, key=lambda sample: sample.rtt) if self.samples else None
+
+    def probe_sent(self, sent_at: float) -> int:
+        """Record a probe sent at ``sent_at`` (server ms); returns the time to put in it."""
+        stamp = int(sent_at)
+        self.outstanding[stamp] = sent_at
+        while len(self.outstanding) > clock_settings['MAX_UNANSWERED'] + 1:
+            self.outstanding.pop(next(iter(self.outstanding)))
+        self.unanswered += 1
+        # Back off from clients that stopped answering (older pages, or a
+        # stalled connection) until they answer again
+        if self.unanswered >= clock_settings['MAX_UNANSWERED']:
+            self.interval = min(self.interval * 2, clock_settings['MAX_INTERVAL'])
+        return stamp
+
+    def reply_received(self, stamp: int, client_time: float, received_at: float) -> Optional[ClockSample]:
+        """Add the sample from a probe reply, ignoring replies to unknown probes."""
+        sent_at = self.outstanding.pop(stamp, None)
+        if sent_at is None or received_at < sent_at:
+            return None
+        self.unanswered = 0
+        return self.add_sample(sent_at, received_at, client_time)
+
+    def add_sample(self, sent_at: float, received_at: float, client_time: float) -> ClockSample:
+        midpoint = (sent_at + received_at) / 2
+        sample = ClockSample(midpoint, received_at - sent_at, client_time - midpoint)
+        best = self.best
+        agrees = best is not None and abs(sample.offset - self.offset_at(midpoint)) <= (
+            sample.rtt / 2 + best.rtt / 2 + clock_settings['TOLERANCE_MS']
+        )
+        self.samples.append(sample)
+        self.drift = self._fit_drift()
+
+        # Probe less often while samples keep confirming the estimate
+        if agrees:
+            self.interval = min(self.interval * 2, clock_settings['MAX_INTERVAL'])
+        else:
+            self.interval = clock_settings['MIN_INTERVAL']
+        return sample
+
+    def _fit_drift(self) -> float:
+        """Least-squares slope of offset over time across the lower-RTT half of the window."""
+        if len(self.samples) < 4:
+            return 0.0
+        ranked = sorted(self.samples, key=lambda sample: sample.rtt)[:max(2, len(self.samples) // 2)]
+        mean_t = sum(s.server_time for s in ranked) / len(ranked)
+        mean_o = sum(s.offset for s in ranked) / len(ranked)
+        variance = sum((s.server_time - mean_t) ** 2 for s in ranked)
+        if variance <= 0:
+            return 0.0
+        slope = sum((s.server_time - mean_t) * (s.offset - mean_o) for s in ranked) / variance
+        return max(-MAX_DRIFT, min(MAX_DRIFT, slope))
+
+    def offset_at(self, server_time: float) -> float:
+        """Estimated client-minus-server offset at a server time."""
+        best = self.best
+        if best is None:
+            return 0.0
+        return best.offset + self.drift * (server_time - best.server_time)
+
+    def correct(self, client_timestamp: int, received_at: int) -> Tuple[int, Optional[int]]:
+        """Convert a client timestamp to server time.
+
+        Returns the corrected timestamp and the offset applied, or None
+        when there is no estimate yet and the client's own timestamp is
+        used. Either way the result is clamped to a plausible window
+        before the moment the server received it.
+        """
+        offset = None
+        corrected = client_timestamp
+        if self.ready:
+            offset = round(self.offset_at(received_at))
+            corrected = client_timestamp - offset
+        earliest = received_at - clock_settings['MAX_BUZZ_DELAY_MS']
+        return max(earliest, min(corrected, received_at)), offset
@@ -0,0 +1,19 @@
+"""Game settings that are dicts of options, such as ``GAME_CLOCK_SYNC``.
+
+Each module declares its group once, with the defaults, and reads options
+through it. ``settings.py`` only needs to name the options it changes.
+"""
+from typing import Any, Dict
+
+from django.conf import settings
+
+
+class SettingGroup:
+    """A dict-valued setting whose missing options fall back to ``defaults``."""
+
+    def __init__(self, name: str, defaults: Dict[str, Any]):
+        self.name = name
+        self.defaults = defaults
+
+    def __getitem__(self, option: str) -> Any:
+        return getattr(settings, self.name, {}).get(option, self.defaults[option])
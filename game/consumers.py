@@ -1,68 +1,109 @@
+import asyncio
 import json
 import logging
+import time
 from typing import Dict, Any, List, Optional
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.consumer import get_handler_name
+from django.db.models import F
 from django.utils import timezone
 from .models import GameSession, Player, BuzzEvent
+from .admission import join_admission
+from .broadcast import broadcast_coalescer
+from . import wire
+from .clock import ClockEstimator, clock_settings
+from .encoding import dumps, format_subscribed, format_unsubscribed, loads
+from .logutils import frame_recorder
+from .ratelimit import TokenBucket
+from .roles import (HOST, PLAYER, SPECTATOR, leaderboard_frame, player_buzz_order, rank_in_order,
+                    role_from_scope, role_group, role_messages)
+from .db_executor import async_orm_enabled, database_write
+from .metrics import BUZZES_REJECTED, CONNECTIONS, FRAMES_RATE_LIMITED, HANDLER_SECONDS, game_connected, game_disconnected
+from .buzz_writer import buzz_writer
+from .spectators import spectator_ticker
+from .state_cache import GameState, fetch_game_state, game_state_cache
+from .store import get_game_store
 
 # Set up logging
 logger = logging.getLogger('django.channels')
 
+# Connection and join logs are sampled like message logs (see game/logutils.py)
+CONNECT_LOG = {'message_type': 'connect'}
+JOIN_LOG = {'message_type': 'join_game'}
+
 
 class GameConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for game communication."""
     
+    # Set in connect() when the client negotiates the binary wire protocol
+    binary = False
+    
     async def connect(self):
         """Handle WebSocket connection."""
         try:
             self.game_code = self.scope['url_route']['kwargs']['game_code']
             self.game_group_name = f'game_{self.game_code}'
+            self.role = role_from_scope(self.scope)
+            self.role_group_name = role_group(self.game_group_name, self.role)
+            self.store = get_game_store()
+            self.clock = ClockEstimator()
+            self.clock_task = None
+            self.inbound = TokenBucket.from_settings()
+            # Whether the last frame was dropped by the rate limit
+            self.rate_limited = False
+            # Players whose buzz this connection has had accepted, for buzz_round
+            self.buzz_round = None
+            self.buzzed = set()
+            # The player who joined on this connection, and the personal
+            # frames last sent to them, so unchanged ones are skipped
+            self.player_id = None
+            self.sent_buzz_rank = None
+            self.sent_standing = None
+            # The game's primary key, resolved once below; None if the game doesn't exist
+            self.game_id = None
             
-            logger.info(f"WebSocket connection attempt to game {self.game_code}")
+            logger.info(f"WebSocket connection attempt to game {self.game_code}", extra=CONNECT_LOG)
             
-            # Join the game group
-            await self.channel_layer.group_add(
-                self.game_group_name,
-                self.channel_name
-            )
+            # Switch to the binary protocol if offered; known before joining
+            # the group, so group messages are encoded in the form it takes
+            self.binary = wire.is_enabled() and wire.SUBPROTOCOL in self.scope.get('subprotocols', [])
+            
+            # Join the group for this connection's role; spectators get
+            # snapshots from the game's ticker instead
+            if self.role != SPECTATOR:
+                format_subscribed(self.role_group_name, self.binary)
+                self.subscribed = True
+                await self.channel_layer.group_add(
+                    self.role_group_name,
+                    self.channel_name
+                )
+            game_connected(self.game_code)
+            CONNECTIONS.inc()
+            self.counted = True
             
             # Accept the connection
-            await self.accept()
-            logger.info(f"WebSocket connection accepted for game {self.game_code}")
+            await self.accept(subprotocol=wire.SUBPROTOCOL if self.binary else None)
+            logger.info(f"WebSocket connection accepted for game {self.game_code}", extra=CONNECT_LOG)
             
-            # Send game state to the new connection
-            game_session = await self.get_game_session()
-            if game_session:
-                # First get player list
-                players = await self.get_players()
-                
-                # Send state directly to this connection
-                await self.send(text_data=json.dumps({
-                    'type': 'game_state',
-                    'game': game_session,
-                    'players': players,
-                    'current_round': game_session['current_round']
-                }))
-                
-                # Also send player list separately to ensure it's properly processed
-                await self.send(text_data=json.dumps({
-                    'type': 'player_list',
-                    'players': players
-                }))
-                
-                logger.info(f"Game state sent to new connection {self.channel_name} for game {self.game_code}")
-                
-                # Broadcast to all clients that a new client has connected (for debugging)
-                if len(players) > 0:
-                    logger.info(f"Broadcasting player list with {len(players)} players to all clients")
-                    await self.channel_layer.group_send(
-                        self.game_group_name,
-                        {
-                            'type': 'player_list_message',
-                            'players': players
-                        }
-                    )
+            # Bring the new connection up to date: a reconnecting client gets
+            # the patches it missed, anyone else the full game state
+            state = await self.get_game_state()
+            if state:
+                self.game_id = state.game['id']
+                missed = self.missed_events(state) if self.role == HOST else None
+                if self.role == SPECTATOR:
+                    await spectator_ticker.add(self.game_code, self)
+                elif missed is None:
+                    await self.send_game_state()
+                    logger.info(f"Game state sent to new connection {self.channel_name} for game {self.game_code}",
+                                extra=CONNECT_LOG)
+                else:
+                    if missed:
+                        await self.send_frame({'type': 'state_patch', 'patches': missed})
+                    logger.info(f"Resumed connection {self.channel_name} for game {self.game_code} "
+                                f"with {len(missed)} missed patches", extra=CONNECT_LOG)
             else:
                 logger.warning(f"Game session not found for code {self.game_code}")
         except Exception as e:
@@ -71,52 +112,115 @@ class GameConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
-        # Leave the game group
-        await self.channel_layer.group_discard(
-            self.game_group_name,
-            self.channel_name
-        )
+        if getattr(self, 'clock_task', None):
+            self.clock_task.cancel()
+        if getattr(self, 'role', None) == SPECTATOR:
+            spectator_ticker.remove(self.game_code, self)
+        if buzz_writer.queue_depth:
+            await buzz_writer.flush()
+        
+        # Leave the role's group
+        if getattr(self, 'role', None) != SPECTATOR:
+            await self.channel_layer.group_discard(
+                self.role_group_name,
+                self.channel_name
+            )
+        if getattr(self, 'subscribed', False):
+            self.subscribed = False
+            format_unsubscribed(self.role_group_name, self.binary)
+        if getattr(self, 'counted', False):
+            self.counted = False
+            CONNECTIONS.dec()
+            game_disconnected(self.game_code)
+
+    async def dispatch(self, message):
+        """Call the message's handler without a trip to the shared sync thread.
+
+        Channels closes stale database connections on the shared thread
+        before every handler, which serialises every frame from every game
+        behind that one thread. Calls made through ``database_read`` and
+        ``database_write`` already close stale connections on the thread
+        that runs them, so the trip is only kept for the async ORM, whose
+        queries do use the shared thread's connection.
+        """
+        if async_orm_enabled():
+            return await super().dispatch(message)
+        handler = getattr(self, get_handler_name(message), None)
+        if handler is None:
+            raise ValueError(f"No handler for message type {message['type']}")
+        await handler(message)
+
+    # Message types dispatched by receive(), to the handler method's name
+    HANDLERS = {
+        'buzz': 'handle_buzz',
+        'join_game': 'handle_join_game',
+        'start_round': 'handle_start_round',
+        'end_round': 'handle_end_round',
+        'judge_answer': 'handle_judge_answer',
+        'sync_time': 'handle_sync_time',
+        'clock_reply': 'handle_clock_reply',
+        'ping': 'handle_ping',
+        'get_game_state': 'handle_get_game_state',
+    }
+    # Spectators are read-only
+    SPECTATOR_HANDLERS = {
+        'ping': 'handle_ping',
+        'get_game_state': 'handle_get_game_state',
+    }
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle messages received from WebSocket."""
+        started = time.perf_counter()
+        metric_type = 'invalid'
+        if not self.inbound.take():
+            FRAMES_RATE_LIMITED.inc()
+            if not self.rate_limited:
+                # Tell the client once per stretch of dropped frames, so a
+                # host's start or judge click isn't lost without a word
+                self.rate_limited = True
+                await self.send_frame({
+                    'type': 'error',
+                    'reason': 'rate_limited',
+                    'message': 'Too many messages; some were dropped. Please try again.'
+                })
+            HANDLER_SECONDS.labels('rate_limited').observe(time.perf_counter() - started)
+            return
+        self.rate_limited = False
         try:
-            logger.info(f"Received raw message: {text_data}")
-            data = json.loads(text_data)
+            # Raw frames go to the game's frame buffer rather than the log
+            if bytes_data is not None:
+                data = wire.unpack(bytes_data)
+                frame_recorder.record(self.game_group_name, 'in', data)
+            else:
+                frame_recorder.record(self.game_group_name, 'in', text_data)
+                data = loads(text_data)
             message_type = data.get('type')
             
-            logger.info(f"Processing message of type: {message_type} for game {self.game_code}")
+            logger.debug(f"Processing message of type: {message_type} for game {self.game_code}",
+                         extra={'message_type': message_type})
             
-            if message_type == 'buzz':
-                await self.handle_buzz(data)
-            elif message_type == 'join_game':
-                await self.handle_join_game(data)
-            elif message_type == 'start_round':
-                logger.info(f"Handling start_round message: {data}")
-                await self.handle_start_round(data)
-            elif message_type == 'end_round':
-                await self.handle_end_round(data)
-            elif message_type == 'judge_answer':
-                await self.handle_judge_answer(data)
-            elif message_type == 'sync_time':
-                await self.handle_sync_time(data)
-            elif message_type == 'ping':
-                await self.handle_ping(data)
-            elif message_type == 'get_game_state':
-                await self.handle_get_game_state(data)
+            handlers = self.SPECTATOR_HANDLERS if self.role == SPECTATOR else self.HANDLERS
+            handler = handlers.get(message_type)
+            if handler:
+                metric_type = message_type
+                await getattr(self, handler)(data)
             else:
+                metric_type = 'unknown'
                 logger.warning(f"Unknown message type: {message_type} in game {self.game_code}")
         except json.JSONDecodeError:
             logger.error("JSON decode error in receive")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': 'Invalid JSON format'
-            }))
+            })
         except Exception as e:
             logger.error(f"Error in receive: {str(e)}")
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 'type': 'error',
                 'message': f'Error processing message: {str(e)}'
-            }))
+            })
+        finally:
+            HANDLER_SECONDS.labels(metric_type).observe(time.perf_counter() - started)
     
     async def handle_buzz(self, data):
         """Handle buzz event from player."""
@@ -124,21 +228,72 @@ class GameConsumer(AsyncWebsocketConsumer):
         client_timestamp = data.get('timestamp')
         round_number = data.get('round')
         
-        # Store buzz event
-        await self.store_buzz_event(player_id, client_timestamp, round_number)
+        if not isinstance(client_timestamp, int) or not isinstance(round_number, int):
+            raise ValueError('Invalid buzz timestamp or round')
         
-        # Get ordered buzzes for this round
-        ordered_buzzes = await self.get_ordered_buzzes(round_number)
+        # One buzz per player per round: repeats from this connection are
+        # turned away before anything else is looked up
+        if round_number == self.buzz_round and player_id in self.buzzed:
+            await self.reject_buzz(round_number, 'duplicate')
+            return
         
-        # Broadcast to all clients
-        await self.channel_layer.group_send(
-            self.game_group_name,
-            {
-                'type': 'buzz_order_message',
-                'ordered_buzzes': ordered_buzzes,
-                'round': round_number
-            }
+        state = await self.get_game_state()
+        if not state:
+            return
+        game_id = state.game['id']
+        
+        player = state.get_player(player_id)
+        if player is None:
+            await self.reject_buzz(round_number, 'unknown_player')
+            return
+        if round_number != state.game['current_round']:
+            await self.reject_buzz(round_number, 'wrong_round')
+            return
+        
+        # Rank the buzz by its time on the server's clock; the store turns
+        # away repeats from the player's other connections
+        received_at = int(timezone.now().timestamp() * 1000)
+        corrected_timestamp, time_offset = self.clock.correct(client_timestamp, received_at)
+        ordered_buzzes = await self.store.add_buzz(
+            self.game_code, game_id, round_number, player['id'], player['name'], corrected_timestamp
         )
+        if round_number != self.buzz_round:
+            self.buzz_round = round_number
+            self.buzzed.clear()
+        self.buzzed.add(player_id)
+        if ordered_buzzes is None:
+            await self.reject_buzz(round_number, 'duplicate')
+            return
+        await self.store_buzz_event(game_id, player['id'], client_timestamp, round_number,
+                                    corrected_timestamp, time_offset)
+        
+        # The buzzer hears its own place straight away
+        position = next(i for i, buzz in enumerate(ordered_buzzes) if buzz['player_id'] == player['id'])
+        if self.role == PLAYER:
+            await self.send_buzz_rank(round_number, position + 1)
+        
+        # Broadcast to all clients
+        await self.broadcast({
+            'type': 'buzz_order_message',
+            'ordered_buzzes': ordered_buzzes,
+            'round': round_number
+        })
+        # Buzzes rank by corrected time, so one can land ahead of earlier
+        # arrivals; only then have other players' places changed
+        if position < len(ordered_buzzes) - 1:
+            await broadcast_coalescer.group_send(
+                self.channel_layer, role_group(self.game_group_name, PLAYER),
+                player_buzz_order(ordered_buzzes, round_number)
+            )
+    
+    async def reject_buzz(self, round_number: int, reason: str) -> None:
+        """Tell the sender its buzz was not recorded; nobody else hears about it."""
+        BUZZES_REJECTED.labels(reason).inc()
+        await self.send_frame({
+            'type': 'buzz_rejected',
+            'round': round_number,
+            'reason': reason
+        })
     
     async def handle_join_game(self, data):
         """Handle new player joining the game."""
@@ -149,59 +304,52 @@ class GameConsumer(AsyncWebsocketConsumer):
         # Register player
         player = await self.register_player(player_name, device_id, buzzer_sound)
         
-        if player:
-            # Broadcast updated player list
-            players = await self.get_players()
-            
-            logger.info(f"Broadcasting updated player list with {len(players)} players")
-            # Broadcast to the whole group including the host
-            await self.channel_layer.group_send(
-                self.game_group_name,
-                {
-                    'type': 'player_list_message',
-                    'players': players
-                }
-            )
-            
-            # Also broadcast full game state update to ensure all clients have latest data
-            game = await self.get_game_session()
-            if game:
-                await self.channel_layer.group_send(
-                    self.game_group_name,
-                    {
-                        'type': 'game_state_message',
-                        'game': game,
-                        'players': players,
-                        'current_round': game['current_round']
-                    }
-                )
+        state = await self.get_game_state() if player else None
+        if state:
+            # Broadcast the new or updated player to the whole group including
+            # the host, unless this is a reconnect that changed nothing
+            if state.get_player(player['id']) != player:
+                version = await self.store.next_version(self.game_code)
+                patch = game_state_cache.apply_player(self.game_code, player, version)
+                await self.publish_patch(patch)
             
             # Send confirmation to the player
-            await self.send(text_data=json.dumps({
+            self.player_id = player['id']
+            await self.send_frame({
                 'type': 'join_confirmed',
                 'player_id': player['id'],
-                'game_name': player['game_name'],
+                'game_name': state.game['name'],
                 'actual_name': player['name']  # Send back the actual name that was assigned
-            }))
+            })
+            if self.role == PLAYER:
+                await self.send_standing()
+            
+            # Players buzz, so start estimating their clock offset
+            self.start_clock_sync()
     
     async def handle_start_round(self, data):
         """Handle host starting a new round."""
         is_host = data.get('is_host', False)
         
-        logger.info(f"Received start_round message: {data}, is_host={is_host}")
+        logger.info(f"Received start_round message: {data}, is_host={is_host}",
+                    extra={'message_type': 'start_round'})
         
         if is_host:
             # Increment round
             new_round = await self.start_new_round()
             
             if new_round:
+                version = await self.store.next_version(self.game_code)
+                patch = game_state_cache.set_round(self.game_code, new_round, version)
+                await self.store.start_round(self.game_code, new_round)
+                
                 logger.info(f"Starting round {new_round} for game {self.game_code}")
                 
                 # Important: Send a direct response to confirm receipt to the client that sent the request
-                await self.send(text_data=json.dumps({
+                await self.send_frame({
                     'type': 'start_round_confirmed',
                     'round': new_round
-                }))
+                })
                 
                 # Broadcast round start to all clients
                 message = {
@@ -209,33 +357,16 @@ class GameConsumer(AsyncWebsocketConsumer):
                     'state': 'started',
                     'round': new_round
                 }
-                logger.info(f"Broadcasting message to group {self.game_group_name}: {message}")
-                
-                await self.channel_layer.group_send(
-                    self.game_group_name,
-                    message
-                )
+                await self.broadcast(message)
                 
                 # Also update game state for everyone to ensure synchronization
-                game = await self.get_game_session()
-                players = await self.get_players()
-                
-                if game:
-                    await self.channel_layer.group_send(
-                        self.game_group_name,
-                        {
-                            'type': 'game_state_message',
-                            'game': game,
-                            'players': players,
-                            'current_round': new_round
-                        }
-                    )
+                await self.publish_patch(patch)
             else:
                 logger.error(f"Failed to start round for game {self.game_code}")
-                await self.send(text_data=json.dumps({
+                await self.send_frame({
                     'type': 'error',
                     'message': 'Failed to start round'
-                }))
+                })
         else:
             logger.warning(f"Received start_round message but is_host is False: {data}")
     
@@ -244,19 +375,19 @@ class GameConsumer(AsyncWebsocketConsumer):
         is_host = data.get('is_host', False)
         
         if is_host:
+            # Persist this round's buzzes before anyone reads them back
+            await buzz_writer.flush()
+            
             game_session = await self.get_game_session()
             if game_session:
                 current_round = game_session['current_round']
                 
                 # Broadcast round end
-                await self.channel_layer.group_send(
-                    self.game_group_name,
-                    {
-                        'type': 'round_state_message',
-                        'state': 'ended',
-                        'round': current_round
-                    }
-                )
+                await self.broadcast({
+                    'type': 'round_state_message',
+                    'state': 'ended',
+                    'round': current_round
+                })
     
     async def handle_judge_answer(self, data):
         """Handle host judging an answer."""
@@ -267,316 +398,297 @@ class GameConsumer(AsyncWebsocketConsumer):
             is_correct = data.get('is_correct')
             round_number = data.get('round')
             
-            # Update buzz event
+            # Update buzz event, making sure it has been written first
+            await buzz_writer.flush()
             await self.update_buzz_correctness(player_id, round_number, is_correct)
+            await self.store.set_correctness(self.game_code, round_number, player_id, is_correct)
             
-            # If correct, update player score
+            # If correct, update player score and broadcast the change
             if is_correct:
-                await self.increment_player_score(player_id)
-            
-            # Get updated players for leaderboard
-            players = await self.get_players()
-            
-            # Broadcast updated state
-            await self.channel_layer.group_send(
-                self.game_group_name,
-                {
-                    'type': 'player_list_message',
-                    'players': players
-                }
-            )
+                score = await self.increment_player_score(player_id)
+                if score is not None:
+                    version = await self.store.next_version(self.game_code)
+                    patch = game_state_cache.apply_score(self.game_code, player_id, score, version)
+                    await self.publish_patch(patch)
     
     async def handle_sync_time(self, data):
         """Handle time synchronization request."""
         client_time = data.get('client_time')
         receive_time = int(timezone.now().timestamp() * 1000)
         
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'sync_time_response',
             'client_time': client_time,
             'server_time': receive_time
-        }))
+        })
+    
+    async def handle_clock_reply(self, data):
+        """Handle a client's answer to a clock probe."""
+        stamp = data.get('server_time')
+        client_time = data.get('client_time')
+        if not isinstance(stamp, int) or not isinstance(client_time, (int, float)):
+            raise ValueError('Invalid clock reply')
+        self.clock.reply_received(stamp, client_time, time.time() * 1000)
+    
+    def start_clock_sync(self) -> None:
+        """Start probing this client's clock unless already doing so."""
+        if self.clock_task is None or self.clock_task.done():
+            self.clock_task = asyncio.create_task(self.run_clock_sync())
+    
+    async def run_clock_sync(self) -> None:
+        """Probe the client's clock, less often as the estimate settles.
+
+        Clients that stop answering are probed less and less often, down
+        to once every ``MAX_INTERVAL`` seconds.
+        """
+        if not clock_settings['MAX_UNANSWERED']:
+            return
+        while True:
+            stamp = self.clock.probe_sent(time.time() * 1000)
+            await self.send_frame({
+                'type': 'clock_probe',
+                'server_time': stamp
+            })
+            await asyncio.sleep(self.clock.interval)
     
     async def handle_ping(self, data):
         """Handle ping message (for connection testing)."""
-        logger.info(f"Received ping from client in game {self.game_code}")
+        logger.info(f"Received ping from client in game {self.game_code}", extra={'message_type': 'ping'})
         
         # Send a pong response
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'type': 'pong',
             'timestamp': int(timezone.now().timestamp() * 1000),
             'message': 'Connection is working!'
-        }))
+        })
         
     async def handle_get_game_state(self, data):
         """Handle request for current game state."""
-        logger.info(f"Received get_game_state request from client in game {self.game_code}")
-        
-        # Get current game state
-        game = await self.get_game_session()
-        players = await self.get_players()
+        logger.info(f"Received get_game_state request from client in game {self.game_code}",
+                    extra={'message_type': 'get_game_state'})
         
-        if game:
-            # Send directly to the requesting client
-            await self.send(text_data=json.dumps({
-                'type': 'game_state',
-                'game': game,
-                'players': players,
-                'current_round': game['current_round']
-            }))
-            
-            # Also send a player_list message specifically
-            await self.send(text_data=json.dumps({
-                'type': 'player_list',
-                'players': players
-            }))
-            
-            # For debugging, also broadcast to all clients
-            await self.channel_layer.group_send(
-                self.game_group_name,
-                {
-                    'type': 'player_list_message',
-                    'players': players
-                }
+        # Send the current state directly to the requesting client. Clients
+        # also use this to resync after missing a state patch, so it is not
+        # broadcast to the rest of the group.
+        await self.send_game_state()
+    
+    async def broadcast(self, message: Dict[str, Any]) -> None:
+        """Send a message to every role's group, in each role's shape, through the coalescer."""
+        state = game_state_cache.get(self.game_code)
+        for role, role_message in role_messages(message, state):
+            await broadcast_coalescer.group_send(
+                self.channel_layer, role_group(self.game_group_name, role), role_message
             )
     
+    async def publish_patch(self, patch: Optional[Dict[str, Any]]) -> None:
+        """Broadcast a state patch, or a full snapshot if the game was not cached."""
+        if patch:
+            await self.broadcast({
+                'type': 'state_patch_message',
+                'patches': [patch]
+            })
+            return
+        state = await self.get_game_state()
+        if state:
+            await self.broadcast({
+                'type': 'game_state_message',
+                **state.snapshot()
+            })
+    
     # Channel layer message handlers
     
+    async def send_frame(self, payload: Dict[str, Any]) -> None:
+        """Send a frame to this client in the protocol it negotiated."""
+        if self.binary:
+            await self.send(bytes_data=wire.pack(payload))
+        else:
+            await self.send(text_data=dumps(payload))
+    
+    async def forward(self, event: Dict[str, Any]) -> None:
+        """Forward a group message's pre-encoded frame to this client."""
+        if self.binary and 'bytes' in event:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
+    
     async def buzz_order_message(self, event):
         """Send buzz order to clients."""
-        await self.send(text_data=json.dumps({
-            'type': 'buzz_order',
-            'ordered_buzzes': event['ordered_buzzes'],
-            'round': event['round']
-        }))
-    
-    async def player_list_message(self, event):
-        """Send player list to clients."""
-        await self.send(text_data=json.dumps({
-            'type': 'player_list',
-            'players': event['players']
-        }))
+        await self.forward(event)
     
     async def round_state_message(self, event):
         """Send round state to clients."""
-        logger.info(f"Sending round state: {event['state']} for round {event['round']} to {self.channel_name}")
-        
-        message = {
-            'type': 'round_state',
-            'state': event['state'],
-            'round': event['round']
-        }
-        
-        logger.info(f"Sending message to client: {json.dumps(message)}")
-        
-        await self.send(text_data=json.dumps(message))
+        await self.forward(event)
+    
+    async def state_patch_message(self, event):
+        """Send versioned state patches to clients."""
+        await self.forward(event)
     
     async def game_state_message(self, event):
         """Send game state to clients."""
-        logger.info(f"Sending game state to client {self.channel_name}")
-        await self.send(text_data=json.dumps({
-            'type': 'game_state',
-            'game': event['game'],
-            'players': event['players'],
-            'current_round': event['current_round']
-        }))
+        await self.forward(event)
+    
+    async def leaderboard_message(self, event):
+        """Send the leaderboard top to players and displays, and players their own standing."""
+        await self.forward(event)
+        if self.role == PLAYER:
+            await self.send_standing(event.get('version', 0))
+    
+    async def standing_message(self, event):
+        """Send players their own standing after a change that left the leaderboard top alone."""
+        await self.send_standing(event['version'])
+    
+    async def buzz_rank_message(self, event):
+        """Send a player their own place in the buzz order once it changes."""
+        rank = rank_in_order(event['order'], self.player_id)
+        if rank is not None:
+            await self.send_buzz_rank(event['round'], rank)
+    
+    async def send_buzz_rank(self, round_number: int, rank: int) -> None:
+        """Send this connection's player their place in a round's buzz order, unless it is unchanged."""
+        if (round_number, rank) == self.sent_buzz_rank:
+            return
+        self.sent_buzz_rank = (round_number, rank)
+        await self.send_frame({
+            'type': 'buzz_rank',
+            'round': round_number,
+            'rank': rank,
+            'locked': True
+        })
     
     # Database access methods
     
-    @database_sync_to_async
-    def get_game_session(self) -> Optional[Dict[str, Any]]:
+    async def get_game_state(self) -> Optional[GameState]:
+        """Get the cached game state, loading it from the database on a miss.
+        
+        In multi-node mode the cached state is also reloaded when another
+        node has moved the game to a newer version.
+        """
+        return await fetch_game_state(self.game_code, self.store)
+    
+    async def get_game_session(self) -> Optional[Dict[str, Any]]:
         """Get game session by code."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            return {
-                'id': game.id,
-                'code': game.code,
-                'name': game.name,
-                'is_active': game.is_active,
-                'current_round': game.current_round
-            }
-        except GameSession.DoesNotExist:
-            return None
+        state = await self.get_game_state()
+        return state.game if state else None
     
-    @database_sync_to_async
-    def get_players(self) -> List[Dict[str, Any]]:
+    async def get_players(self) -> List[Dict[str, Any]]:
         """Get all players in the current game."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            return [
-                {
-                    'id': player.id,
-                    'name': player.name,
-                    'score': player.score,
-                    'buzzer_sound': player.buzzer_sound
-                }
-                for player in game.players.all().order_by('-score', 'name')
-            ]
-        except GameSession.DoesNotExist:
-            return []
+        state = await self.get_game_state()
+        return state.players if state else []
     
-    @database_sync_to_async
-    def register_player(self, name, device_id, buzzer_sound) -> Optional[Dict[str, Any]]:
-        """Register a new player or update existing player."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            
-            # Log player registration attempt
-            logger.info(f"Registering player {name} with device_id {device_id} for game {self.game_code}")
-            
-            # Check if player with this device_id already exists
-            existing_player = Player.objects.filter(
-                game_session=game,
-                device_id=device_id
-            ).first()
-            
-            # Check for duplicate names in this game session
-            if not existing_player:
-                original_name = name
-                suffix = 1
-                
-                # Keep checking and incrementing suffix until we find a unique name
-                while Player.objects.filter(game_session=game, name=name).exists():
-                    name = f"{original_name} ({suffix})"
-                    suffix += 1
-                    logger.info(f"Name {original_name} already taken, trying {name}")
-                
-                player = Player.objects.create(
-                    game_session=game,
-                    device_id=device_id,
-                    name=name,
-                    buzzer_sound=buzzer_sound
-                )
-                logger.info(f"Created new player: {name} (ID: {player.id})")
-            else:
-                # Update existing player
-                existing_player.buzzer_sound = buzzer_sound
-                # Only update name if not already taken by someone else
-                if not Player.objects.filter(game_session=game, name=name).exclude(id=existing_player.id).exists():
-                    existing_player.name = name
-                existing_player.save()
-                player = existing_player
-                logger.info(f"Updated existing player: {player.name} (ID: {player.id})")
-            
-            return {
-                'id': player.id,
-                'name': player.name,
-                'game_name': game.name,
-                'buzzer_sound': player.buzzer_sound,
-                'score': player.score
-            }
-        except GameSession.DoesNotExist:
+    async def register_player(self, name, device_id, buzzer_sound) -> Optional[Dict[str, Any]]:
+        """Register a new player or update existing player.
+        
+        Joins go through the game's admission stage, which registers
+        joins that arrive close together in one batch.
+        """
+        if self.game_id is None:
             logger.error(f"Game not found with code {self.game_code} during player registration")
             return None
-        except Exception as e:
-            logger.error(f"Error registering player: {str(e)}")
-            return None
+        
+        logger.info(f"Registering player {name} with device_id {device_id} for game {self.game_code}", extra=JOIN_LOG)
+        return await join_admission.join(self.game_code, self.game_id, name, device_id, buzzer_sound)
     
-    @database_sync_to_async
-    def store_buzz_event(self, player_id, client_timestamp, round_number) -> None:
-        """Store a buzz event in the database."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            player = Player.objects.get(id=player_id, game_session=game)
-            
-            BuzzEvent.objects.create(
-                game_session=game,
-                player=player,
-                client_timestamp=client_timestamp,
-                round_number=round_number
-            )
-        except (GameSession.DoesNotExist, Player.DoesNotExist):
-            pass
+    async def store_buzz_event(self, game_id, player_id, client_timestamp, round_number,
+                               corrected_timestamp=None, time_offset=None) -> None:
+        """Queue a buzz event for a batched write to the database."""
+        await buzz_writer.enqueue(game_id, player_id, client_timestamp, round_number,
+                                  corrected_timestamp, time_offset)
     
-    @database_sync_to_async
-    def get_ordered_buzzes(self, round_number) -> List[Dict[str, Any]]:
+    async def get_ordered_buzzes(self, round_number) -> List[Dict[str, Any]]:
         """Get ordered list of buzzes for a specific round."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            buzz_events = BuzzEvent.objects.filter(
-                game_session=game,
-                round_number=round_number
-            ).order_by('client_timestamp')
-            
-            return [
-                {
-                    'id': buzz.id,
-                    'player_id': buzz.player.id,
-                    'player_name': buzz.player.name,
-                    'timestamp': buzz.client_timestamp,
-                    'is_correct': buzz.is_correct
-                }
-                for buzz in buzz_events
-            ]
-        except GameSession.DoesNotExist:
+        state = await self.get_game_state()
+        if not state:
             return []
+        return await self.store.ordered_buzzes(self.game_code, state.game['id'], round_number)
     
-    @database_sync_to_async
+    @database_write
     def update_buzz_correctness(self, player_id, round_number, is_correct) -> None:
         """Update the correctness of a buzz event."""
-        try:
-            game = GameSession.objects.get(code=self.game_code)
-            player = Player.objects.get(id=player_id)
-            
-            buzz = BuzzEvent.objects.get(
-                game_session=game,
-                player=player,
-                round_number=round_number
-            )
-            
-            buzz.is_correct = is_correct
-            buzz.save()
-        except (GameSession.DoesNotExist, Player.DoesNotExist, BuzzEvent.DoesNotExist):
-            pass
-    
-    @database_sync_to_async
-    def increment_player_score(self, player_id, points=1) -> None:
-        """Increment a player's score."""
-        try:
-            player = Player.objects.get(id=player_id)
-            player.increment_score(points)
-        except Player.DoesNotExist:
-            pass
+        BuzzEvent.objects.filter(
+            game_session_id=self.game_id,
+            player_id=player_id,
+            round_number=round_number
+        ).update(is_correct=is_correct)
+    
+    @database_write
+    def increment_player_score(self, player_id, points=1) -> Optional[int]:
+        """Increment a player's score and return the new score."""
+        players = Player.objects.filter(pk=player_id, game_session_id=self.game_id)
+        if not players.update(score=F('score') + points):
+            return None
+        return players.values_list('score', flat=True).first()
     
-    @database_sync_to_async
-    def start_new_round(self) -> None:
+    @database_write
+    def start_new_round(self) -> Optional[int]:
         """Start a new round in the game."""
         try:
-            game = GameSession.objects.get(code=self.game_code)
-            old_round = game.current_round
+            games = GameSession.objects.filter(pk=self.game_id)
             
             # Start new round
-            game.start_new_round()
+            if not games.update(current_round=F('current_round') + 1):
+                logger.error(f"Game not found with code {self.game_code} when starting new round")
+                return None
             
-            # Confirm the round actually changed
-            game.refresh_from_db()
-            new_round = game.current_round
+            # Read back the round the update produced
+            new_round = games.values_list('current_round', flat=True).first()
             
-            logger.info(f"Round changed from {old_round} to {new_round} for game {self.game_code}")
+            logger.info(f"Round changed to {new_round} for game {self.game_code}")
             
             return new_round
-        except GameSession.DoesNotExist:
-            logger.error(f"Game not found with code {self.game_code} when starting new round")
-            return None
         except Exception as e:
             logger.error(f"Error starting new round: {str(e)}")
             return None
     
+    def missed_events(self, state: GameState) -> Optional[List[Dict[str, Any]]]:
+        """Patches missed by a client reconnecting with ``?since=<version>&epoch=<epoch>``.
+        
+        None means the client needs the full game state: it is new, or what
+        it missed is no longer in the game's event log.
+        """
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            since = int(query['since'][0])
+            epoch = query['epoch'][0]
+        except (KeyError, ValueError):
+            return None
+        return state.events_since(since, epoch)
+    
     async def send_game_state(self) -> None:
-        """Send the current game state to the connected client."""
-        game = await self.get_game_session()
-        players = await self.get_players()
+        """Send the current game state to the connected client, in its role's shape."""
+        state = await self.get_game_state()
         
-        if game:
-            await self.send(text_data=json.dumps({
-                'type': 'game_state',
-                'game': game,
-                'players': players,
-                'current_round': game['current_round']
-            }))
-            
-            # Also send a separate player_list message to ensure player list is updated
-            await self.send(text_data=json.dumps({
-                'type': 'player_list',
-                'players': players
-            }))
\ No newline at end of file
+        if state:
+            if self.role == SPECTATOR:
+                await spectator_ticker.send_latest(self.game_code, self)
+            elif self.role == HOST:
+                await self.send_frame({
+                    'type': 'game_state',
+                    **state.snapshot()
+                })
+            else:
+                await self.send_frame(leaderboard_frame(state))
+                if self.role == PLAYER:
+                    await self.send_standing()
+    
+    async def send_standing(self, version: int = 0) -> None:
+        """Send this connection's player their rank and score, if either changed.
+        
+        Worked out from this process's cached state, reloaded only if it is
+        older than the leaderboard that prompted it.
+        """
+        if self.player_id is None:
+            return
+        state = game_state_cache.get(self.game_code)
+        if state is None or state.version < version:
+            state = await self.get_game_state()
+        player = state.get_player(self.player_id) if state else None
+        if player is None:
+            return
+        standing = (state.leaderboard.rank_of(self.player_id), player['score'])
+        if standing != self.sent_standing:
+            self.sent_standing = standing
+            await self.send_frame({
+                'type': 'standing',
+                'rank': standing[0],
+                'score': standing[1]
+            })
@@ -0,0 +1,154 @@
+"""Thread pools for the real-time path's database calls.
+
+By default ``database_sync_to_async`` runs every call on one shared thread,
+so a slow write in one game delays every read in every other game. Here,
+reads run on a bounded pool of worker threads and writes run on a fixed
+set of single-threaded lanes, with each game always mapped to the same
+lane. Writes to one game therefore stay in order while writes to other
+games proceed in parallel. On SQLite, which only allows one writer, all
+writes go to the single batching writer in ``game/sqlite.py`` instead.
+
+Each worker thread keeps its own database connection, reused between calls
+for up to ``CONN_MAX_AGE`` seconds.
+"""
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from asgiref.sync import SyncToAsync, markcoroutinefunction
+
+from .conf import SettingGroup
+from .metrics import TimedDatabaseSyncToAsync, registry
+from .sqlite import single_writer_enabled, sqlite_writer
+
+db_executor_settings = SettingGroup('GAME_DB_EXECUTOR', {
+    # False runs every call on the single shared thread, as plain
+    # database_sync_to_async does
+    'ENABLED': True,
+    # Worker threads for reads
+    'READ_WORKERS': 4,
+    # Single-threaded write lanes; a game's writes always use the same one
+    'WRITE_LANES': 4,
+})
+
+
+def async_orm_enabled() -> bool:
+    """Whether reads use Django's async ORM instead of the executor.
+
+    Django's async queryset methods still run the query in a thread, the
+    single shared one, so this trades the read pool for fewer layers;
+    ``manage.py benchmark_reads`` compares the two.
+    """
+    return getattr(settings, 'GAME_ASYNC_ORM', False)
+
+
+class DatabaseExecutor:
+    """The read pool and write lanes, created on first use."""
+
+    def __init__(self):
+        self._read_pool: Optional[ThreadPoolExecutor] = None
+        self._write_lanes: List[ThreadPoolExecutor] = []
+
+    @property
+    def read_pool(self) -> ThreadPoolExecutor:
+        if self._read_pool is None:
+            self._read_pool = ThreadPoolExecutor(
+                max_workers=db_executor_settings['READ_WORKERS'], thread_name_prefix='game-db-read'
+            )
+        return self._read_pool
+
+    def write_lane(self, key: Optional[str]) -> ThreadPoolExecutor:
+        """The lane for a game's writes; writes not tied to a game share lane 0."""
+        if not self._write_lanes:
+            self._write_lanes = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'game-db-write-{lane}')
+                for lane in range(db_executor_settings['WRITE_LANES'])
+            ]
+        lane = hash(key) % len(self._write_lanes) if key is not None else 0
+        return self._write_lanes[lane]
+
+    def executor_for(self, write: bool, key: Optional[str] = None) -> Optional[Executor]:
+        """The executor a call should run on, or None for the shared thread."""
+        if not db_executor_settings['ENABLED']:
+            return None
+        if write and single_writer_enabled():
+            return sqlite_writer
+        return self.write_lane(key) if write else self.read_pool
+
+    def queued(self) -> dict:
+        """Calls submitted but not yet started, by pool."""
+        return {
+            'read': self._read_pool._work_queue.qsize() if self._read_pool else 0,
+            'write': sum(lane._work_queue.qsize() for lane in self._write_lanes),
+        }
+
+
+db_executor = DatabaseExecutor()
+
+
+class ExecutorCall(TimedDatabaseSyncToAsync):
+    """A database function that always runs on one executor."""
+
+    def __init__(self, func, executor: Optional[Executor], pool: str):
+        super().__init__(func, thread_sensitive=executor is None, executor=executor)
+        self.pool = pool
+
+    def thread_handler(self, loop, *args, **kwargs):
+        if sqlite_writer.in_batch:
+            # The SQLite writer manages the connection around the whole
+            # batch; closing it here would abort the batch's transaction
+            return SyncToAsync.thread_handler(self, loop, *args, **kwargs)
+        return super().thread_handler(loop, *args, **kwargs)
+
+
+class ExecutorDatabaseSyncToAsync:
+    """Run a database function on the read pool or on its game's write lane.
+
+    A method's game is the ``game_code`` of the object it is bound to. One
+    ``ExecutorCall`` is built per executor the first time it is needed, so
+    concurrent calls never share mutable state.
+    """
+
+    def __init__(self, func, write: bool = False):
+        self.func = func
+        self.write = write
+        self.pool = 'write' if write else 'read'
+        self._calls: Dict[Optional[Executor], ExecutorCall] = {}
+        functools.update_wrapper(self, func)
+        markcoroutinefunction(self)
+
+    def call_for(self, executor: Optional[Executor]) -> ExecutorCall:
+        call = self._calls.get(executor)
+        if call is None:
+            call = self._calls[executor] = ExecutorCall(self.func, executor, self.pool)
+        return call
+
+    async def __call__(self, *args, **kwargs):
+        key = getattr(args[0], 'game_code', None) if args else None
+        executor = db_executor.executor_for(self.write, key)
+        return await self.call_for(executor)(*args, **kwargs)
+
+    def __get__(self, parent, objtype):
+        # Bind methods the way SyncToAsync does
+        return functools.update_wrapper(functools.partial(self.__call__, parent), self.func)
+
+
+def database_read(func):
+    """Decorator for a database call that only reads."""
+    return ExecutorDatabaseSyncToAsync(func)
+
+
+def database_write(func):
+    """Decorator for a database call that writes."""
+    return ExecutorDatabaseSyncToAsync(func, write=True)
+
+
+def collect_executor_metrics():
+    queued = db_executor.queued()
+    yield 'buzzquiz_db_read_queued', 'gauge', 'Database reads waiting for a worker thread', queued['read']
+    yield 'buzzquiz_db_write_queued', 'gauge', 'Database writes waiting for their lane', queued['write']
+
+
+registry.add_collector(collect_executor_metrics)
@@ -0,0 +1,126 @@
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import wire
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _stdlib_dumps(payload: Any) -> str:
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _orjson_dumps(payload: Any) -> str:
+    return orjson.dumps(payload).decode()
+
+
+@lru_cache(maxsize=None)
+def get_encoder() -> Callable[[Any], str]:
+    """Return the JSON encoder used for WebSocket frames.
+
+    ``GAME_JSON_ENCODER`` may be ``'json'``, ``'orjson'`` or a dotted path
+    to a callable returning ``str``. By default orjson is used when it is
+    installed and the standard library otherwise.
+    """
+    name = getattr(settings, 'GAME_JSON_ENCODER', None)
+    if name == 'json' or (name is None and orjson is None):
+        return _stdlib_dumps
+    if name in (None, 'orjson'):
+        return _orjson_dumps
+    return import_string(name)
+
+
+@receiver(setting_changed)
+def reset_encoder(*, setting, **kwargs):
+    if setting == 'GAME_JSON_ENCODER':
+        get_encoder.cache_clear()
+        get_decoder.cache_clear()
+
+
+def dumps(payload: Any) -> str:
+    """Encode a payload as a JSON text frame."""
+    return get_encoder()(payload)
+
+
+@lru_cache(maxsize=None)
+def get_decoder() -> Callable[[str], Any]:
+    """Return the JSON decoder for WebSocket frames, from the library ``GAME_JSON_ENCODER`` picks.
+
+    A dotted-path encoder has no decoder to go with it, so frames are then
+    decoded with the standard library.
+    """
+    name = getattr(settings, 'GAME_JSON_ENCODER', None)
+    if name == 'orjson' or (name is None and orjson is not None):
+        return orjson.loads
+    return json.loads
+
+
+def loads(text: str) -> Any:
+    """Decode a JSON text frame."""
+    return get_decoder()(text)
+
+
+# Connections on this process in each group, as [text, binary] counts
+_group_formats: Dict[str, List[int]] = {}
+
+
+def format_subscribed(group: str, binary: bool) -> None:
+    """Count a connection that joined ``group`` and takes binary or text frames."""
+    _group_formats.setdefault(group, [0, 0])[binary] += 1
+
+
+def format_unsubscribed(group: str, binary: bool) -> None:
+    counts = _group_formats.get(group)
+    if counts is None:
+        return
+    counts[binary] -= 1
+    if counts[0] <= 0 and counts[1] <= 0:
+        del _group_formats[group]
+
+
+def group_formats(group: str) -> Tuple[bool, bool]:
+    """Whether a group's frames need a text and a binary encoding.
+
+    Only this process's connections are known. With the Redis channel
+    layer (``GAME_REDIS_URL``) other nodes may have either kind, so both
+    are needed. Text is kept for a group with no connections here, since
+    it is what the frame recorder stores.
+    """
+    if getattr(settings, 'GAME_REDIS_URL', None):
+        return True, True
+    counts = _group_formats.get(group)
+    if counts is None:
+        return True, False
+    return counts[0] > 0, counts[1] > 0
+
+
+def encode_group_message(message: Dict[str, Any], text: bool = True, binary: bool = True) -> Dict[str, Any]:
+    """Encode a group message's client frame once, before fan-out.
+
+    A handler type ``foo_message`` is delivered to clients as a frame of
+    type ``foo`` carrying the remaining fields. Consumers forward the
+    pre-encoded ``text``, or ``bytes`` for binary protocol clients, as-is
+    instead of re-encoding it per socket. Only the encodings asked for are
+    built; binary clients fall back to ``text`` when there is no ``bytes``.
+    """
+    handler_type = message['type']
+    frame = {'type': handler_type[:-len('_message')]}
+    frame.update((key, value) for key, value in message.items() if key != 'type')
+    encoded = {'type': handler_type}
+    if text:
+        encoded['text'] = dumps(frame)
+    if 'version' in message:
+        # Lets consumers tell whether their cached state is as new as the frame
+        encoded['version'] = message['version']
+    if binary and wire.is_enabled():
+        encoded['bytes'] = wire.pack(frame)
+    return encoded
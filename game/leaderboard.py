@@ -0,0 +1,58 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+
+def rank_key(player: Dict[str, Any]) -> Tuple[int, str, int]:
+    """Leaderboard order, matching ``order_by('-score', 'name')``."""
+    return (-player['score'], player['name'], player['id'])
+
+
+class Leaderboard:
+    """Ranked player list for one game, maintained incrementally.
+
+    Players are kept as sort keys in a ``SortedList``, so a score change
+    or join is a logarithmic insert and remove rather than a re-sort or a
+    shift of the whole list, and rank lookups are a single bisection.
+    """
+
+    def __init__(self, players: Iterable[Dict[str, Any]] = ()):
+        self._players: Dict[int, Dict[str, Any]] = {}
+        for player in players:
+            self._players[player['id']] = player
+        self._keys: SortedList = SortedList(rank_key(player) for player in self._players.values())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, player_id) -> bool:
+        return player_id in self._players
+
+    def get(self, player_id) -> Optional[Dict[str, Any]]:
+        return self._players.get(player_id)
+
+    def upsert(self, player: Dict[str, Any]) -> None:
+        """Insert a player or move an existing one to its new rank."""
+        self.remove(player['id'])
+        self._players[player['id']] = player
+        self._keys.add(rank_key(player))
+
+    def remove(self, player_id) -> None:
+        player = self._players.pop(player_id, None)
+        if player is None:
+            return
+        self._keys.discard(rank_key(player))
+
+    def rank_of(self, player_id) -> Optional[int]:
+        """Return a player's 1-based leaderboard position."""
+        player = self._players.get(player_id)
+        if player is None:
+            return None
+        return self._keys.bisect_left(rank_key(player)) + 1
+
+    def top(self, count: int) -> List[Dict[str, Any]]:
+        """Return the top ``count`` players in rank order."""
+        return [self._players[key[2]] for key in self._keys.islice(0, count)]
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [self._players[key[2]] for key in self._keys]
@@ -0,0 +1,147 @@
+"""Logging for the real-time path that stays off the event loop.
+
+- ``QueueStreamHandler`` hands records to a background thread that does
+  the actual writing, so a burst of log lines never blocks the loop.
+- ``MessageTypeSampler`` samples and rate-limits records tagged with a
+  ``message_type`` (pass ``extra={'message_type': ...}``).
+- ``frame_recorder`` keeps the most recent frames of each game group in
+  memory so they can be dumped on demand instead of always being printed.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# Per message type: fraction of records kept and most records per second.
+# '*' applies to types without an entry of their own.
+DEFAULT_SAMPLING = {
+    'buzz': {'sample': 0.1, 'per_second': 10},
+    'ping': {'sample': 0.1, 'per_second': 5},
+    'connect': {'sample': 1.0, 'per_second': 20},
+    'join_game': {'sample': 1.0, 'per_second': 20},
+    '*': {'sample': 1.0, 'per_second': 50},
+}
+
+
+class QueueStreamHandler(logging.handlers.QueueHandler):
+    """A StreamHandler whose writes happen on a background thread.
+
+    Records are formatted by the caller and put on a bounded queue. When
+    the queue is full the record is dropped and counted rather than
+    making the caller wait.
+    """
+
+    def __init__(self, stream=None, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.target = logging.StreamHandler(stream)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self) -> None:
+        """Write out queued records and stop the background thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+
+class MessageTypeSampler(logging.Filter):
+    """Sample and rate-limit records that carry a ``message_type``.
+
+    Warnings and errors, and records without a message type, always pass.
+    Rates come from ``GAME_LOG_SAMPLING``.
+    """
+
+    def __init__(self, name: str = ''):
+        super().__init__(name)
+        # message type -> [window start, records let through in the window]
+        self.windows: Dict[str, List[float]] = {}
+        self.suppressed = 0
+
+    def get_rule(self, message_type: str) -> Dict[str, float]:
+        sampling = getattr(settings, 'GAME_LOG_SAMPLING', DEFAULT_SAMPLING)
+        return sampling.get(message_type) or sampling.get('*') or DEFAULT_SAMPLING['*']
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message_type = getattr(record, 'message_type', None)
+        if message_type is None or record.levelno >= logging.WARNING:
+            return True
+
+        rule = self.get_rule(message_type)
+        sample = rule.get('sample', 1.0)
+        if sample < 1.0 and random.random() >= sample:
+            self.suppressed += 1
+            return False
+
+        per_second = rule.get('per_second')
+        if per_second is not None:
+            now = time.monotonic()
+            window = self.windows.get(message_type)
+            if window is None or now - window[0] >= 1.0:
+                window = self.windows[message_type] = [now, 0]
+            if window[1] >= per_second:
+                self.suppressed += 1
+                return False
+            window[1] += 1
+        return True
+
+
+class FrameRecorder:
+    """Ring buffer of the most recent frames per game group.
+
+    Only the ``max_groups`` most recently active groups are kept, each
+    with up to ``size`` frames.
+    """
+
+    def __init__(self, size: Optional[int] = None, max_groups: int = 100):
+        self.size = size
+        self.max_groups = max_groups
+        self._frames: 'OrderedDict[str, Deque[Tuple[float, str, Any]]]' = OrderedDict()
+
+    def get_size(self) -> int:
+        if self.size is not None:
+            return self.size
+        return getattr(settings, 'GAME_FRAME_BUFFER_SIZE', 200)
+
+    def record(self, group: str, direction: str, frame: Any) -> None:
+        """Remember a frame; ``direction`` is 'in' or 'out'."""
+        frames = self._frames.get(group)
+        if frames is None:
+            size = self.get_size()
+            if size <= 0:
+                return
+            frames = self._frames[group] = deque(maxlen=size)
+            while len(self._frames) > self.max_groups:
+                self._frames.popitem(last=False)
+        else:
+            self._frames.move_to_end(group)
+        frames.append((time.time(), direction, frame))
+
+    def dump(self, group: str) -> List[Dict[str, Any]]:
+        """Return a group's recent frames, oldest first."""
+        return [
+            {'time': recorded_at, 'direction': direction, 'frame': frame}
+            for recorded_at, direction, frame in self._frames.get(group, ())
+        ]
+
+    def clear(self) -> None:
+        self._frames.clear()
+
+
+frame_recorder = FrameRecorder()
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from game.buzz_index import aload_round_buzzes, load_round_buzzes
+from game.db_executor import database_read, db_executor_settings
+from game.management.stats import percentile
+from game.metrics import TimedDatabaseSyncToAsync
+from game.models import BuzzEvent, GameSession, Player
+from game.views import generate_game_code
+
+
+class Command(BaseCommand):
+    help = ('Compare the latency of a consumer read through the shared sync thread, the DB '
+            "executor's read pool and Django's async ORM at a fixed request rate")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=int, default=1000, help='Reads started per second')
+        parser.add_argument('--seconds', type=float, default=3.0, help='How long to run each read path')
+        parser.add_argument('--players', type=int, default=20,
+                            help='Players (and buzzes) in the round that is read back')
+
+    def handle(self, *args, **options):
+        if options['rate'] < 1 or options['seconds'] <= 0 or options['players'] < 1:
+            raise CommandError('--rate, --seconds and --players must be positive')
+
+        with transaction.atomic():
+            game = GameSession.objects.create(code=generate_game_code(), name='Read benchmark')
+            players = Player.objects.bulk_create([
+                Player(game_session=game, name=f'Player {i}', device_id=f'bench-read-{i}')
+                for i in range(options['players'])
+            ])
+            now = int(time.time() * 1000)
+            BuzzEvent.objects.bulk_create([
+                BuzzEvent(game_session=game, player=player, round_number=1, client_timestamp=now + i,
+                          server_timestamp=now + i, corrected_timestamp=now + i)
+                for i, player in enumerate(players)
+            ])
+
+        # The same query, the one that rebuilds a round's buzz order, down each path
+        shared_thread = TimedDatabaseSyncToAsync(load_round_buzzes)
+        read_pool = database_read(load_round_buzzes)
+        paths: Dict[str, Callable[[], Awaitable[Any]]] = {
+            'shared thread': lambda: shared_thread(game.id, 1),
+            'read pool': lambda: read_pool(game.id, 1),
+            'async ORM': lambda: aload_round_buzzes(game.id, 1),
+        }
+        if not db_executor_settings['ENABLED']:
+            self.stdout.write(self.style.WARNING('GAME_DB_EXECUTOR is disabled, so the read pool path '
+                                                 'uses the shared thread too'))
+
+        try:
+            self.stdout.write(f"{options['rate']} reads/s for {options['seconds']:.1f}s per path")
+            for name, call in paths.items():
+                latencies, rate = async_to_sync(self.run_path)(call, options['rate'], options['seconds'])
+                self.stdout.write(
+                    f"{name:>13}: p50={percentile(latencies, 50):.2f} p95={percentile(latencies, 95):.2f} "
+                    f"p99={percentile(latencies, 99):.2f} max={max(latencies):.2f} ms, "
+                    f"sustained {rate:.0f} reads/s"
+                )
+        finally:
+            game.delete()
+
+    async def run_path(self, call: Callable[[], Awaitable[Any]], rate: int,
+                       seconds: float) -> Tuple[List[float], float]:
+        """Start reads on a fixed schedule and time each from when it was due.
+
+        Timing from the scheduled start rather than the actual one counts
+        the time a read spent waiting behind earlier ones.
+        """
+        loop = asyncio.get_running_loop()
+        for _ in range(10):
+            await call()
+
+        latencies = []
+
+        async def timed(due: float) -> None:
+            await call()
+            latencies.append((loop.time() - due) * 1000)
+
+        tasks = []
+        started = loop.time()
+        for i in range(int(rate * seconds)):
+            due = started + i / rate
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(timed(due)))
+        await asyncio.gather(*tasks)
+        return latencies, len(tasks) / (loop.time() - started)
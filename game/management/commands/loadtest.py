@@ -0,0 +1,383 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from asgiref.sync import async_to_sync
+from channels.routing import get_default_application
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from game import wire
+from game.management.stats import percentile
+from game.models import GameSession
+from game.views import generate_game_code
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class CommunicatorConnection:
+    """In-process connection to the ASGI application through Channels' communicator."""
+
+    def __init__(self, application, path: str, subprotocols: Optional[List[str]] = None):
+        self.communicator = WebsocketCommunicator(application, path, subprotocols=subprotocols)
+
+    async def connect(self) -> None:
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise ConnectionClosed('Connection rejected')
+
+    async def send(self, frame) -> None:
+        if isinstance(frame, bytes):
+            await self.communicator.send_to(bytes_data=frame)
+        else:
+            await self.communicator.send_to(text_data=frame)
+
+    async def recv(self):
+        while True:
+            message = await self.communicator.receive_output(timeout=None)
+            if message['type'] == 'websocket.close':
+                raise ConnectionClosed(message.get('code'))
+            if message['type'] == 'websocket.send':
+                if message.get('text') is not None:
+                    return message['text']
+                return message['bytes']
+
+    async def close(self) -> None:
+        await self.communicator.disconnect()
+
+
+class SocketConnection:
+    """Connection to a running server over a real WebSocket."""
+
+    def __init__(self, url: str, subprotocols: Optional[List[str]] = None):
+        self.url = url
+        self.subprotocols = subprotocols
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.protocol = None
+
+    async def connect(self) -> None:
+        from autobahn.asyncio.websocket import WebSocketClientFactory, WebSocketClientProtocol
+
+        queue = self.queue
+        opened = asyncio.get_running_loop().create_future()
+
+        class Protocol(WebSocketClientProtocol):
+            def onOpen(self):
+                opened.set_result(self)
+
+            def onMessage(self, payload, is_binary):
+                queue.put_nowait(payload if is_binary else payload.decode())
+
+            def onClose(self, was_clean, code, reason):
+                if not opened.done():
+                    opened.set_exception(ConnectionClosed(reason))
+                queue.put_nowait(None)
+
+        parsed = urlparse(self.url)
+        factory = WebSocketClientFactory(self.url, protocols=self.subprotocols)
+        factory.protocol = Protocol
+        port = parsed.port or (443 if parsed.scheme == 'wss' else 80)
+        await asyncio.get_running_loop().create_connection(
+            factory, parsed.hostname, port, ssl=parsed.scheme == 'wss'
+        )
+        self.protocol = await opened
+
+    async def send(self, frame) -> None:
+        if isinstance(frame, bytes):
+            self.protocol.sendMessage(frame, isBinary=True)
+        else:
+            self.protocol.sendMessage(frame.encode())
+
+    async def recv(self):
+        frame = await self.queue.get()
+        if frame is None:
+            raise ConnectionClosed()
+        return frame
+
+    async def close(self) -> None:
+        self.protocol.sendClose()
+
+
+class LoadClient:
+    """A simulated host or player that counts what it receives."""
+
+    def __init__(self, connection, stats: Dict[str, int], binary: bool = False):
+        self.connection = connection
+        self.stats = stats
+        self.binary = binary
+        self.player_id = None
+        self.waiters: List[tuple] = []
+        self.reader = None
+
+    async def start(self) -> None:
+        await self.connection.connect()
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self) -> None:
+        try:
+            while True:
+                frame = await self.connection.recv()
+                self.stats['frames'] += 1
+                self.stats['bytes'] += len(frame)
+                data = wire.unpack(frame) if isinstance(frame, bytes) else json.loads(frame)
+                if data.get('type') == 'clock_probe':
+                    asyncio.ensure_future(self.send({
+                        'type': 'clock_reply',
+                        'server_time': data['server_time'],
+                        'client_time': int(time.time() * 1000)
+                    }))
+                for waiter in list(self.waiters):
+                    predicate, future = waiter
+                    if not future.done() and predicate(data):
+                        future.set_result(data)
+                        self.waiters.remove(waiter)
+        except ConnectionClosed:
+            pass
+
+    def expect(self, predicate: Callable[[Dict[str, Any]], bool]) -> asyncio.Future:
+        """Register interest in a frame before sending whatever triggers it."""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((predicate, future))
+        return future
+
+    async def send(self, payload: Dict[str, Any]) -> None:
+        await self.connection.send(wire.pack(payload) if self.binary else json.dumps(payload))
+
+    async def close(self) -> None:
+        if self.reader:
+            self.reader.cancel()
+        await self.connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Simulate a host and N players against the game server and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=50, help='Number of simulated players')
+        parser.add_argument('--rounds', type=int, default=5, help='Number of start/buzz/judge/end cycles')
+        parser.add_argument('--game', help='Existing game code to use instead of creating one')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. ws://127.0.0.1:8000. '
+                                          'Defaults to driving the ASGI application in-process.')
+        parser.add_argument('--connect-concurrency', type=int, default=50,
+                            help='How many players connect and join at once')
+        parser.add_argument('--buzz-spread', type=int, default=50,
+                            help='Spread buzzes randomly over this many milliseconds')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds to wait for any response')
+        parser.add_argument('--keep', action='store_true', help='Keep the game created for the run')
+        parser.add_argument('--binary', action='store_true',
+                            help='Negotiate the msgpack wire protocol instead of JSON')
+
+    def handle(self, *args, **options):
+        if options['players'] < 1 or options['rounds'] < 1:
+            raise CommandError('--players and --rounds must be at least 1')
+
+        created = None
+        game_code = options['game']
+        if not game_code:
+            game_code = generate_game_code()
+            created = GameSession.objects.create(code=game_code, name='Load test', is_active=True)
+            self.stdout.write(f'Created load test game {game_code}')
+        elif not GameSession.objects.filter(code=game_code).exists():
+            raise CommandError(f'Game {game_code} does not exist')
+
+        queries = {'count': 0}
+        queries_lock = threading.Lock()
+
+        def count_queries(execute, sql, params, many, context):
+            with queries_lock:
+                queries['count'] += 1
+            return execute(sql, params, many, context)
+
+        def count_worker_queries(sender, connection, **kwargs):
+            connection.execute_wrappers.append(count_queries)
+
+        try:
+            # In-process, the consumers' DB calls run on this thread or on
+            # the DB executor's worker threads, whose connections are opened
+            # during the run; both get the counting wrapper
+            connection_created.connect(count_worker_queries)
+            with connection.execute_wrapper(count_queries):
+                results = async_to_sync(self.run_load)(game_code, options)
+        finally:
+            connection_created.disconnect(count_worker_queries)
+            if created and not options['keep']:
+                created.delete()
+
+        self.report(results, queries['count'] if not options['url'] else None)
+
+    async def run_load(self, game_code: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        timeout = options['timeout']
+        stats = {'frames': 0, 'bytes': 0}
+        application = None if options['url'] else get_default_application()
+
+        binary = options['binary']
+        subprotocols = [wire.SUBPROTOCOL] if binary else None
+
+        def new_client(role: str = 'player') -> LoadClient:
+            path = f'/ws/game/{game_code}/?role={role}'
+            if options['url']:
+                connection = SocketConnection(options['url'].rstrip('/') + path, subprotocols)
+            else:
+                connection = CommunicatorConnection(application, path, subprotocols)
+            return LoadClient(connection, stats, binary)
+
+        host = new_client('host')
+        await host.start()
+
+        players = [new_client() for _ in range(options['players'])]
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def join(index: int, player: LoadClient) -> None:
+            async with semaphore:
+                await player.start()
+                confirmed = player.expect(lambda data: data.get('type') == 'join_confirmed')
+                await player.send({
+                    'type': 'join_game',
+                    'name': f'Load {index}',
+                    'device_id': f'loadtest-{game_code}-{index}',
+                    'buzzer_sound': 'default'
+                })
+                player.player_id = (await asyncio.wait_for(confirmed, timeout))['player_id']
+
+        started = time.perf_counter()
+        await asyncio.gather(*(join(i, p) for i, p in enumerate(players)))
+        join_seconds = time.perf_counter() - started
+
+        buzz_latencies: List[float] = []
+        order_latencies: List[float] = []
+        judge_latencies: List[float] = []
+        unranked_buzzes = 0
+        unordered_buzzes = 0
+        run_started = time.perf_counter()
+        frames_before = stats['frames']
+
+        for _ in range(options['rounds']):
+            round_started = [
+                p.expect(lambda data: data.get('type') == 'round_state' and data.get('state') == 'started')
+                for p in players
+            ]
+            confirmed = host.expect(lambda data: data.get('type') == 'start_round_confirmed')
+            await host.send({'type': 'start_round', 'is_host': True})
+            round_number = (await asyncio.wait_for(confirmed, timeout))['round']
+            await asyncio.wait_for(asyncio.gather(*round_started), timeout)
+
+            async def buzz(player: LoadClient) -> Tuple[Optional[float], Optional[float]]:
+                """Buzz, then time the buzzer's buzz_rank and the buzz's arrival in the host's buzz_order."""
+                await asyncio.sleep(random.uniform(0, options['buzz_spread']) / 1000)
+                player_id = player.player_id
+                ranked = player.expect(lambda data: data.get('type') == 'buzz_rank'
+                                       and data.get('round') == round_number)
+                ordered = host.expect(lambda data: data.get('type') == 'buzz_order'
+                                      and data.get('round') == round_number
+                                      and any(b['player_id'] == player_id for b in data['ordered_buzzes']))
+                sent = time.perf_counter()
+                await player.send({
+                    'type': 'buzz',
+                    'player_id': player_id,
+                    'timestamp': int(time.time() * 1000),
+                    'round': round_number
+                })
+                latencies = []
+                for arrival in (ranked, ordered):
+                    try:
+                        await asyncio.wait_for(arrival, timeout)
+                        latencies.append((time.perf_counter() - sent) * 1000)
+                    except asyncio.TimeoutError:
+                        latencies.append(None)
+                return latencies[0], latencies[1]
+
+            for rank_latency, order_latency in await asyncio.gather(*(buzz(p) for p in players)):
+                if rank_latency is None:
+                    unranked_buzzes += 1
+                else:
+                    buzz_latencies.append(rank_latency)
+                if order_latency is None:
+                    unordered_buzzes += 1
+                else:
+                    order_latencies.append(order_latency)
+
+            # Judge the first buzz correct and wait for the score to reach the host
+            winner = players[0].player_id
+            scored = host.expect(lambda data: data.get('type') in ('state_patch', 'game_state'))
+            sent = time.perf_counter()
+            await host.send({
+                'type': 'judge_answer',
+                'is_host': True,
+                'player_id': winner,
+                'is_correct': True,
+                'round': round_number
+            })
+            try:
+                await asyncio.wait_for(scored, timeout)
+                judge_latencies.append((time.perf_counter() - sent) * 1000)
+            except asyncio.TimeoutError:
+                pass
+
+            ended = host.expect(lambda data: data.get('type') == 'round_state' and data.get('state') == 'ended')
+            await host.send({'type': 'end_round', 'is_host': True})
+            await asyncio.wait_for(ended, timeout)
+
+        run_seconds = time.perf_counter() - run_started
+        run_frames = stats['frames'] - frames_before
+
+        for client in [host] + players:
+            await client.close()
+
+        return {
+            'players': len(players),
+            'rounds': options['rounds'],
+            'join_seconds': join_seconds,
+            'run_seconds': run_seconds,
+            'buzz_latencies': buzz_latencies,
+            'order_latencies': order_latencies,
+            'judge_latencies': judge_latencies,
+            'unranked_buzzes': unranked_buzzes,
+            'unordered_buzzes': unordered_buzzes,
+            'frames': stats['frames'],
+            'bytes': stats['bytes'],
+            'messages_per_second': run_frames / run_seconds if run_seconds else 0.0,
+        }
+
+    def report(self, results: Dict[str, Any], query_count: Optional[int]) -> None:
+        buzzes = results['buzz_latencies']
+        orders = results['order_latencies']
+        judges = results['judge_latencies']
+        self.stdout.write('')
+        self.stdout.write(f"Players: {results['players']}  Rounds: {results['rounds']}")
+        self.stdout.write(f"Join phase: {results['join_seconds']:.2f}s")
+        self.stdout.write(
+            f"Buzz -> buzz_rank latency (ms): p50={percentile(buzzes, 50):.1f} "
+            f"p95={percentile(buzzes, 95):.1f} p99={percentile(buzzes, 99):.1f} "
+            f"max={max(buzzes, default=0):.1f} ({len(buzzes)} buzzes)"
+        )
+        self.stdout.write(
+            f"Buzz -> host buzz_order latency (ms): p50={percentile(orders, 50):.1f} "
+            f"p95={percentile(orders, 95):.1f} p99={percentile(orders, 99):.1f} "
+            f"max={max(orders, default=0):.1f} ({len(orders)} buzzes)"
+        )
+        self.stdout.write(
+            f"Judge -> host update latency (ms): p50={percentile(judges, 50):.1f} "
+            f"p95={percentile(judges, 95):.1f}"
+        )
+        self.stdout.write(
+            f"Frames received: {results['frames']} ({results['bytes'] / 1024:.1f} KiB), "
+            f"{results['messages_per_second']:.0f} msg/s during rounds"
+        )
+        if query_count is not None:
+            self.stdout.write(f"DB queries: {query_count}")
+        if results['unranked_buzzes']:
+            self.stdout.write(self.style.WARNING(f"{results['unranked_buzzes']} buzzes got no buzz_rank"))
+        if results['unordered_buzzes']:
+            self.stdout.write(self.style.WARNING(
+                f"{results['unordered_buzzes']} buzzes never showed up in the host's buzz_order"
+            ))
+        if not results['unranked_buzzes'] and not results['unordered_buzzes']:
+            self.stdout.write(self.style.SUCCESS("All buzzes were ranked and reached the host's buzz_order"))
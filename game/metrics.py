@@ -0,0 +1,262 @@
+"""In-process metrics for the real-time path.
+
+Metrics are plain Python numbers updated without locks. Nearly all
+recording happens on the event loop thread, so updates cannot interleave;
+the rare increment from another thread may at worst be lost, which is an
+acceptable trade for keeping the hot path to a few attribute updates.
+``MetricsView`` renders the registry in the Prometheus text format.
+"""
+import bisect
+import contextvars
+import functools
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from channels.db import DatabaseSyncToAsync
+
+# Seconds; fine-grained at the low end where most handlers should land
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Value:
+    """A single counter or gauge sample."""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    """Bucketed observations; ``counts`` is per bucket, not cumulative."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A named metric with one child value per combination of label values."""
+
+    def __init__(self, name: str, help_text: str, kind: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values) -> object:
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            new = HistogramValue(self.buckets) if self.kind == 'histogram' else Value()
+            # setdefault keeps the first child if two threads race here
+            child = self.children.setdefault(key, new)
+        return child
+
+    def remove(self, *values) -> None:
+        self.children.pop(tuple(str(value) for value in values), None)
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Holds metrics and renders them for scraping.
+
+    Collectors are callables run at scrape time that yield
+    ``(name, kind, help, value)`` tuples, for figures that are cheaper to
+    read on demand than to maintain on the hot path.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self.register(Metric(name, help_text, 'counter', labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self.register(Metric(name, help_text, 'gauge', labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        return self.register(Metric(name, help_text, 'histogram', labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, float]]]) -> None:
+        self.collectors.append(collector)
+
+    def expose(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for values, child in list(metric.children.items()):
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (math.inf,), list(child.counts)):
+                        cumulative += count
+                        labels = format_labels(metric.labelnames, values, ('le', format_value(float(bound))))
+                        lines.append(f'{metric.name}_bucket{labels} {cumulative}')
+                    labels = format_labels(metric.labelnames, values)
+                    lines.append(f'{metric.name}_sum{labels} {format_value(child.sum)}')
+                    lines.append(f'{metric.name}_count{labels} {child.count}')
+                else:
+                    labels = format_labels(metric.labelnames, values)
+                    lines.append(f'{metric.name}{labels} {format_value(child.value)}')
+        for collector in self.collectors:
+            for name, kind, help_text, value in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram(
+    'buzzquiz_handler_seconds', 'Time spent handling a client message, by message type', ['type']
+)
+CONNECTIONS = registry.gauge(
+    'buzzquiz_connections_active', 'Open WebSocket connections on this process'
+)
+FRAMES_RATE_LIMITED = registry.counter(
+    'buzzquiz_frames_rate_limited_total', 'Inbound frames dropped by the per-connection rate limit'
+)
+BUZZES_REJECTED = registry.counter(
+    'buzzquiz_buzzes_rejected_total', 'Buzzes turned away without being recorded, by reason', ['reason']
+)
+CHANNEL_LAYER_SEND_SECONDS = registry.histogram(
+    'buzzquiz_channel_layer_send_seconds', 'Time spent in channel layer sends', ['method']
+)
+DB_QUEUE_WAIT_SECONDS = registry.histogram(
+    'buzzquiz_db_queue_wait_seconds', 'Time database calls waited for a thread, by pool', ['pool', 'function']
+)
+DB_EXECUTION_SECONDS = registry.histogram(
+    'buzzquiz_db_execution_seconds', 'Time database calls spent running, by pool', ['pool', 'function']
+)
+
+# Open connections per game code on this process. Only aggregates are
+# exposed: a game code is all it takes to join a game or read its state.
+game_connections: Dict[str, int] = {}
+
+
+def game_connected(code: str) -> None:
+    game_connections[code] = game_connections.get(code, 0) + 1
+
+
+def game_disconnected(code: str) -> None:
+    remaining = game_connections.get(code, 0) - 1
+    if remaining > 0:
+        game_connections[code] = remaining
+    else:
+        game_connections.pop(code, None)
+
+
+def collect_game_metrics():
+    sizes = list(game_connections.values())
+    yield 'buzzquiz_games_active', 'gauge', 'Games with open connections on this process', len(sizes)
+    yield 'buzzquiz_game_connections_max', 'gauge', 'Open connections in the largest game on this process', \
+        max(sizes, default=0)
+
+
+registry.add_collector(collect_game_metrics)
+
+# Start and end of the current call's execution, written by the worker thread
+_db_timing: contextvars.ContextVar = contextvars.ContextVar('db_timing')
+
+
+class TimedDatabaseSyncToAsync(DatabaseSyncToAsync):
+    """``database_sync_to_async`` that records queue wait and execution time.
+
+    The wrapped function runs in a copy of the caller's context, so it
+    finds the caller's timing list there and only stores timestamps in it;
+    the histograms are updated back on the event loop.
+    """
+    # Where the call runs: the shared sync thread, unless a subclass says otherwise
+    pool = 'sync'
+
+    def __init__(self, func, *args, **kwargs):
+        @functools.wraps(func)
+        def timed(*call_args, **call_kwargs):
+            timing = _db_timing.get(None)
+            if timing is not None:
+                timing[0] = time.perf_counter()
+            try:
+                return func(*call_args, **call_kwargs)
+            finally:
+                if timing is not None:
+                    timing[1] = time.perf_counter()
+
+        super().__init__(timed, *args, **kwargs)
+        self.name = getattr(func, '__name__', 'unknown')
+
+    async def __call__(self, *args, **kwargs):
+        timing = [0.0, 0.0]
+        _db_timing.set(timing)
+        submitted = time.perf_counter()
+        try:
+            return await super().__call__(*args, **kwargs)
+        finally:
+            started, finished = timing
+            if started:
+                DB_QUEUE_WAIT_SECONDS.labels(self.pool, self.name).observe(started - submitted)
+                DB_EXECUTION_SECONDS.labels(self.pool, self.name).observe(finished - started)
+
+
+database_sync_to_async = TimedDatabaseSyncToAsync
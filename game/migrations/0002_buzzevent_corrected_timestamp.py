@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+def backfill_corrected_timestamp(apps, schema_editor):
+    # Existing buzzes were ordered by client timestamp
+    BuzzEvent = apps.get_model('game', 'BuzzEvent')
+    BuzzEvent.objects.update(corrected_timestamp=models.F('client_timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='buzzevent',
+            options={'ordering': ['corrected_timestamp'], 'verbose_name': 'Buzz Event', 'verbose_name_plural': 'Buzz Events'},
+        ),
+        migrations.AddField(
+            model_name='buzzevent',
+            name='corrected_timestamp',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_corrected_timestamp, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_buzzevent_corrected_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='buzzevent',
+            index=models.Index(fields=['game_session', 'round_number', 'corrected_timestamp'], name='buzz_round_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['game_session', 'device_id'], name='player_game_device_idx'),
+        ),
+    ]
@@ -46,14 +46,18 @@ class Player(models.Model):
         verbose_name = "Player"
         verbose_name_plural = "Players"
         unique_together = [['game_session', 'name']]
+        indexes = [
+            # Rejoining players are looked up by device within a game
+            models.Index(fields=['game_session', 'device_id'], name='player_game_device_idx'),
+        ]
     
     def __str__(self) -> str:
         return f"{self.name} in {self.game_session.code}"
     
     def increment_score(self, points: int = 1) -> None:
-        """Increment the player's score."""
-        self.score += points
-        self.save()
+        """Atomically increment the player's score."""
+        Player.objects.filter(pk=self.pk).update(score=models.F('score') + points)
+        self.refresh_from_db(fields=['score'])
 
 
 class BuzzEvent(models.Model):
@@ -71,11 +75,17 @@ class BuzzEvent(models.Model):
     client_timestamp = models.BigIntegerField()  # Milliseconds since epoch from client
     server_timestamp = models.BigIntegerField(default=0)  # Milliseconds since epoch from server
     time_offset = models.IntegerField(default=0)  # Calculated offset in milliseconds
+    corrected_timestamp = models.BigIntegerField(default=0)  # Client timestamp corrected to server time
     round_number = models.PositiveIntegerField()
     is_correct = models.BooleanField(null=True, blank=True)  # True/False/None (not judged yet)
     
     class Meta:
-        ordering = ['client_timestamp']
+        ordering = ['corrected_timestamp']
+        indexes = [
+            # A round's buzzes are read back in order
+            models.Index(fields=['game_session', 'round_number', 'corrected_timestamp'],
+                         name='buzz_round_order_idx'),
+        ]
         verbose_name = "Buzz Event"
         verbose_name_plural = "Buzz Events"
     
@@ -88,4 +98,6 @@ class BuzzEvent(models.Model):
             self.server_timestamp = int(timezone.now().timestamp() * 1000)
         if not self.time_offset:
             self.time_offset = self.server_timestamp - self.client_timestamp
+        if not self.corrected_timestamp:
+            self.corrected_timestamp = self.client_timestamp
         super().save(*args, **kwargs)
\ No newline at end of file
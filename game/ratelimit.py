@@ -0,0 +1,44 @@
+"""Per-connection limit on inbound WebSocket frames.
+
+Each connection gets a token bucket: a frame takes one token, tokens come
+back at ``RATE`` per second, and at most ``BURST`` are saved up. Frames
+arriving with the bucket empty are dropped before they are decoded, so a
+client flooding the server costs it next to nothing.
+"""
+import time
+
+from .conf import SettingGroup
+
+rate_limit_settings = SettingGroup('GAME_INBOUND_RATE_LIMIT', {
+    # Frames per second a connection may keep sending; 0 disables the limit
+    'RATE': 20,
+    # Frames a connection may send at once after being quiet
+    'BURST': 40,
+})
+
+
+class TokenBucket:
+    """Token bucket for one connection's inbound frames."""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    @classmethod
+    def from_settings(cls) -> 'TokenBucket':
+        return cls(rate_limit_settings['RATE'], rate_limit_settings['BURST'])
+
+    def take(self) -> bool:
+        """Spend a token if one is available."""
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
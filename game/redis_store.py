@@ -0,0 +1,122 @@
+from typing import Dict, Any, List, Optional
+
+from redis import asyncio as aioredis
+
+from .encoding import dumps, loads
+
+# Rank a buzz atomically. A player's first buzz in a round is kept; later
+# ones are ignored. Members sort by client timestamp, then by arrival
+# order on whichever node accepted them, so every node sees one order.
+#
+# KEYS: order zset, player hash, arrival counter
+# ARGV: player id, client timestamp, encoded record, ttl seconds
+# Returns false for a repeat, without reading the round back
+ADD_BUZZ_SCRIPT = """
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[3]) == 0 then
+    return false
+end
+local arrival = redis.call('INCR', KEYS[3])
+redis.call('ZADD', KEYS[1], ARGV[2], string.format('%012d:%s', arrival, ARGV[1]))
+for _, key in ipairs(KEYS) do
+    redis.call('EXPIRE', key, ARGV[4])
+end
+return {redis.call('ZRANGE', KEYS[1], 0, -1), redis.call('HGETALL', KEYS[2])}
+"""
+
+# KEYS: order zset, player hash
+ORDERED_BUZZES_SCRIPT = """
+return {redis.call('ZRANGE', KEYS[1], 0, -1), redis.call('HGETALL', KEYS[2])}
+"""
+
+# Update the judged flag inside a player's record
+# KEYS: player hash
+# ARGV: player id, is_correct as JSON
+SET_CORRECTNESS_SCRIPT = """
+local record = redis.call('HGET', KEYS[1], ARGV[1])
+if record then
+    local decoded = cjson.decode(record)
+    decoded['is_correct'] = cjson.decode(ARGV[2])
+    redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(decoded))
+end
+return 0
+"""
+
+
+class RedisGameStore:
+    """Shared game state in Redis for multi-node deployments.
+
+    State versions are allocated with INCR so patches from every node form
+    one sequence per game, and buzzes are ranked by a server-side script so
+    any node can accept a buzz and all nodes agree on the order.
+    """
+    multi_node = True
+
+    def __init__(self, client: aioredis.Redis, prefix: str = 'buzzquiz', round_ttl: int = 6 * 60 * 60):
+        self.client = client
+        self.prefix = prefix
+        self.round_ttl = round_ttl
+        self._add_buzz = client.register_script(ADD_BUZZ_SCRIPT)
+        self._ordered_buzzes = client.register_script(ORDERED_BUZZES_SCRIPT)
+        self._set_correctness = client.register_script(SET_CORRECTNESS_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RedisGameStore':
+        return cls(aioredis.Redis.from_url(url), **kwargs)
+
+    def version_key(self, code: str) -> str:
+        return f'{self.prefix}:{code}:version'
+
+    def round_keys(self, code: str, round_number: int) -> List[str]:
+        base = f'{self.prefix}:{code}:round:{round_number}'
+        return [f'{base}:order', f'{base}:players', f'{base}:arrival']
+
+    async def next_version(self, code: str) -> Optional[int]:
+        return await self.client.incr(self.version_key(code))
+
+    async def current_version(self, code: str) -> Optional[int]:
+        version = await self.client.get(self.version_key(code))
+        return int(version) if version is not None else 0
+
+    async def start_round(self, code: str, round_number: int) -> None:
+        pass
+
+    async def add_buzz(self, code: str, game_id: int, round_number: int, player_id: int,
+                       player_name: str, timestamp: int) -> Optional[List[Dict[str, Any]]]:
+        """Rank a buzz and return the round's buzz order, or None if the player already buzzed."""
+        record = dumps({'player_name': player_name, 'timestamp': timestamp, 'is_correct': None})
+        result = await self._add_buzz(
+            keys=self.round_keys(code, round_number),
+            args=[player_id, timestamp, record, self.round_ttl]
+        )
+        return self._ordered(result) if result else None
+
+    async def ordered_buzzes(self, code: str, game_id: int, round_number: int) -> List[Dict[str, Any]]:
+        result = await self._ordered_buzzes(keys=self.round_keys(code, round_number)[:2])
+        return self._ordered(result)
+
+    async def set_correctness(self, code: str, round_number: int, player_id: int,
+                              is_correct: Optional[bool]) -> None:
+        await self._set_correctness(
+            keys=self.round_keys(code, round_number)[1:2],
+            args=[player_id, dumps(is_correct)]
+        )
+
+    @staticmethod
+    def _ordered(result) -> List[Dict[str, Any]]:
+        members, flat_records = result
+        records = {
+            flat_records[i].decode(): loads(flat_records[i + 1])
+            for i in range(0, len(flat_records), 2)
+        }
+        ordered = []
+        for member in members:
+            arrival, player_id = member.decode().split(':', 1)
+            record = records[player_id]
+            ordered.append({
+                'id': int(arrival),
+                'player_id': int(player_id),
+                'player_name': record['player_name'],
+                'timestamp': record['timestamp'],
+                'is_correct': record['is_correct']
+            })
+        return ordered
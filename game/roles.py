@@ -0,0 +1,147 @@
+"""Connection roles and what each one is sent.
+
+Every connection joins the group for its role instead of one group for
+the whole game, and each broadcast is reshaped per role:
+
+- the host gets everything, as before: full buzz order, state patches and
+  game state snapshots;
+- the display (a projector) gets the visual state: the leaderboard top,
+  the buzz order without timestamps and the round state;
+- players, who make up most connections, get the leaderboard top and
+  round state, plus their own standing and place in the buzz order,
+  which each player's consumer works out and only sends on a change.
+  A buzzer hears its place straight from its own consumer; the players'
+  group only gets the order when a buzz lands ahead of earlier ones;
+- spectators get nothing per event: they are sent snapshots at a fixed
+  rate instead (see ``game/spectators.py``).
+
+The leaderboard top is sent whole on connect and afterwards only as the
+entries that changed; clients merge them in and keep the top ``size``.
+
+The role is picked with ``?role=`` on the WebSocket URL; clients that
+don't say get the host's frames, as every client did before roles.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from .state_cache import GameState
+
+HOST = 'host'
+PLAYER = 'player'
+DISPLAY = 'display'
+SPECTATOR = 'spectator'
+ROLES = (HOST, PLAYER, DISPLAY, SPECTATOR)
+
+# Group messages each player's consumer turns into its own frame; the
+# coalescer passes them on without pre-encoding a client frame
+PERSONAL_TYPES = ('buzz_rank_message', 'standing_message')
+
+
+def get_leaderboard_size() -> int:
+    return getattr(settings, 'GAME_LEADERBOARD_SIZE', 10)
+
+
+def role_from_scope(scope: Dict[str, Any]) -> str:
+    role = parse_qs(scope.get('query_string', b'').decode()).get('role', [HOST])[0]
+    return role if role in ROLES else HOST
+
+
+def role_group(game_group: str, role: str) -> str:
+    return f'{game_group}_{role}'
+
+
+def leaderboard_entry(player: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': player['id'], 'name': player['name'], 'score': player['score']}
+
+
+def leaderboard_frame(state: GameState) -> Dict[str, Any]:
+    """The whole leaderboard top, for a client that has none yet."""
+    top = [leaderboard_entry(player) for player in state.leaderboard.top(get_leaderboard_size())]
+    if state.count_sent is None:
+        # Nothing broadcast from this state yet; changes are sent relative to this
+        state.top_sent = {entry['id']: entry for entry in top}
+        state.count_sent = len(state.leaderboard)
+    return {
+        'type': 'leaderboard',
+        'current_round': state.game['current_round'],
+        'player_count': len(state.leaderboard),
+        'size': get_leaderboard_size(),
+        'players': top,
+    }
+
+
+def leaderboard_changes(state: GameState) -> Optional[Dict[str, Any]]:
+    """What changed in the leaderboard top and player count since the last call, if anything."""
+    top = [leaderboard_entry(player) for player in state.leaderboard.top(get_leaderboard_size())]
+    changes: Dict[str, Any] = {}
+    changed = [entry for entry in top if state.top_sent.get(entry['id']) != entry]
+    if changed:
+        changes['players'] = changed
+    state.top_sent = {entry['id']: entry for entry in top}
+    count = len(state.leaderboard)
+    if count != state.count_sent:
+        changes['player_count'] = state.count_sent = count
+    return changes or None
+
+
+def role_messages(message: Dict[str, Any], state: Optional[GameState]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Reshape a host broadcast into the message each role's group gets.
+
+    Roles that have no use for a message are left out.
+    """
+    message_type = message['type']
+    messages = [(HOST, message)]
+    if message_type == 'buzz_order_message':
+        ordered = message['ordered_buzzes']
+        messages.append((DISPLAY, {
+            'type': 'buzz_order_message',
+            'round': message['round'],
+            'ordered_buzzes': [
+                {'player_id': buzz['player_id'], 'player_name': buzz['player_name'], 'is_correct': buzz['is_correct']}
+                for buzz in ordered
+            ]
+        }))
+    elif message_type in ('state_patch_message', 'game_state_message'):
+        # A round change alone doesn't move the leaderboard; round_state covers it
+        if state is None or (message_type == 'state_patch_message' and all(
+                patch['type'] == 'round_changed' for patch in message['patches'])):
+            return messages
+        changes = leaderboard_changes(state)
+        if changes:
+            leaderboard = {'type': 'leaderboard_message', 'version': state.version, **changes}
+            messages.append((DISPLAY, leaderboard))
+            messages.append((PLAYER, leaderboard))
+        else:
+            # The top is unchanged, but players below it may have moved
+            messages.append((PLAYER, {'type': 'standing_message', 'version': state.version}))
+    else:
+        messages.append((DISPLAY, message))
+        messages.append((PLAYER, message))
+    return messages
+
+
+def player_buzz_order(ordered: List[Dict[str, Any]], round_number: int) -> Dict[str, Any]:
+    """The buzz order for players to find their own place in.
+
+    Only sent when a buzz lands ahead of earlier ones; a buzzer is told
+    its own place directly, and an appended buzz moves nobody else.
+    """
+    # Ids as one string: channel layers copy messages per recipient,
+    # and a string is copied for free
+    return {
+        'type': 'buzz_rank_message',
+        'round': round_number,
+        'order': ','.join(str(buzz['player_id']) for buzz in ordered)
+    }
+
+
+def rank_in_order(order: str, player_id: Optional[int]) -> Optional[int]:
+    """A player's 1-based position in a ``buzz_rank_message`` order, if present."""
+    if player_id is None or not order:
+        return None
+    try:
+        return order.split(',').index(str(player_id)) + 1
+    except ValueError:
+        return None
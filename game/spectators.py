@@ -0,0 +1,152 @@
+"""Tick-based snapshots for spectators.
+
+A pub-quiz audience can run to hundreds of read-only screens per game.
+Sending them every event the way players get them makes the cost grow
+with event rate times audience size. Spectators (``?role=spectator``)
+instead join no channel group at all: while a game has spectators in
+this process, a ticker for it runs at ``RATE`` ticks per second and
+
+- builds the game's spectator snapshot (leaderboard top, player count,
+  round and buzz order) from the cached state and the game store;
+- skips the tick if the snapshot is the same as the last one published;
+- otherwise encodes it once, as text and/or binary depending on what
+  its spectators take, and sends that one frame to every spectator.
+
+Spectators therefore cost a few encodes per second per game, however
+busy the game is, and see changes at most one tick late.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from .conf import SettingGroup
+from .encoding import encode_group_message
+from .logutils import frame_recorder
+from .metrics import registry
+from .roles import SPECTATOR, get_leaderboard_size, leaderboard_entry, role_group
+from .state_cache import fetch_game_state
+from .store import get_game_store
+
+logger = logging.getLogger('django.channels')
+
+spectator_settings = SettingGroup('GAME_SPECTATOR_TICKER', {
+    # Snapshots per second a game's spectators may get
+    'RATE': 5,
+})
+
+
+async def spectator_frame(game_code: str) -> Optional[Dict[str, Any]]:
+    """A game's current spectator snapshot, or None if the game doesn't exist."""
+    state = await fetch_game_state(game_code, get_game_store())
+    if state is None:
+        return None
+    current_round = state.game['current_round']
+    ordered = await get_game_store().ordered_buzzes(game_code, state.game['id'], current_round)
+    return {
+        'type': 'spectator',
+        'version': state.version,
+        'current_round': current_round,
+        'player_count': len(state.leaderboard),
+        'players': [leaderboard_entry(player) for player in state.leaderboard.top(get_leaderboard_size())],
+        'ordered_buzzes': [
+            {'player_id': buzz['player_id'], 'player_name': buzz['player_name'], 'is_correct': buzz['is_correct']}
+            for buzz in ordered
+        ]
+    }
+
+
+class SpectatorFeed:
+    """One game's spectators in this process and the last snapshot they were sent."""
+    __slots__ = ('game_code', 'spectators', 'frame', 'encoded', 'task')
+
+    def __init__(self, game_code: str):
+        self.game_code = game_code
+        self.spectators: Set[Any] = set()
+        self.frame: Optional[Dict[str, Any]] = None
+        self.encoded: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class SpectatorTicker:
+    """Publish each game's spectator snapshot at a fixed rate while it has spectators."""
+
+    def __init__(self):
+        self._feeds: Dict[str, SpectatorFeed] = {}
+        self.counters = {'published': 0, 'skipped': 0}
+
+    def __len__(self) -> int:
+        return sum(len(feed.spectators) for feed in self._feeds.values())
+
+    async def add(self, game_code: str, consumer) -> None:
+        """Start sending a game's snapshots to a spectator's consumer."""
+        feed = self._feeds.get(game_code)
+        if feed is None:
+            feed = self._feeds[game_code] = SpectatorFeed(game_code)
+        feed.spectators.add(consumer)
+        if feed.task is None or feed.task.done():
+            feed.task = asyncio.get_running_loop().create_task(self._run(feed))
+        await self.send_latest(game_code, consumer)
+
+    def remove(self, game_code: str, consumer) -> None:
+        """Stop sending to a spectator; the game's ticker stops with its last spectator."""
+        feed = self._feeds.get(game_code)
+        if feed is None:
+            return
+        feed.spectators.discard(consumer)
+        if not feed.spectators:
+            del self._feeds[game_code]
+            if feed.task is not None:
+                feed.task.cancel()
+
+    async def send_latest(self, game_code: str, consumer) -> None:
+        """Send a spectator the last published snapshot, if there is one yet."""
+        feed = self._feeds.get(game_code)
+        if feed is None or feed.encoded is None:
+            return
+        if ('bytes' if consumer.binary else 'text') not in feed.encoded:
+            # The first spectator here to take this kind of frame
+            feed.encoded = encode_group_message({**feed.frame, 'type': 'spectator_message'})
+        await consumer.forward(feed.encoded)
+
+    async def tick(self, feed: SpectatorFeed) -> None:
+        """Publish a game's snapshot to its spectators unless nothing changed."""
+        frame = await spectator_frame(feed.game_code)
+        if frame is None or frame == feed.frame:
+            self.counters['skipped'] += 1
+            return
+        feed.frame = frame
+        # Encoded only in the forms this game's spectators take
+        binary = {consumer.binary for consumer in feed.spectators}
+        feed.encoded = encode_group_message({**frame, 'type': 'spectator_message'},
+                                            text=binary != {True}, binary=True in binary)
+        frame_recorder.record(role_group(f'game_{feed.game_code}', SPECTATOR), 'out',
+                              feed.encoded.get('text', frame))
+        self.counters['published'] += 1
+        for consumer in list(feed.spectators):
+            await consumer.forward(feed.encoded)
+
+    async def _run(self, feed: SpectatorFeed) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while feed.spectators:
+            try:
+                await self.tick(feed)
+            except Exception as e:
+                logger.error(f"Error publishing spectator snapshot for game {feed.game_code}: {str(e)}")
+            # Keep to the rate however long the tick took, without catching up on missed ticks
+            next_tick = max(next_tick + 1 / spectator_settings['RATE'], loop.time())
+            await asyncio.sleep(next_tick - loop.time())
+
+
+spectator_ticker = SpectatorTicker()
+
+
+def collect_spectator_metrics():
+    yield 'buzzquiz_spectators', 'gauge', 'Spectator connections', len(spectator_ticker)
+    yield 'buzzquiz_spectator_snapshots_total', 'counter', 'Spectator snapshots published', \
+        spectator_ticker.counters['published']
+    yield 'buzzquiz_spectator_ticks_skipped_total', 'counter', 'Spectator ticks with nothing new to publish', \
+        spectator_ticker.counters['skipped']
+
+
+registry.add_collector(collect_spectator_metrics)
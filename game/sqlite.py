@@ -0,0 +1,149 @@
+"""High-throughput profile for running the game on SQLite.
+
+SQLite allows one writer at a time. With the default rollback journal,
+writers also block readers, so concurrent buzz, join and score writes
+stall each other with "database is locked". This profile:
+
+- switches connections to WAL, so reads proceed alongside the writer,
+  and sets ``synchronous=NORMAL``, a busy timeout and a memory-mapped
+  read window on every new connection;
+- sends every real-time write through one writer thread, which runs
+  whatever writes have queued up in a single transaction, each in its
+  own savepoint so a failing write only rolls back itself.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, List, Tuple
+
+from django.db import close_old_connections, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .conf import SettingGroup
+from .metrics import registry
+
+logger = logging.getLogger('django.channels')
+
+sqlite_settings = SettingGroup('GAME_SQLITE_PROFILE', {
+    # Apply the pragmas below to SQLite connections
+    'ENABLED': True,
+    'JOURNAL_MODE': 'WAL',
+    # With WAL, NORMAL only risks the last transactions on power loss, not corruption
+    'SYNCHRONOUS': 'NORMAL',
+    'BUSY_TIMEOUT_MS': 5000,
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    # Run every write from the DB executor on one thread, batched into transactions
+    'SINGLE_WRITER': True,
+    # Most writes run in one transaction
+    'MAX_BATCH': 100,
+})
+
+
+def single_writer_enabled() -> bool:
+    return sqlite_settings['SINGLE_WRITER'] and connections['default'].vendor == 'sqlite'
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs) -> None:
+    """Apply the profile's pragmas to a new SQLite connection."""
+    if connection.vendor != 'sqlite' or not sqlite_settings['ENABLED']:
+        return
+    # On the raw connection, so the pragmas don't show up as app queries
+    raw = connection.connection
+    raw.execute(f"PRAGMA journal_mode={sqlite_settings['JOURNAL_MODE']}")
+    raw.execute(f"PRAGMA synchronous={sqlite_settings['SYNCHRONOUS']}")
+    raw.execute(f"PRAGMA busy_timeout={int(sqlite_settings['BUSY_TIMEOUT_MS'])}")
+    raw.execute(f"PRAGMA mmap_size={int(sqlite_settings['MMAP_SIZE'])}")
+
+
+Job = Tuple[Future, Callable, tuple, dict]
+
+
+class SingleWriter(Executor):
+    """Executor running every submitted write on one thread, in batched transactions.
+
+    Results are only handed back once the batch has committed; if the
+    commit fails, every write in the batch fails with its error.
+    """
+
+    def __init__(self):
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {'writes': 0, 'batches': 0, 'failed_batches': 0}
+
+    @property
+    def in_batch(self) -> bool:
+        """Whether the calling thread is running a write inside a batch."""
+        return getattr(self._local, 'in_batch', False)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='game-db-writer', daemon=True)
+                    self._thread.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < sqlite_settings['MAX_BATCH']:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            jobs = [job for job in jobs if job[0].set_running_or_notify_cancel()]
+            if jobs:
+                self._run_batch(jobs)
+
+    def _run_batch(self, jobs: List[Job]) -> None:
+        outcomes: List[Tuple[bool, Any]] = []
+        close_old_connections()
+        self._local.in_batch = True
+        try:
+            with transaction.atomic():
+                for _, fn, args, kwargs in jobs:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((True, fn(*args, **kwargs)))
+                    except Exception as e:
+                        outcomes.append((False, e))
+        except Exception as e:
+            self.counters['failed_batches'] += 1
+            logger.error(f"Error committing a batch of {len(jobs)} writes: {str(e)}")
+            outcomes = [(False, e)] * len(jobs)
+        finally:
+            self._local.in_batch = False
+            close_old_connections()
+
+        self.counters['batches'] += 1
+        self.counters['writes'] += len(jobs)
+        for (future, *_), (ok, value) in zip(jobs, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+sqlite_writer = SingleWriter()
+
+
+def collect_writer_metrics():
+    yield 'buzzquiz_sqlite_writer_queued', 'gauge', 'Writes waiting for the SQLite writer', sqlite_writer.queue_depth
+    yield 'buzzquiz_sqlite_writer_writes_total', 'counter', 'Writes run by the SQLite writer', \
+        sqlite_writer.counters['writes']
+    yield 'buzzquiz_sqlite_writer_batches_total', 'counter', 'Write batches run by the SQLite writer', \
+        sqlite_writer.counters['batches']
+
+
+registry.add_collector(collect_writer_metrics)
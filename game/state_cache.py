@@ -0,0 +1,331 @@
+import asyncio
+import gzip
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+from django.conf import settings
+
+from .buzz_index import buzz_index
+from .db_executor import async_orm_enabled, database_read
+from .encoding import dumps
+from .leaderboard import Leaderboard
+from .models import GameSession
+
+
+def serialize_game(game: GameSession) -> Dict[str, Any]:
+    """Serialize a game session the way it is sent to clients."""
+    return {
+        'id': game.id,
+        'code': game.code,
+        'name': game.name,
+        'is_active': game.is_active,
+        'current_round': game.current_round
+    }
+
+
+def serialize_player(player) -> Dict[str, Any]:
+    """Serialize a player the way it is sent to clients."""
+    return {
+        'id': player.id,
+        'name': player.name,
+        'score': player.score,
+        'buzzer_sound': player.buzzer_sound
+    }
+
+
+class GameState:
+    """Cached game session and its ranked leaderboard.
+
+    Published objects are never mutated: a change replaces ``game`` or the
+    changed player's dict, and ``players`` is rebuilt from the leaderboard
+    only when someone asks for a full list after a change. Writers publish
+    the data before the new version, so a reader that takes ``version``
+    first never labels old data with a newer version.
+    """
+    __slots__ = ('code', 'game', 'leaderboard', 'version', 'epoch', 'log', 'top_sent', 'count_sent',
+                 'last_access', '_players', '_encoded')
+
+    def __init__(self, code: str, game: Dict[str, Any], players: List[Dict[str, Any]], version: int,
+                 epoch: str = '', log_size: int = 0):
+        self.code = code
+        self.game = game
+        self.leaderboard = Leaderboard(players)
+        self.version = version
+        self.epoch = epoch
+        # The most recent patches, in version order with no gaps
+        self.log: Deque[Dict[str, Any]] = deque(maxlen=log_size)
+        # The leaderboard top and player count as last broadcast to players
+        # and displays, who are only sent what changed (see game/roles.py);
+        # None until known, when the whole top counts as changed
+        self.top_sent: Dict[int, Dict[str, Any]] = {}
+        self.count_sent: Optional[int] = None
+        self.last_access = time.monotonic()
+        self._players = None
+        # [version, JSON snapshot, gzipped JSON snapshot or None] for HTTP polling
+        self._encoded: Optional[List[Any]] = None
+
+    @property
+    def players(self) -> List[Dict[str, Any]]:
+        """Players in leaderboard order."""
+        players = self._players
+        if players is None:
+            players = self._players = self.leaderboard.as_list()
+        return players
+
+    def get_player(self, player_id) -> Optional[Dict[str, Any]]:
+        """Look up a player by id."""
+        return self.leaderboard.get(player_id)
+
+    def update_player(self, player: Dict[str, Any]) -> None:
+        self.leaderboard.upsert(player)
+        self._players = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the full game state tagged with its version."""
+        version = self.version
+        return {
+            'game': self.game,
+            'players': self.players,
+            'current_round': self.game['current_round'],
+            'version': version,
+            'epoch': self.epoch
+        }
+
+    def encoded_snapshot(self, compress: bool = False) -> Tuple[int, bytes]:
+        """The snapshot as JSON, gzipped if ``compress``, and its version.
+
+        Encoded (and compressed) at most once per version.
+        """
+        encoded = self._encoded
+        if encoded is None or encoded[0] != self.version:
+            snapshot = self.snapshot()
+            encoded = self._encoded = [snapshot['version'], dumps(snapshot).encode(), None]
+        if not compress:
+            return encoded[0], encoded[1]
+        if encoded[2] is None:
+            encoded[2] = gzip.compress(encoded[1])
+        return encoded[0], encoded[2]
+
+    def events_since(self, version: int, epoch: str) -> Optional[List[Dict[str, Any]]]:
+        """Patches a client at ``version`` of ``epoch`` has missed.
+
+        Returns None when the client can't catch up from the log (the
+        patches it missed have rolled off, or its version comes from
+        another process or a reload) and needs a full snapshot.
+        """
+        if epoch != self.epoch or version > self.version:
+            return None
+        if version == self.version:
+            return []
+        log = list(self.log)
+        if not log or log[0]['version'] > version + 1:
+            return None
+        return [patch for patch in log if patch['version'] > version]
+
+
+class GameStateCache:
+    """Per-process read-through cache of game state keyed by game code."""
+
+    def __init__(self, idle_timeout: Optional[float] = None):
+        self.idle_timeout = idle_timeout
+        self._entries: Dict[str, GameState] = {}
+        self._lock = threading.Lock()
+        # Versions are per game and outlive eviction, so they keep increasing
+        # by one for every change, including a reload from the database.
+        self._versions: Dict[str, int] = {}
+        self._last_sweep = time.monotonic()
+        # Identifies this process's versions: after a restart they start over
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def get_idle_timeout(self) -> float:
+        if self.idle_timeout is not None:
+            return self.idle_timeout
+        return getattr(settings, 'GAME_STATE_CACHE_IDLE_TIMEOUT', 600)
+
+    def get(self, code: str) -> Optional[GameState]:
+        """Return the cached state for a game, or None if it is not loaded."""
+        now = time.monotonic()
+        self._maybe_evict(now)
+        state = self._entries.get(code)
+        if state is not None:
+            state.last_access = now
+        return state
+
+    def load(self, code: str, version: Optional[int] = None) -> Optional[GameState]:
+        """Load a game from the database into the cache (sync, DB thread).
+
+        ``version`` labels the loaded state when versions are allocated
+        outside this process; it must be read before the database is.
+        """
+        try:
+            game = GameSession.objects.get(code=code)
+        except GameSession.DoesNotExist:
+            return None
+        players = [
+            serialize_player(player)
+            for player in game.players.all().order_by('-score', 'name')
+        ]
+        return self._install(code, game, players, version)
+
+    async def aload(self, code: str, version: Optional[int] = None) -> Optional[GameState]:
+        """``load`` through Django's async ORM (on the event loop)."""
+        try:
+            game = await GameSession.objects.aget(code=code)
+        except GameSession.DoesNotExist:
+            return None
+        players = [
+            serialize_player(player)
+            async for player in game.players.all().order_by('-score', 'name')
+        ]
+        return self._install(code, game, players, version)
+
+    def _install(self, code: str, game: GameSession, players: List[Dict[str, Any]],
+                 version: Optional[int]) -> GameState:
+        with self._lock:
+            if version is None:
+                version = self._next_version(code)
+            state = GameState(code, serialize_game(game), players, version,
+                              self.epoch, getattr(settings, 'GAME_EVENT_LOG_SIZE', 256))
+            self._entries[code] = state
+        return state
+
+    def set_round(self, code: str, current_round: int, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Record a round change for a cached game and return its patch."""
+        with self._lock:
+            state = self._entries.get(code)
+            if state is None:
+                return None
+            state.game = {**state.game, 'current_round': current_round}
+            self._advance(state, version)
+            return self._record(state, {'type': 'round_changed', 'version': state.version, 'current_round': current_round})
+
+    def apply_player(self, code: str, player: Dict[str, Any], version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Insert or replace a player in a cached game and return its patch."""
+        with self._lock:
+            state = self._entries.get(code)
+            if state is None:
+                return None
+            existing = state.get_player(player['id'])
+            state.update_player(player)
+            self._advance(state, version)
+            if existing is None:
+                return self._record(state, {'type': 'player_added', 'version': state.version, 'player': player})
+            return self._record(state, {
+                'type': 'player_renamed',
+                'version': state.version,
+                'player_id': player['id'],
+                'name': player['name'],
+                'buzzer_sound': player['buzzer_sound']
+            })
+
+    def apply_score(self, code: str, player_id: int, score: int, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Record a new score for a player in a cached game and return its patch."""
+        with self._lock:
+            state = self._entries.get(code)
+            player = state.get_player(player_id) if state else None
+            if player is None:
+                return None
+            state.update_player({**player, 'score': score})
+            self._advance(state, version)
+            return self._record(state, {
+                'type': 'score_changed',
+                'version': state.version,
+                'player_id': player_id,
+                'score': score,
+                'rank': state.leaderboard.rank_of(player_id)
+            })
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _advance(self, state: GameState, version: Optional[int]) -> None:
+        """Move a cached game to its next version.
+
+        An externally allocated version that does not directly follow the
+        cached one means another node changed the game in between, so the
+        entry is dropped and reloaded on the next read. Its log is cleared
+        too, since the patches in between are not in it; a client resuming
+        from it gets a full snapshot instead.
+        """
+        if version is None:
+            state.version = self._next_version(state.code)
+            return
+        if version != state.version + 1:
+            self._entries.pop(state.code, None)
+            state.log.clear()
+        state.version = version
+        self._versions[state.code] = max(version, self._versions.get(state.code, 0))
+
+    @staticmethod
+    def _record(state: GameState, patch: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a patch to a game's event log and return it."""
+        state.log.append(patch)
+        return patch
+
+    def _next_version(self, code: str) -> int:
+        version = self._versions.get(code, 0) + 1
+        self._versions[code] = version
+        return version
+
+    def _maybe_evict(self, now: float) -> None:
+        """Evict games that have not been read for longer than the idle timeout.
+
+        Their buzz rankings go too; a round is rebuilt from the database if
+        the game comes back.
+        """
+        idle_timeout = self.get_idle_timeout()
+        if now - self._last_sweep < min(idle_timeout, 60):
+            return
+        self._last_sweep = now
+        with self._lock:
+            idle = [c for c, s in self._entries.items() if now - s.last_access > idle_timeout]
+            for code in idle:
+                del self._entries[code]
+        for code in idle:
+            buzz_index.discard_game(code)
+
+
+game_state_cache = GameStateCache()
+
+# ``GameStateCache.load`` on the DB executor's read pool
+load_game_state = database_read(game_state_cache.load)
+
+
+# Reloads in flight per game code, with the version each one labels its state with
+_reloads: Dict[str, Tuple[Optional[int], asyncio.Task]] = {}
+
+
+async def fetch_game_state(code: str, store) -> Optional[GameState]:
+    """Get a game's cached state, loading it from the database on a miss.
+
+    With a multi-node ``store`` the cached state is also reloaded when
+    another node has moved the game to a newer version. Callers that need
+    the same reload at the same time share one.
+    """
+    version = await store.current_version(code)
+    state = game_state_cache.get(code)
+    if state is None or (version is not None and state.version != version):
+        state = await reload_game_state(code, version)
+    return state
+
+
+async def reload_game_state(code: str, version: Optional[int]) -> Optional[GameState]:
+    """Load a game into the cache, joining a reload already running for it.
+
+    A running reload is only joined if it is for ``version`` or later.
+    """
+    in_flight = _reloads.get(code)
+    if in_flight is None or in_flight[1].get_loop() is not asyncio.get_running_loop() or (
+            version is not None and (in_flight[0] is None or in_flight[0] < version)):
+        if async_orm_enabled():
+            task = asyncio.ensure_future(game_state_cache.aload(code, version))
+        else:
+            task = asyncio.ensure_future(load_game_state(code, version))
+        in_flight = _reloads[code] = (version, task)
+        task.add_done_callback(lambda _: _reloads.pop(code) if _reloads.get(code) is in_flight else None)
+    # A caller giving up must not cancel the reload for everyone else
+    return await asyncio.shield(in_flight[1])
@@ -0,0 +1,78 @@
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .buzz_index import RoundBuzzes, aload_round_buzzes, buzz_index, load_round_buzzes
+from .db_executor import async_orm_enabled, database_read
+
+
+class LocalGameStore:
+    """Shared game state for a single-process deployment.
+
+    State versions are allocated by the process's state cache and buzz
+    rankings live in the in-memory buzz index.
+    """
+    multi_node = False
+
+    async def next_version(self, code: str) -> Optional[int]:
+        """Allocate the next state version, or None to let the cache do it."""
+        return None
+
+    async def current_version(self, code: str) -> Optional[int]:
+        """Return the authoritative state version, or None if the cache is."""
+        return None
+
+    async def start_round(self, code: str, round_number: int) -> None:
+        # Nothing has been buzzed yet, so rank the new round from memory
+        buzz_index.get_or_create(code, round_number)
+
+    async def add_buzz(self, code: str, game_id: int, round_number: int, player_id: int,
+                       player_name: str, timestamp: int) -> Optional[List[Dict[str, Any]]]:
+        """Rank a buzz and return the round's buzz order, or None if the player already buzzed."""
+        round_buzzes = await self.get_round(code, game_id, round_number)
+        if round_buzzes.add(player_id, player_name, timestamp) is None:
+            return None
+        return round_buzzes.as_list()
+
+    async def ordered_buzzes(self, code: str, game_id: int, round_number: int) -> List[Dict[str, Any]]:
+        round_buzzes = await self.get_round(code, game_id, round_number)
+        return round_buzzes.as_list()
+
+    async def set_correctness(self, code: str, round_number: int, player_id: int,
+                              is_correct: Optional[bool]) -> None:
+        round_buzzes = buzz_index.get(code, round_number)
+        if round_buzzes:
+            round_buzzes.set_correctness(player_id, is_correct)
+
+    async def get_round(self, code: str, game_id: int, round_number: int) -> RoundBuzzes:
+        """Get the in-memory ranking for a round, rebuilding it on a miss."""
+        round_buzzes = buzz_index.get(code, round_number)
+        if round_buzzes is None:
+            if async_orm_enabled():
+                loaded = await aload_round_buzzes(game_id, round_number)
+            else:
+                loaded = await database_read(load_round_buzzes)(game_id, round_number)
+            round_buzzes = buzz_index.install(code, round_number, loaded)
+        return round_buzzes
+
+
+@lru_cache(maxsize=None)
+def get_game_store():
+    """Return the game store for this deployment.
+
+    With ``GAME_REDIS_URL`` set, versions and buzz rankings live in Redis
+    so any node can handle any connection.
+    """
+    if getattr(settings, 'GAME_REDIS_URL', None):
+        from .redis_store import RedisGameStore
+        return RedisGameStore.from_url(settings.GAME_REDIS_URL)
+    return LocalGameStore()
+
+
+@receiver(setting_changed)
+def reset_game_store(*, setting, **kwargs):
+    if setting == 'GAME_REDIS_URL':
+        get_game_store.cache_clear()
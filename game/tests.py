@@ -1,3 +1,1221 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+try:
+    import fakeredis
+except ImportError:  # pragma: no cover - optional test dependency
+    fakeredis = None
+
+from . import benchmarks, encoding, spectators, wire
+from .admission import JoinAdmission, allocate_name
+from .broadcast import BroadcastCoalescer
+from .buzz_index import buzz_index
+from .buzz_writer import BuzzWriter, buzz_writer
+from .clock import MAX_DRIFT, ClockEstimator
+from .consumers import GameConsumer
+from .db_executor import database_read, database_write
+from .leaderboard import Leaderboard
+from .logutils import FrameRecorder, MessageTypeSampler
+from .metrics import game_connected, game_disconnected
+from .ratelimit import TokenBucket
+from .models import BuzzEvent, GameSession, Player
+from .roles import leaderboard_changes
+from .spectators import SpectatorTicker, spectator_ticker
+from .sqlite import SingleWriter, configure_connection
+from . import state_cache
+from .state_cache import GameState, GameStateCache, fetch_game_state, game_state_cache
+from .views import accepts_gzip
+from .store import LocalGameStore, get_game_store
+
+
+@override_settings(**benchmarks.BENCHMARK_SETTINGS)
+class ConsumerBenchmarkTests(TestCase):
+    """Fail when a consumer handler regresses against the stored baselines.
+
+    Each handler runs at every size in ``benchmarks.ROOM_SIZES``. Query
+    counts must not grow, bytes sent may grow by 10% and wall time, being
+    machine-dependent, by ``BENCHMARK_TIME_FACTOR`` (default 3x). Query
+    counts are also held to ``benchmarks.QUERY_BUDGETS``, which refreshing
+    the baselines does not change.
+
+    After an intentional change, refresh the baselines with:
+
+        BENCHMARK_UPDATE=1 python manage.py test game.tests.ConsumerBenchmarkTests
+    """
+    update = bool(os.environ.get('BENCHMARK_UPDATE'))
+    time_factor = float(os.environ.get('BENCHMARK_TIME_FACTOR', 3.0))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.baselines = benchmarks.load_baselines()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.update:
+            benchmarks.save_baselines(cls.baselines)
+        benchmarks.reset_realtime_state()
+        super().tearDownClass()
+
+    def run_handler(self, name):
+        results = benchmarks.run_benchmarks(name)
+        budget = benchmarks.QUERY_BUDGETS[name]
+        for size, result in results.items():
+            with self.subTest(handler=name, room_size=size, check='query budget'):
+                self.assertLessEqual(result['queries'], budget,
+                                     f'{name} with {size} players exceeds its query budget')
+
+        if self.update:
+            self.baselines[name] = results
+            return
+
+        baselines = self.baselines.get(name)
+        if baselines is None:
+            self.fail(f'No baseline for {name}; run with BENCHMARK_UPDATE=1 to record one')
+        for size, result in results.items():
+            with self.subTest(handler=name, room_size=size):
+                self.assertIn(size, baselines, f'No baseline for {name} with {size} players')
+                regressions = benchmarks.find_regressions(result, baselines[size], time_factor=self.time_factor)
+                self.assertFalse(regressions, f'{name} with {size} players regressed: ' + '; '.join(regressions))
+
+    def test_join_game(self):
+        self.run_handler('handle_join_game')
+
+    def test_buzz(self):
+        self.run_handler('handle_buzz')
+
+    def test_judge_answer(self):
+        self.run_handler('handle_judge_answer')
+
+    def test_start_round(self):
+        self.run_handler('handle_start_round')
+
+
+class GameStateCacheEvictionTests(SimpleTestCase):
+    def tearDown(self):
+        buzz_index.clear()
+
+    def test_idle_game_is_evicted_with_its_buzz_rankings(self):
+        cache = GameStateCache(idle_timeout=0)
+        cache._install('EVICT1', GameSession(id=1, code='EVICT1', name='Quiz'), [], None)
+        buzz_index.get_or_create('EVICT1', 1).add(1, 'Ann', 1000)
+
+        self.assertIsNone(cache.get('EVICT1'))
+        self.assertIsNone(buzz_index.get('EVICT1', 1))
+
+
+class FakeChannelLayer:
+    """Channel layer that records group sends."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+    def frames(self):
+        return [json.loads(message['text']) for _, message in self.sent]
+
+
+class BroadcastCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.layer = FakeChannelLayer()
+        # Long enough that nothing is flushed by the timer during a test
+        self.coalescer = BroadcastCoalescer(window=60)
+
+    def patch(self, version):
+        return {'type': 'state_patch_message', 'patches': [{'type': 'round_changed', 'version': version}]}
+
+    async def test_patches_are_batched_into_one_frame(self):
+        await self.coalescer.group_send(self.layer, 'game_A', self.patch(1))
+        await self.coalescer.group_send(self.layer, 'game_A', self.patch(2))
+        self.assertEqual(self.layer.sent, [])
+
+        await self.coalescer.flush('game_A')
+        self.assertEqual(self.layer.frames(), [
+            {'type': 'state_patch', 'patches': [
+                {'type': 'round_changed', 'version': 1}, {'type': 'round_changed', 'version': 2}
+            ]}
+        ])
+        self.assertEqual(self.coalescer.coalesced, 1)
+
+    async def test_game_state_replaces_the_patches_it_includes(self):
+        await self.coalescer.group_send(self.layer, 'game_A', self.patch(1))
+        await self.coalescer.group_send(self.layer, 'game_A', {'type': 'game_state_message', 'version': 2})
+        await self.coalescer.group_send(self.layer, 'game_A', self.patch(3))
+        await self.coalescer.flush('game_A')
+
+        self.assertEqual(self.layer.frames(), [
+            {'type': 'game_state', 'version': 2},
+            {'type': 'state_patch', 'patches': [{'type': 'round_changed', 'version': 3}]},
+        ])
+
+    async def test_leaderboard_changes_merge_with_later_entries_winning(self):
+        await self.coalescer.group_send(self.layer, 'game_A_player', {
+            'type': 'leaderboard_message', 'version': 1, 'player_count': 2,
+            'players': [{'id': 1, 'name': 'Ann', 'score': 0}, {'id': 2, 'name': 'Bob', 'score': 0}]
+        })
+        await self.coalescer.group_send(self.layer, 'game_A_player', {
+            'type': 'leaderboard_message', 'version': 2, 'players': [{'id': 1, 'name': 'Ann', 'score': 1}]
+        })
+        await self.coalescer.flush('game_A_player')
+
+        self.assertEqual(self.layer.frames(), [
+            {'type': 'leaderboard', 'version': 2, 'player_count': 2,
+             'players': [{'id': 1, 'name': 'Ann', 'score': 1}, {'id': 2, 'name': 'Bob', 'score': 0}]}
+        ])
+
+    async def test_urgent_message_flushes_pending_first(self):
+        await self.coalescer.group_send(self.layer, 'game_A', self.patch(1))
+        await self.coalescer.group_send(self.layer, 'game_A', {
+            'type': 'round_state_message', 'state': 'started', 'round': 2
+        })
+
+        self.assertEqual([frame['type'] for frame in self.layer.frames()], ['state_patch', 'round_state'])
+        self.assertEqual(self.coalescer._pending, {})
+
+    async def test_no_window_sends_at_once(self):
+        coalescer = BroadcastCoalescer(window=0)
+        await coalescer.group_send(self.layer, 'game_A', self.patch(1))
+        self.assertEqual(len(self.layer.sent), 1)
+
+    def buzz_order(self, *player_ids):
+        return {'type': 'buzz_order_message', 'round': 1,
+                'ordered_buzzes': [{'player_id': player_id} for player_id in player_ids]}
+
+    async def test_buzz_storm_sends_the_first_order_and_then_the_latest(self):
+        coalescer = BroadcastCoalescer(window=60, buzz_window=0.01)
+        for count in range(1, 5):
+            await coalescer.group_send(self.layer, 'game_A', self.buzz_order(*range(count)))
+        self.assertEqual(len(self.layer.sent), 1)
+
+        await asyncio.sleep(0.05)
+        self.assertEqual([len(frame['ordered_buzzes']) for frame in self.layer.frames()], [1, 4])
+        self.assertEqual(coalescer.coalesced, 2)
+        # The storm is over, so the next order goes out at once
+        await asyncio.sleep(0.05)
+        await coalescer.group_send(self.layer, 'game_A', self.buzz_order(*range(5)))
+        self.assertEqual(len(self.layer.sent), 3)
+
+    async def test_held_buzz_order_goes_out_before_an_urgent_message(self):
+        coalescer = BroadcastCoalescer(window=60, buzz_window=60)
+        await coalescer.group_send(self.layer, 'game_A', self.buzz_order(1))
+        await coalescer.group_send(self.layer, 'game_A', self.buzz_order(1, 2))
+        await coalescer.group_send(self.layer, 'game_A', {'type': 'round_state_message', 'state': 'ended', 'round': 1})
+
+        self.assertEqual([frame['type'] for frame in self.layer.frames()], ['buzz_order', 'buzz_order', 'round_state'])
+        self.assertEqual(len(self.layer.frames()[1]['ordered_buzzes']), 2)
+
+    async def test_buzz_windows_are_per_group(self):
+        coalescer = BroadcastCoalescer(window=60, buzz_window=60)
+        await coalescer.group_send(self.layer, 'game_A', self.buzz_order(1))
+        await coalescer.group_send(self.layer, 'game_B', self.buzz_order(2))
+        self.assertEqual([group for group, _ in self.layer.sent], ['game_A', 'game_B'])
+
+
+@override_settings(GAME_EVENT_LOG_SIZE=3)
+class GameStateCacheVersionTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = GameStateCache()
+        self.state = self.cache._install('VERS01', GameSession(id=1, code='VERS01', name='Quiz', current_round=1), [
+            {'id': 1, 'name': 'Ann', 'score': 0, 'buzzer_sound': 'default'}
+        ], None)
+
+    def test_changes_take_contiguous_versions_and_describe_themselves(self):
+        added = self.cache.apply_player('VERS01', {'id': 2, 'name': 'Bob', 'score': 0, 'buzzer_sound': 'bell'})
+        renamed = self.cache.apply_player('VERS01', {'id': 2, 'name': 'Rob', 'score': 0, 'buzzer_sound': 'bell'})
+        scored = self.cache.apply_score('VERS01', 2, 3)
+        round_changed = self.cache.set_round('VERS01', 2)
+
+        self.assertEqual(added, {'type': 'player_added', 'version': 2,
+                                 'player': {'id': 2, 'name': 'Bob', 'score': 0, 'buzzer_sound': 'bell'}})
+        self.assertEqual(renamed, {'type': 'player_renamed', 'version': 3, 'player_id': 2, 'name': 'Rob',
+                                   'buzzer_sound': 'bell'})
+        self.assertEqual(scored, {'type': 'score_changed', 'version': 4, 'player_id': 2, 'score': 3, 'rank': 1})
+        self.assertEqual(round_changed, {'type': 'round_changed', 'version': 5, 'current_round': 2})
+        self.assertEqual(self.state.version, 5)
+        self.assertEqual(self.state.game['current_round'], 2)
+
+    def test_unknown_player_score_is_not_a_change(self):
+        self.assertIsNone(self.cache.apply_score('VERS01', 99, 1))
+        self.assertEqual(self.state.version, 1)
+
+    def test_events_since_replays_what_was_missed(self):
+        self.cache.apply_score('VERS01', 1, 1)
+        self.cache.apply_score('VERS01', 1, 2)
+        self.cache.set_round('VERS01', 2)
+
+        self.assertEqual([patch['version'] for patch in self.state.events_since(2, self.state.epoch)], [3, 4])
+        self.assertEqual(self.state.events_since(4, self.state.epoch), [])
+
+    def test_events_since_needs_a_snapshot_once_the_log_has_rolled_off(self):
+        for score in range(1, 5):
+            self.cache.apply_score('VERS01', 1, score)
+
+        # The log keeps versions 3 to 5; a client at 2 missed nothing that rolled off
+        self.assertEqual([patch['version'] for patch in self.state.events_since(2, self.state.epoch)], [3, 4, 5])
+        self.assertIsNone(self.state.events_since(1, self.state.epoch))
+
+    def test_events_since_needs_a_snapshot_for_another_epoch_or_a_future_version(self):
+        self.cache.apply_score('VERS01', 1, 1)
+        self.assertIsNone(self.state.events_since(1, 'other'))
+        self.assertIsNone(self.state.events_since(3, self.state.epoch))
+
+    def test_out_of_sequence_version_drops_the_game(self):
+        self.cache.apply_score('VERS01', 1, 1, version=5)
+        self.assertIsNone(self.cache.get('VERS01'))
+
+    def test_events_since_needs_a_snapshot_across_a_version_gap(self):
+        self.cache.apply_score('VERS01', 1, 1)
+        self.cache.apply_score('VERS01', 1, 2, version=5)
+
+        self.assertEqual(self.state.version, 5)
+        self.assertIsNone(self.state.events_since(2, self.state.epoch))
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisGameStoreTests(SimpleTestCase):
+    """The multi-node store's Lua scripts, run by fakeredis."""
+
+    def setUp(self):
+        from .redis_store import RedisGameStore
+        self.store = RedisGameStore(fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer()))
+
+    async def test_buzzes_rank_by_timestamp_then_arrival(self):
+        await self.store.add_buzz('REDIS1', 1, 1, 10, 'Ann', 2000)
+        await self.store.add_buzz('REDIS1', 1, 1, 11, 'Bob', 1000)
+        ordered = await self.store.add_buzz('REDIS1', 1, 1, 12, 'Cat', 2000)
+
+        self.assertEqual([(buzz['player_id'], buzz['timestamp']) for buzz in ordered],
+                         [(11, 1000), (10, 2000), (12, 2000)])
+        self.assertEqual(await self.store.ordered_buzzes('REDIS1', 1, 1), ordered)
+
+    async def test_only_a_players_first_buzz_counts(self):
+        await self.store.add_buzz('REDIS1', 1, 1, 10, 'Ann', 2000)
+        self.assertIsNone(await self.store.add_buzz('REDIS1', 1, 1, 10, 'Ann', 1000))
+
+        ordered = await self.store.ordered_buzzes('REDIS1', 1, 1)
+        self.assertEqual([(buzz['player_id'], buzz['timestamp']) for buzz in ordered], [(10, 2000)])
+        # Each round is arbitrated on its own
+        self.assertIsNotNone(await self.store.add_buzz('REDIS1', 1, 2, 10, 'Ann', 3000))
+
+    async def test_set_correctness(self):
+        await self.store.add_buzz('REDIS1', 1, 1, 10, 'Ann', 2000)
+        await self.store.set_correctness('REDIS1', 1, 10, True)
+        await self.store.set_correctness('REDIS1', 1, 99, False)
+
+        ordered = await self.store.ordered_buzzes('REDIS1', 1, 1)
+        self.assertEqual([(buzz['player_id'], buzz['is_correct']) for buzz in ordered], [(10, True)])
+
+    async def test_versions_count_up_per_game(self):
+        self.assertEqual(await self.store.current_version('REDIS1'), 0)
+        self.assertEqual(await self.store.next_version('REDIS1'), 1)
+        self.assertEqual(await self.store.next_version('REDIS1'), 2)
+        self.assertEqual(await self.store.next_version('REDIS2'), 1)
+        self.assertEqual(await self.store.current_version('REDIS1'), 2)
+
+    def test_redis_url_switches_the_store(self):
+        from .redis_store import RedisGameStore
+        with override_settings(GAME_REDIS_URL='redis://localhost:6379/0'):
+            self.assertIsInstance(get_game_store(), RedisGameStore)
+        self.assertIsInstance(get_game_store(), LocalGameStore)
+
+
+class FetchGameStateTests(SimpleTestCase):
+    def tearDown(self):
+        game_state_cache.clear()
+
+    async def test_concurrent_reloads_of_a_game_share_one_load(self):
+        loads = []
+
+        async def load(code, version):
+            loads.append(version)
+            await asyncio.sleep(0.01)
+            return game_state_cache._install(code, GameSession(id=1, code=code, name='Quiz'), [], version)
+
+        store = mock.Mock(current_version=mock.AsyncMock(return_value=7))
+        with mock.patch.object(state_cache, 'load_game_state', load):
+            states = await asyncio.gather(*(fetch_game_state('FETCH1', store) for _ in range(10)))
+            # A newer version elsewhere needs a reload of its own
+            store.current_version.return_value = 8
+            newer = await fetch_game_state('FETCH1', store)
+
+        self.assertEqual(loads, [7, 8])
+        self.assertEqual({id(state) for state in states}, {id(states[0])})
+        self.assertEqual(newer.version, 8)
+
+
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        game_connected('SECRET')
+
+    def tearDown(self):
+        game_disconnected('SECRET')
+
+    def test_hidden_from_anonymous_clients(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    @override_settings(GAME_METRICS_TOKEN='scrape')
+    def test_served_to_scrapers_with_the_token(self):
+        self.assertEqual(self.client.get('/metrics/', headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+        response = self.client.get('/metrics/', headers={'Authorization': 'Bearer scrape'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('buzzquiz_games_active 1', response.content.decode())
+        self.assertNotIn('SECRET', response.content.decode())
+
+
+@override_settings(GAME_DB_EXECUTOR={'ENABLED': False}, GAME_STATE_ENDPOINT={'GZIP_MIN_SIZE': 0})
+class GameStateViewTests(TestCase):
+    def setUp(self):
+        GameSession.objects.create(code='POLL01', name='Polling')
+
+    def tearDown(self):
+        benchmarks.reset_realtime_state()
+
+    def test_serves_the_game_state_snapshot(self):
+        response = self.client.get('/api/game/POLL01/state/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['game']['code'], 'POLL01')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_current_etag_gets_not_modified(self):
+        etag = self.client.get('/api/game/POLL01/state/')['ETag']
+
+        response = self.client.get('/api/game/POLL01/state/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_gzipped_only_for_clients_that_accept_it(self):
+        plain = self.client.get('/api/game/POLL01/state/').content
+
+        response = self.client.get('/api/game/POLL01/state/', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+        response = self.client.get('/api/game/POLL01/state/', headers={'Accept-Encoding': 'gzip;q=0, br'})
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content, plain)
+
+    def test_unknown_game_is_not_found(self):
+        self.assertEqual(self.client.get('/api/game/NOPE00/state/').status_code, 404)
+
+
+class AcceptsGzipTests(SimpleTestCase):
+    def test_q_values(self):
+        cases = {
+            '': False,
+            'gzip': True,
+            'deflate, gzip;q=0.5': True,
+            'GZIP;Q=1.0': True,
+            'gzip;q=0': False,
+            'gzip; q=0.000': False,
+            'br, *': True,
+            '*;q=0': False,
+            'gzip;q=0, *': False,
+            'gzip, *;q=0': True,
+            'gzip;q=oops': False,
+        }
+        for header, accepted in cases.items():
+            with self.subTest(header=header):
+                self.assertIs(accepts_gzip(header), accepted)
+
+
+@override_settings(**benchmarks.BENCHMARK_SETTINGS)
+class BuzzRejectionTests(TestCase):
+    """Buzzes that don't count are answered with ``buzz_rejected`` and go no further."""
+
+    def tearDown(self):
+        benchmarks.reset_realtime_state()
+
+    def play(self, scenario):
+        """Run ``scenario(room, player)`` in a one-player game with a round started."""
+        queries = benchmarks.QueryCounter()
+
+        async def run():
+            room = benchmarks.Room(1, queries)
+            await room.setup()
+            try:
+                room.round = await room.start_round()
+                await scenario(room, room.players[0])
+            finally:
+                await room.teardown()
+
+        with connection.execute_wrapper(queries):
+            async_to_sync(run)()
+
+    async def buzz(self, player, round_number, **overrides):
+        await player.communicator.send_json_to({
+            'type': 'buzz',
+            'player_id': player.player_id,
+            'timestamp': int(time.time() * 1000),
+            'round': round_number,
+            **overrides
+        })
+
+    async def assert_rejected(self, room, player, round_number, reason, **overrides):
+        """Buzz and check only the sender hears back, with nothing written or broadcast."""
+        queries_before = room.queries.count
+        with mock.patch.object(buzz_writer, 'enqueue') as enqueue, \
+                mock.patch.object(GameConsumer, 'broadcast') as broadcast:
+            await self.buzz(player, round_number, **overrides)
+            self.assertEqual(await player.receive(),
+                             {'type': 'buzz_rejected', 'round': round_number, 'reason': reason})
+            await room.drain()
+        self.assertTrue(await room.host.communicator.receive_nothing(timeout=0.05))
+        enqueue.assert_not_called()
+        broadcast.assert_not_called()
+        self.assertEqual(room.queries.count, queries_before)
+
+    def test_second_buzz_in_a_round_is_rejected(self):
+        async def scenario(room, player):
+            await self.buzz(player, room.round)
+            await player.wait_for('buzz_rank')
+            await room.drain()
+            await self.assert_rejected(room, player, room.round, 'duplicate')
+
+        self.play(scenario)
+
+    def test_buzz_for_another_round_is_rejected(self):
+        async def scenario(room, player):
+            await self.assert_rejected(room, player, room.round + 1, 'wrong_round')
+
+        self.play(scenario)
+
+    def test_buzz_from_an_unknown_player_is_rejected(self):
+        async def scenario(room, player):
+            await self.assert_rejected(room, player, room.round, 'unknown_player',
+                                       player_id=player.player_id + 1000)
+
+        self.play(scenario)
+
+
+@override_settings(**benchmarks.BENCHMARK_SETTINGS)
+class BuzzRankFanOutTests(TestCase):
+    """Players only hear about a buzz when their own place changes."""
+
+    def tearDown(self):
+        benchmarks.reset_realtime_state()
+
+    def test_only_players_whose_place_changed_get_a_buzz_rank(self):
+        deliveries = mock.patch.object(GameConsumer, 'buzz_rank_message', autospec=True,
+                                       side_effect=GameConsumer.buzz_rank_message)
+
+        async def run():
+            room = benchmarks.Room(3, benchmarks.QueryCounter())
+            await room.setup()
+            try:
+                round_number = await room.start_round()
+                first, second, third = room.players
+                now = int(time.time() * 1000)
+                quiet = (second.bytes, third.bytes)
+
+                await first.communicator.send_json_to({
+                    'type': 'buzz', 'player_id': first.player_id, 'timestamp': now, 'round': round_number
+                })
+                self.assertEqual((await first.receive())['rank'], 1)
+                await room.drain()
+                self.assertEqual((second.bytes, third.bytes), quiet)
+                self.assertEqual(group_deliveries.call_count, 0)
+
+                # Earlier on the server's clock than the first buzz, so it ranks ahead
+                await second.communicator.send_json_to({
+                    'type': 'buzz', 'player_id': second.player_id, 'timestamp': now - 1000, 'round': round_number
+                })
+                self.assertEqual((await second.receive())['rank'], 1)
+                self.assertEqual(await first.receive(), {
+                    'type': 'buzz_rank', 'round': round_number, 'rank': 2, 'locked': True
+                })
+                await room.drain()
+                self.assertEqual(third.bytes, quiet[1])
+                self.assertEqual(group_deliveries.call_count, 3)
+            finally:
+                await room.teardown()
+
+        with deliveries as group_deliveries:
+            async_to_sync(run)()
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_frames_beyond_the_burst_are_refused_until_tokens_return(self):
+        with mock.patch('game.ratelimit.time.monotonic', return_value=100.0):
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        with mock.patch('game.ratelimit.time.monotonic', return_value=100.5):
+            self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+
+    def test_zero_rate_disables_the_limit(self):
+        bucket = TokenBucket(rate=0, burst=1)
+        self.assertTrue(all(bucket.take() for _ in range(100)))
+
+
+@override_settings(GAME_INBOUND_RATE_LIMIT={'RATE': 0.001, 'BURST': 2}, **benchmarks.BENCHMARK_SETTINGS)
+class InboundRateLimitTests(TestCase):
+    def tearDown(self):
+        benchmarks.reset_realtime_state()
+
+    def test_frames_over_the_limit_are_dropped_with_one_error(self):
+        async def run():
+            room = benchmarks.Room(0, benchmarks.QueryCounter())
+            await room.setup()
+            try:
+                for _ in range(4):
+                    await room.host.communicator.send_json_to({'type': 'ping'})
+                self.assertEqual((await room.host.receive())['type'], 'pong')
+                self.assertEqual((await room.host.receive())['type'], 'pong')
+                error = await room.host.receive()
+                self.assertEqual((error['type'], error['reason']), ('error', 'rate_limited'))
+                self.assertTrue(await room.host.communicator.receive_nothing(timeout=0.05))
+            finally:
+                await room.teardown()
+
+        async_to_sync(run)()
+
+
+@override_settings(GAME_DB_EXECUTOR={'ENABLED': False},
+                   BUZZ_WRITE_BEHIND={'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 3600, 'MAX_QUEUE': 5, 'OVERFLOW': 'block'})
+class BuzzWriterTests(TestCase):
+    """What reaches the database through the write-behind queue."""
+
+    def setUp(self):
+        self.writer = BuzzWriter()
+        self.game = GameSession.objects.create(code='WRITE1', name='Write-behind')
+        self.players = Player.objects.bulk_create([
+            Player(game_session=self.game, name=f'Player {i}', device_id=f'writer-{i}') for i in range(6)
+        ])
+
+    def run_writer(self, scenario):
+        """Run ``scenario()`` on an event loop, then stop the writer's flusher."""
+        async def run():
+            try:
+                return await scenario()
+            finally:
+                self.writer._task.cancel()
+
+        return async_to_sync(run)()
+
+    async def enqueue(self, *players, round_number=1):
+        return [await self.writer.enqueue(self.game.id, player.id, 1000 + player.id, round_number)
+                for player in players]
+
+    def stored(self):
+        return sorted(BuzzEvent.objects.values_list('player_id', flat=True))
+
+    def test_full_batch_is_written_without_an_explicit_flush(self):
+        async def scenario():
+            await self.enqueue(*self.players[:3])
+            for _ in range(10):
+                await asyncio.sleep(0)
+            await self.enqueue(self.players[3])
+            # Let the flusher's write finish before it is stopped
+            for _ in range(100):
+                if self.writer.counters['flushes']:
+                    break
+                await asyncio.sleep(0.01)
+
+        self.run_writer(scenario)
+        self.assertEqual(self.stored(), [player.id for player in self.players[:3]])
+        self.assertEqual(self.writer.queue_depth, 1)
+        self.assertEqual(self.writer.counters['flushes'], 1)
+
+    @override_settings(BUZZ_WRITE_BEHIND={'BATCH_SIZE': 50, 'FLUSH_INTERVAL': 0.01})
+    def test_partial_batch_is_written_after_the_flush_interval(self):
+        async def scenario():
+            await self.enqueue(*self.players[:2])
+            await asyncio.sleep(0.1)
+
+        self.run_writer(scenario)
+        self.assertEqual(self.stored(), [player.id for player in self.players[:2]])
+
+    def test_flush_writes_everything_pending(self):
+        async def scenario():
+            await self.enqueue(*self.players[:2])
+            return await self.writer.flush()
+
+        self.assertEqual(self.run_writer(scenario), 2)
+        self.assertEqual(self.stored(), [player.id for player in self.players[:2]])
+        self.assertEqual(self.writer.counters['written'], 2)
+
+    @override_settings(BUZZ_WRITE_BEHIND={'BATCH_SIZE': 50, 'MAX_QUEUE': 2, 'OVERFLOW': 'block'})
+    def test_full_queue_blocks_until_it_is_flushed(self):
+        async def stored_during():
+            accepted = await self.enqueue(*self.players[:3])
+            return accepted, self.writer.queue_depth
+
+        accepted, depth = self.run_writer(stored_during)
+        self.assertEqual(accepted, [True, True, True])
+        self.assertEqual(self.stored(), [player.id for player in self.players[:2]])
+        self.assertEqual(depth, 1)
+        self.assertEqual(self.writer.counters['dropped'], 0)
+
+    @override_settings(BUZZ_WRITE_BEHIND={'BATCH_SIZE': 50, 'MAX_QUEUE': 2, 'OVERFLOW': 'drop'})
+    def test_full_queue_drops_new_buzzes_in_drop_mode(self):
+        async def scenario():
+            accepted = await self.enqueue(*self.players[:3])
+            await self.writer.flush()
+            return accepted
+
+        self.assertEqual(self.run_writer(scenario), [True, True, False])
+        self.assertEqual(self.stored(), [player.id for player in self.players[:2]])
+        self.assertEqual(self.writer.counters['dropped'], 1)
+
+    def test_failed_write_is_counted(self):
+        async def scenario():
+            await self.enqueue(*self.players[:2])
+            with mock.patch.object(BuzzEvent.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+                return await self.writer.flush()
+
+        self.assertEqual(self.run_writer(scenario), 0)
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(self.writer.counters['failed'], 2)
+
+    def test_pending_buzzes_are_written_at_shutdown(self):
+        async def scenario():
+            await self.enqueue(*self.players[:2])
+
+        self.run_writer(scenario)
+        self.assertEqual(self.stored(), [])
+        # What atexit runs once the event loop is gone
+        self.assertEqual(self.writer.flush_sync(), 2)
+        self.assertEqual(self.stored(), [player.id for player in self.players[:2]])
+
+
+class GameWrites:
+    """Records which thread ran each of one game's writes, in order."""
+
+    def __init__(self, game_code):
+        self.game_code = game_code
+        self.done = []
+
+    @database_write
+    def write(self, value, delay):
+        time.sleep(delay)
+        self.done.append((value, threading.current_thread().name))
+
+
+@database_read
+def reading_thread():
+    return threading.current_thread().name
+
+
+@override_settings(GAME_DB_EXECUTOR={'ENABLED': True}, GAME_SQLITE_PROFILE={'SINGLE_WRITER': False})
+class DatabaseExecutorTests(SimpleTestCase):
+    """Which threads database calls run on."""
+
+    def test_reads_run_on_the_read_pool(self):
+        async def run():
+            return await asyncio.gather(*(reading_thread() for _ in range(4)))
+
+        names = async_to_sync(run)()
+        self.assertTrue(all(name.startswith('game-db-read') for name in names), names)
+        # The pool's call is built on first use and then reused
+        calls = dict(reading_thread._calls)
+        async_to_sync(run)()
+        self.assertEqual(reading_thread._calls, calls)
+
+    def test_one_games_writes_run_in_order_on_one_lane(self):
+        game = GameWrites('LANE01')
+
+        async def run():
+            # Earlier writes sleep longer, so any overlap would reorder them
+            await asyncio.gather(*(game.write(value, 0.02 - value * 0.004) for value in range(5)))
+
+        async_to_sync(run)()
+        self.assertEqual([value for value, _ in game.done], list(range(5)))
+        lanes = {name for _, name in game.done}
+        self.assertEqual(len(lanes), 1)
+        self.assertTrue(lanes.pop().startswith('game-db-write-'))
+
+    @override_settings(GAME_DB_EXECUTOR={'ENABLED': False})
+    def test_disabled_executor_uses_the_shared_thread(self):
+        async def run():
+            return await reading_thread(), threading.current_thread().name
+
+        name, loop_thread = async_to_sync(run)()
+        self.assertFalse(name.startswith('game-db-'))
+        self.assertNotEqual(name, loop_thread)
+
+
+@override_settings(GAME_CLOCK_SYNC={'MIN_INTERVAL': 1.0, 'MAX_INTERVAL': 8.0, 'MAX_UNANSWERED': 2,
+                                    'MAX_BUZZ_DELAY_MS': 2000})
+class ClockEstimatorTests(SimpleTestCase):
+    def sample(self, clock, server_time, rtt, offset):
+        """Add the sample a probe would give with its round trip centred on ``server_time``."""
+        return clock.add_sample(server_time - rtt / 2, server_time + rtt / 2, server_time + offset)
+
+    def test_estimate_comes_from_the_lowest_rtt_sample(self):
+        clock = ClockEstimator()
+        self.sample(clock, 1000, 80, 300)
+        self.sample(clock, 2000, 10, 250)
+        self.sample(clock, 3000, 40, 200)
+
+        self.assertEqual(clock.best.rtt, 10)
+        self.assertEqual(clock.offset_at(5000), 250)
+
+    def test_drift_is_fitted_across_the_lower_rtt_samples(self):
+        clock = ClockEstimator()
+        # The client's clock gains 0.2 ms a second; the slow samples are noise
+        for second in range(8):
+            fast = second % 2 == 0
+            self.sample(clock, second * 1000, 10 if fast else 200, 100 + second * 0.2 + (0 if fast else 50))
+
+        self.assertAlmostEqual(clock.drift, 0.0002)
+        self.assertAlmostEqual(clock.offset_at(10000), 100 + 10 * 0.2)
+
+    def test_drift_needs_four_samples_and_is_clamped(self):
+        clock = ClockEstimator()
+        for second in range(3):
+            self.sample(clock, second * 1000, 10, second * 100)
+        self.assertEqual(clock.drift, 0.0)
+        self.sample(clock, 3000, 10, 300)
+        self.assertEqual(clock.drift, MAX_DRIFT)
+
+    def test_correct_clamps_to_before_the_buzz_arrived(self):
+        clock = ClockEstimator()
+        self.assertEqual(clock.correct(10500, 10000), (10000, None))
+        self.assertEqual(clock.correct(1000, 10000), (8000, None))
+        self.assertEqual(clock.correct(9900, 10000), (9900, None))
+
+        self.sample(clock, 9000, 10, 400)
+        self.assertEqual(clock.correct(10300, 10000), (9900, 400))
+        self.assertEqual(clock.correct(10600, 10000), (10000, 400))
+
+    def test_probes_back_off_while_unanswered(self):
+        clock = ClockEstimator()
+        intervals = []
+        for probe in range(5):
+            clock.probe_sent(probe * 1000.0)
+            intervals.append(clock.interval)
+        self.assertEqual(intervals, [1.0, 2.0, 4.0, 8.0, 8.0])
+        self.assertEqual(len(clock.outstanding), 3)
+
+        # An answer to a probe still in flight resets the count
+        self.assertIsNotNone(clock.reply_received(4000, 4005, 4010.0))
+        self.assertEqual(clock.unanswered, 0)
+        self.assertEqual(clock.interval, 1.0)
+
+
+@override_settings(GAME_DB_EXECUTOR={'ENABLED': False}, GAME_JOIN_ADMISSION={'WINDOW': 0.01, 'MAX_BATCH': 200})
+class JoinAdmissionTests(TestCase):
+    """How joins are batched and names allocated."""
+
+    def setUp(self):
+        self.admission = JoinAdmission()
+        self.game = GameSession.objects.create(code='JOIN01', name='Admission')
+
+    def join(self, *joins):
+        """Send ``(name, device_id)`` joins at the same time; returns the players."""
+        async def run():
+            return await asyncio.gather(*(
+                self.admission.join(self.game.code, self.game.id, name, device_id, 'default')
+                for name, device_id in joins
+            ))
+
+        return async_to_sync(run)()
+
+    def names(self, players):
+        return [player['name'] for player in players]
+
+    def test_allocate_name_takes_the_first_free_suffix(self):
+        names = {'Ann', 'Ann (1)', 'Ann (3)'}
+        self.assertEqual(allocate_name(names, 'Ann'), 'Ann (2)')
+        self.assertEqual(allocate_name(names, 'Ann'), 'Ann (4)')
+        self.assertEqual(allocate_name(names, 'Bob'), 'Bob')
+        self.assertIn('Bob', names)
+
+    def test_joins_in_one_window_are_admitted_together(self):
+        players = self.join(*((f'Player {i}', f'device-{i}') for i in range(5)))
+
+        self.assertEqual(self.names(players), [f'Player {i}' for i in range(5)])
+        self.assertEqual(self.admission.counters['batches'], 1)
+        self.assertEqual(self.admission.counters['created'], 5)
+        self.assertEqual(Player.objects.filter(game_session=self.game).count(), 5)
+
+    def test_same_name_joins_get_suffixes(self):
+        Player.objects.create(game_session=self.game, name='Ann', device_id='existing')
+        players = self.join(('Ann', 'device-1'), ('Ann', 'device-2'), ('Ann', 'device-3'))
+
+        self.assertEqual(self.names(players), ['Ann (1)', 'Ann (2)', 'Ann (3)'])
+
+    @override_settings(GAME_JOIN_ADMISSION={'WINDOW': 0})
+    def test_concurrent_same_name_joins_in_separate_batches_get_suffixes(self):
+        players = self.join(('Bob', 'device-1'), ('Bob', 'device-2'), ('Bob', 'device-3'))
+
+        self.assertEqual(sorted(self.names(players)), ['Bob', 'Bob (1)', 'Bob (2)'])
+        self.assertEqual(self.admission.counters['batches'], 3)
+
+    def test_rejoin_keeps_the_player_and_releases_a_renamed_name(self):
+        ann, = self.join(('Ann', 'device-1'))
+        # The old name is still held while the rename is in the same batch
+        cat, other = self.join(('Cat', 'device-1'), ('Ann', 'device-2'))
+        self.assertEqual(cat['id'], ann['id'])
+        self.assertEqual(cat['name'], 'Cat')
+        self.assertEqual(other['name'], 'Ann (1)')
+        self.assertEqual(self.admission.counters['rejoined'], 1)
+
+        # ... and free for later ones
+        later, = self.join(('Ann', 'device-3'))
+        self.assertEqual(later['name'], 'Ann')
+
+    def test_name_taken_elsewhere_is_retried_with_a_fresh_index(self):
+        self.join(('Ann', 'device-1'))
+        # Another process registers a name this one's index has as free
+        Player.objects.create(game_session=self.game, name='Dan', device_id='elsewhere')
+
+        dan, = self.join(('Dan', 'device-2'))
+        self.assertEqual(dan['name'], 'Dan (1)')
+        self.assertEqual(self.admission.counters['retries'], 1)
+
+    def test_join_fails_after_three_conflicting_attempts(self):
+        with mock.patch.object(Player.objects, 'bulk_create', side_effect=IntegrityError('taken')) as bulk_create, \
+                self.assertLogs('django.channels', 'ERROR'):
+            player, = self.join(('Eve', 'device-1'))
+
+        self.assertIsNone(player)
+        self.assertEqual(bulk_create.call_count, 3)
+        self.assertEqual(self.admission.counters['retries'], 2)
+        self.assertFalse(Player.objects.filter(game_session=self.game).exists())
+
+
+class SingleWriterTests(TransactionTestCase):
+    """Batched writes on the SQLite writer thread."""
+
+    def setUp(self):
+        self.writer = SingleWriter()
+        self.game = GameSession.objects.create(code='LITE01', name='Writer')
+
+    def add_player(self, name):
+        return Player.objects.create(game_session=self.game, name=name, device_id=name).pk
+
+    def add_player_and_fail(self, name):
+        self.add_player(name)
+        raise ValueError('judge error')
+
+    def test_failing_write_only_rolls_back_itself(self):
+        # Hold the writer on a first batch so the next three queue up together
+        release = threading.Event()
+        blocker = self.writer.submit(release.wait, 5)
+        ann = self.writer.submit(self.add_player, 'Ann')
+        bob = self.writer.submit(self.add_player_and_fail, 'Bob')
+        cat = self.writer.submit(self.add_player, 'Cat')
+        release.set()
+
+        self.assertTrue(blocker.result(timeout=5))
+        self.assertIsInstance(ann.result(timeout=5), int)
+        with self.assertRaisesMessage(ValueError, 'judge error'):
+            bob.result(timeout=5)
+        self.assertIsInstance(cat.result(timeout=5), int)
+        self.assertEqual(sorted(Player.objects.values_list('name', flat=True)), ['Ann', 'Cat'])
+        self.assertEqual(self.writer.counters, {'writes': 4, 'batches': 2, 'failed_batches': 0})
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        raw = mock.Mock()
+        configure_connection(None, mock.Mock(vendor='sqlite', connection=raw))
+        self.assertEqual([call.args[0] for call in raw.execute.call_args_list], [
+            'PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL',
+            'PRAGMA busy_timeout=5000', f'PRAGMA mmap_size={256 * 1024 * 1024}',
+        ])
+
+        raw.reset_mock()
+        with override_settings(GAME_SQLITE_PROFILE={'ENABLED': False}):
+            configure_connection(None, mock.Mock(vendor='sqlite', connection=raw))
+        configure_connection(None, mock.Mock(vendor='postgresql', connection=raw))
+        raw.execute.assert_not_called()
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+class WireTests(SimpleTestCase):
+    """The binary protocol's code tables and what is encoded for each group."""
+
+    FRAME = {
+        'type': 'buzz_order',
+        'round': 2,
+        'ordered_buzzes': [{'player_id': 1, 'player_name': 'Ann', 'timestamp': 1000}],
+        'hint': {'type': 'future_type', 'size': 3},
+    }
+
+    def test_compact_and_expand_round_trip(self):
+        compacted = wire.compact(self.FRAME)
+        self.assertEqual(compacted[wire.FIELD_CODES['type']], wire.TYPE_CODES['buzz_order'])
+        # Names the tables don't know yet go as they are
+        self.assertEqual(compacted['hint'][wire.FIELD_CODES['type']], 'future_type')
+        self.assertEqual(wire.expand(compacted), self.FRAME)
+        self.assertEqual(wire.unpack(wire.pack(self.FRAME)), self.FRAME)
+
+    def test_expand_accepts_field_names(self):
+        self.assertEqual(wire.expand({'type': wire.TYPE_CODES['buzz'], wire.FIELD_CODES['round']: 1}),
+                         {'type': 'buzz', 'round': 1})
+
+    def test_player_page_gets_the_tables_for_every_frame_it_reads(self):
+        page = (settings.BASE_DIR / 'templates' / 'game' / 'player_game.html').read_text()
+        self.assertIn('wire-tables', page)
+        self.assertEqual(wire.client_tables(), {'subprotocol': wire.SUBPROTOCOL,
+                                                'fields': list(wire.FIELDS), 'types': list(wire.TYPES)})
+        handler = page[page.index('function handleMessage'):page.index('function handleClose')]
+        self.assertLessEqual(set(re.findall(r"case '(\w+)'", handler)), set(wire.TYPES))
+        self.assertLessEqual(set(re.findall(r'\bdata\.(\w+)', page)), set(wire.FIELDS))
+        # Codes are indexes, so a table must never hold a name twice
+        self.assertEqual(len(set(wire.FIELDS)), len(wire.FIELDS))
+        self.assertEqual(len(set(wire.TYPES)), len(wire.TYPES))
+
+    def test_group_messages_are_encoded_for_the_formats_subscribed(self):
+        message = {'type': 'round_state_message', 'state': 'active', 'round': 1}
+        self.addCleanup(encoding._group_formats.clear)
+
+        self.assertEqual(encoding.group_formats('game_X_host'), (True, False))
+        encoding.format_subscribed('game_X_host', True)
+        self.assertEqual(encoding.group_formats('game_X_host'), (False, True))
+        encoded = encoding.encode_group_message(message, *encoding.group_formats('game_X_host'))
+        self.assertNotIn('text', encoded)
+        self.assertEqual(wire.unpack(encoded['bytes']), {'type': 'round_state', 'state': 'active', 'round': 1})
+
+        encoding.format_subscribed('game_X_host', False)
+        self.assertEqual(encoding.group_formats('game_X_host'), (True, True))
+        encoding.format_unsubscribed('game_X_host', True)
+        encoding.format_unsubscribed('game_X_host', False)
+        self.assertNotIn('game_X_host', encoding._group_formats)
+
+        with override_settings(GAME_REDIS_URL='redis://localhost:6379/0'):
+            self.assertEqual(encoding.group_formats('game_X_host'), (True, True))
+
+    def test_loads_follows_the_configured_json_library(self):
+        with override_settings(GAME_JSON_ENCODER='json'):
+            self.assertIs(encoding.get_decoder(), json.loads)
+            self.assertEqual(encoding.loads('{"type":"ping"}'), {'type': 'ping'})
+        if encoding.orjson is not None:
+            with override_settings(GAME_JSON_ENCODER='orjson'):
+                self.assertIs(encoding.get_decoder(), encoding.orjson.loads)
+
+
+def ranked(player_id, name, score=0):
+    return {'id': player_id, 'name': name, 'score': score, 'buzzer_sound': 'default'}
+
+
+class LeaderboardTests(SimpleTestCase):
+    def setUp(self):
+        self.board = Leaderboard([ranked(1, 'Cat', 2), ranked(2, 'Ann', 2), ranked(3, 'Bob', 5)])
+
+    def test_ranks_by_score_then_name(self):
+        self.assertEqual([p['name'] for p in self.board.as_list()], ['Bob', 'Ann', 'Cat'])
+        self.assertEqual([self.board.rank_of(player_id) for player_id in (1, 2, 3)], [3, 2, 1])
+        self.assertIsNone(self.board.rank_of(99))
+
+    def test_upsert_moves_a_player_and_remove_drops_them(self):
+        self.board.upsert(ranked(1, 'Cat', 6))
+        self.board.upsert(ranked(4, 'Dan', 1))
+        self.assertEqual([p['name'] for p in self.board.top(2)], ['Cat', 'Bob'])
+        self.assertEqual(self.board.rank_of(4), 4)
+
+        self.board.remove(3)
+        self.board.remove(99)
+        self.assertEqual([p['name'] for p in self.board.as_list()], ['Cat', 'Ann', 'Dan'])
+        self.assertEqual(len(self.board), 3)
+        self.assertNotIn(3, self.board)
+
+    @override_settings(GAME_LEADERBOARD_SIZE=2)
+    def test_leaderboard_changes_records_what_was_sent(self):
+        state = GameState('LEAD01', {'id': 1, 'current_round': 1},
+                          [ranked(1, 'Cat', 2), ranked(2, 'Ann', 2), ranked(3, 'Bob', 5)], 1)
+
+        self.assertEqual(leaderboard_changes(state), {
+            'players': [{'id': 3, 'name': 'Bob', 'score': 5}, {'id': 2, 'name': 'Ann', 'score': 2}],
+            'player_count': 3,
+        })
+        self.assertEqual(state.top_sent, {3: {'id': 3, 'name': 'Bob', 'score': 5},
+                                          2: {'id': 2, 'name': 'Ann', 'score': 2}})
+        self.assertEqual(state.count_sent, 3)
+        self.assertIsNone(leaderboard_changes(state))
+
+        # Cat overtakes Ann: only Cat's entry is new to clients
+        state.update_player(ranked(1, 'Cat', 3))
+        self.assertEqual(leaderboard_changes(state), {'players': [{'id': 1, 'name': 'Cat', 'score': 3}]})
+        self.assertEqual(set(state.top_sent), {3, 1})
+
+
+class FakeSpectator:
+    """Stands in for a spectator's consumer, keeping what it is forwarded."""
+
+    def __init__(self, binary=False):
+        self.binary = binary
+        self.received = []
+
+    async def forward(self, event):
+        self.received.append(event)
+
+
+class SpectatorTickerTests(SimpleTestCase):
+    """What the ticker publishes, and how often."""
+
+    def setUp(self):
+        self.ticker = SpectatorTicker()
+        self.frames = []
+        frame_patch = mock.patch.object(spectators, 'spectator_frame', side_effect=self.next_frame)
+        frame_patch.start()
+        self.addCleanup(frame_patch.stop)
+
+    async def next_frame(self, game_code):
+        return self.frames.pop(0)
+
+    def snapshot(self, version):
+        return {'type': 'spectator', 'version': version, 'current_round': 1, 'player_count': 2,
+                'players': [], 'ordered_buzzes': []}
+
+    async def test_unchanged_snapshots_are_skipped(self):
+        feed = spectators.SpectatorFeed('SPEC01')
+        text, binary = FakeSpectator(), FakeSpectator(binary=True)
+        feed.spectators.update((text, binary))
+        self.frames = [self.snapshot(1), self.snapshot(1), self.snapshot(2)]
+
+        for _ in range(3):
+            await self.ticker.tick(feed)
+
+        self.assertEqual(self.ticker.counters, {'published': 2, 'skipped': 1})
+        self.assertEqual([json.loads(event['text'])['version'] for event in text.received], [1, 2])
+        self.assertIs(text.received[-1], binary.received[-1])
+        self.assertEqual(wire.unpack(binary.received[-1]['bytes']), self.snapshot(2))
+
+    @override_settings(GAME_SPECTATOR_TICKER={'RATE': 20})
+    async def test_changes_between_ticks_are_sent_as_one_snapshot(self):
+        spectator = FakeSpectator(binary=True)
+        self.frames = [self.snapshot(version) for version in (1, 3, 3, 3, 3, 3, 3, 3)]
+
+        await self.ticker.add('SPEC01', spectator)
+        await asyncio.sleep(0.12)
+        self.ticker.remove('SPEC01', spectator)
+
+        # The game moved from version 1 to 3 between ticks: 2 is never published
+        self.assertEqual([wire.unpack(event['bytes'])['version'] for event in spectator.received], [1, 3])
+        self.assertNotIn('text', spectator.received[-1])
+        self.assertEqual(len(self.ticker), 0)
+
+    async def test_a_late_text_spectator_gets_a_text_snapshot(self):
+        binary, text = FakeSpectator(binary=True), FakeSpectator()
+        feed = self.ticker._feeds['SPEC01'] = spectators.SpectatorFeed('SPEC01')
+        feed.spectators.add(binary)
+        self.frames = [self.snapshot(1)]
+        await self.ticker.tick(feed)
+
+        feed.spectators.add(text)
+        await self.ticker.send_latest('SPEC01', text)
+        self.assertEqual(json.loads(text.received[0]['text']), self.snapshot(1))
+
+
+@override_settings(GAME_SPECTATOR_TICKER={'RATE': 50}, **benchmarks.BENCHMARK_SETTINGS)
+class SpectatorFrameTests(TestCase):
+    """What a spectator is sent compared with a player."""
+
+    def tearDown(self):
+        benchmarks.reset_realtime_state()
+
+    def test_spectators_get_snapshots_instead_of_events(self):
+        async def run():
+            room = benchmarks.Room(2, benchmarks.QueryCounter())
+            await room.setup()
+            spectator = await room.connect('spectator')
+            try:
+                self.assertEqual((await spectator.receive())['type'], 'spectator')
+                round_number = await room.start_round()
+                first = room.players[0]
+                await first.communicator.send_json_to({
+                    'type': 'buzz', 'player_id': first.player_id, 'timestamp': int(time.time() * 1000),
+                    'round': round_number
+                })
+                self.assertEqual((await first.receive())['type'], 'buzz_rank')
+
+                received = []
+                while not received or not received[-1]['ordered_buzzes']:
+                    received.append(await spectator.receive())
+                self.assertEqual({frame['type'] for frame in received}, {'spectator'})
+                snapshot = received[-1]
+                self.assertEqual(snapshot['current_round'], round_number)
+                self.assertEqual(snapshot['player_count'], 2)
+                self.assertEqual(len(snapshot['players']), 2)
+                # Unlike the host's buzz order, no timestamps
+                self.assertEqual(snapshot['ordered_buzzes'], [
+                    {'player_id': first.player_id, 'player_name': 'Player 0', 'is_correct': None}
+                ])
+
+                # Read-only: a buzz sent from a spectator screen goes nowhere
+                await room.drain()
+                with self.assertLogs('django.channels', 'WARNING'):
+                    await spectator.communicator.send_json_to({
+                        'type': 'buzz', 'player_id': room.players[1].player_id, 'timestamp': 0,
+                        'round': round_number
+                    })
+                    self.assertTrue(await room.host.communicator.receive_nothing(timeout=0.05))
+                self.assertEqual(len(spectator_ticker), 1)
+            finally:
+                await spectator.communicator.disconnect()
+                await room.teardown()
+            self.assertEqual(len(spectator_ticker), 0)
+
+        async_to_sync(run)()
+
+
+def log_record(message_type=None, level=logging.INFO):
+    record = logging.LogRecord('django.channels', level, __file__, 1, 'message', None, None)
+    if message_type is not None:
+        record.message_type = message_type
+    return record
+
+
+@override_settings(GAME_LOG_SAMPLING={'buzz': {'sample': 0.25}, 'join_game': {'per_second': 3},
+                                      '*': {'sample': 1.0}})
+class MessageTypeSamplerTests(SimpleTestCase):
+    def test_sample_keeps_that_fraction_of_records(self):
+        sampler = MessageTypeSampler()
+        with mock.patch('game.logutils.random.random', side_effect=[i / 100 for i in range(100)]):
+            kept = sum(sampler.filter(log_record('buzz')) for _ in range(100))
+        self.assertEqual(kept, 25)
+        self.assertEqual(sampler.suppressed, 75)
+
+    def test_per_second_limit_resets_each_second(self):
+        sampler = MessageTypeSampler()
+        with mock.patch('game.logutils.time.monotonic', side_effect=[0.0] * 5 + [1.0] * 2):
+            kept = [sampler.filter(log_record('join_game')) for _ in range(7)]
+        self.assertEqual(kept, [True, True, True, False, False, True, True])
+
+    def test_warnings_and_untagged_records_always_pass(self):
+        sampler = MessageTypeSampler()
+        with mock.patch('game.logutils.random.random', return_value=0.99):
+            self.assertTrue(sampler.filter(log_record('buzz', logging.WARNING)))
+            self.assertTrue(sampler.filter(log_record()))
+            self.assertTrue(sampler.filter(log_record('other')))
+            self.assertFalse(sampler.filter(log_record('buzz')))
+
+
+class FrameRecorderTests(SimpleTestCase):
+    def test_keeps_the_latest_frames_of_the_most_recent_groups(self):
+        recorder = FrameRecorder(size=3, max_groups=2)
+        for i in range(5):
+            recorder.record('game_A', 'out', i)
+        recorder.record('game_B', 'in', 'b')
+        recorder.record('game_A', 'out', 5)
+        recorder.record('game_C', 'in', 'c')
+
+        self.assertEqual([entry['frame'] for entry in recorder.dump('game_A')], [3, 4, 5])
+        # game_B was the least recently active when game_C arrived
+        self.assertEqual(recorder.dump('game_B'), [])
+        self.assertEqual([(entry['direction'], entry['frame']) for entry in recorder.dump('game_C')], [('in', 'c')])
+
+    def test_size_zero_records_nothing(self):
+        recorder = FrameRecorder(size=0)
+        recorder.record('game_A', 'out', 'frame')
+        self.assertEqual(recorder.dump('game_A'), [])
@@ -7,7 +7,10 @@ urlpatterns = [
     path('host/game/<str:game_code>/', views.HostGameView.as_view(), name='host_game'),
     path('player/join/<str:game_code>/', views.PlayerJoinView.as_view(), name='player_join'),
     path('player/game/<str:game_code>/<str:player_name>/', views.PlayerGameView.as_view(), name='player_game'),
+    path('api/game/<str:game_code>/state/', views.GameStateView.as_view(), name='game_state'),
     path('api/sync-time/', views.SyncTimeView.as_view(), name='sync_time'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     path('diagnostics/websocket/<str:game_code>/', views.WebSocketTestView.as_view(), name='websocket_test'),
     path('diagnostics/test-game/<str:game_code>/', views.TestGameView.as_view(), name='test_game'),
+    path('diagnostics/frames/<str:game_code>/', views.FrameDumpView.as_view(), name='frame_dump'),
 ]
\ No newline at end of file
@@ -1,18 +1,36 @@
+import hmac
 import json
 import random
 import string
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse, HttpRequest
+from django.http import Http404, JsonResponse, HttpResponse, HttpRequest
 from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View, TemplateView, FormView
 from django.conf import settings
 
+from . import wire
+from .conf import SettingGroup
+from .db_executor import async_orm_enabled, database_read
+from .logutils import frame_recorder
+from .metrics import registry
 from .models import GameSession, Player, BuzzEvent
+from .roles import ROLES, role_group
+from .state_cache import fetch_game_state
+from .store import get_game_store
+
+state_endpoint_settings = SettingGroup('GAME_STATE_ENDPOINT', {
+    # Gzip state responses for clients that accept it
+    'GZIP': True,
+    # Smaller bodies are sent as they are; gzip would barely shrink them
+    'GZIP_MIN_SIZE': 1024,
+})
 
 
 def generate_game_code(length=6) -> str:
@@ -21,6 +39,25 @@ def generate_game_code(length=6) -> str:
     return ''.join(random.choice(characters) for _ in range(length))
 
 
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an ``Accept-Encoding`` header allows gzip, honouring ``q=0`` refusals."""
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    # An explicit gzip entry wins over the wildcard
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
 class HomeView(TemplateView):
     """Home page view."""
     template_name = 'game/home.html'
@@ -74,35 +111,47 @@ class HostGameView(TemplateView):
         return context
 
 
-class PlayerJoinView(TemplateView):
-    """View for players to join a game."""
-    template_name = 'game/player_join.html'
+def get_active_game(game_code: str) -> Optional[GameSession]:
+    """Get an active game by code, or None."""
+    return GameSession.objects.filter(code=game_code, is_active=True).first()
+
+
+class ActiveGameView(TemplateView):
+    """Template view for a page of an active game, served asynchronously.
     
-    def get(self, request, *args, **kwargs):
+    The game is fetched once, through the async ORM when ``GAME_ASYNC_ORM``
+    is set or the DB executor's read pool otherwise, and passed to
+    ``get_context_data`` as ``game``.
+    """
+    
+    async def get(self, request, *args, **kwargs):
         """Handle GET requests and validate game code."""
         game_code = self.kwargs.get('game_code')
         
-        try:
-            # Check if game exists and is active
-            GameSession.objects.get(code=game_code, is_active=True)
-            return super().get(request, *args, **kwargs)
-        except GameSession.DoesNotExist:
+        # Check if game exists and is active
+        if async_orm_enabled():
+            game = await GameSession.objects.filter(code=game_code, is_active=True).afirst()
+        else:
+            game = await database_read(get_active_game)(game_code)
+        
+        if game is None:
             # Render an error message for non-existent or inactive games
             return render(request, 'game/game_error.html', {
                 'error_message': f"Game with code '{game_code}' does not exist or is no longer active.",
                 'back_url': reverse('home')
             })
+        return self.render_to_response(self.get_context_data(game=game, **kwargs))
+
+
+class PlayerJoinView(ActiveGameView):
+    """View for players to join a game."""
+    template_name = 'game/player_join.html'
     
     def get_context_data(self, **kwargs) -> Dict[str, Any]:
         """Add game data to context."""
         context = super().get_context_data(**kwargs)
-        game_code = self.kwargs.get('game_code')
-        
-        # We can safely use get_object_or_404 here since we've already checked in get()
-        game = get_object_or_404(GameSession, code=game_code)
         
         context.update({
-            'game': game,
             'buzzer_sounds': [
                 {'id': 'default', 'name': 'Default'},
                 {'id': 'bell', 'name': 'Bell'},
@@ -115,36 +164,19 @@ class PlayerJoinView(TemplateView):
         return context
 
 
-class PlayerGameView(TemplateView):
+class PlayerGameView(ActiveGameView):
     """View for the player's game interface."""
     template_name = 'game/player_game.html'
     
-    def get(self, request, *args, **kwargs):
-        """Handle GET requests and validate game code."""
-        game_code = self.kwargs.get('game_code')
-        
-        try:
-            # Check if game exists and is active
-            GameSession.objects.get(code=game_code, is_active=True)
-            return super().get(request, *args, **kwargs)
-        except GameSession.DoesNotExist:
-            # Render an error message for non-existent or inactive games
-            return render(request, 'game/game_error.html', {
-                'error_message': f"Game with code '{game_code}' does not exist or is no longer active.",
-                'back_url': reverse('home')
-            })
-    
     def get_context_data(self, **kwargs) -> Dict[str, Any]:
         """Add game data to context."""
         context = super().get_context_data(**kwargs)
-        game_code = self.kwargs.get('game_code')
         player_name = self.kwargs.get('player_name')
         
-        game = get_object_or_404(GameSession, code=game_code)
-        
         context.update({
-            'game': game,
-            'player_name': player_name
+            'player_name': player_name,
+            # Code tables for the binary wire protocol, if it is enabled
+            'wire_tables': wire.client_tables() if wire.is_enabled() else None
         })
         
         return context
@@ -171,6 +203,44 @@ class TestGameView(TemplateView):
         return context
 
 
+class GameStateView(View):
+    """A game's state as JSON, for displays that poll instead of keeping a WebSocket open.
+    
+    The body is the ``game_state`` snapshot WebSocket hosts get, served from
+    the game state cache and encoded once per state version. Its ETag is
+    the version, so a poll with a current ``If-None-Match`` gets a 304
+    without the database being touched.
+    """
+    
+    async def get(self, request: HttpRequest, game_code: str, *args, **kwargs) -> HttpResponse:
+        """Handle GET requests."""
+        state = await fetch_game_state(game_code, get_game_store())
+        if state is None:
+            return JsonResponse({'error': f"Game with code '{game_code}' does not exist"}, status=404)
+        
+        compress = (state_endpoint_settings['GZIP']
+                    and accepts_gzip(request.headers.get('Accept-Encoding', '')))
+        version, body = state.encoded_snapshot()
+        if compress and len(body) >= state_endpoint_settings['GZIP_MIN_SIZE']:
+            version, body = state.encoded_snapshot(compress=True)
+        else:
+            compress = False
+        # Weak: the gzipped and plain bodies are the same state
+        tag = f'"{state.epoch}-{version}"'
+        
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in if_none_match or any(match.removeprefix('W/') == tag for match in if_none_match):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+            if compress:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = f'W/{tag}'
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class SyncTimeView(View):
     """View for time synchronization."""
@@ -193,4 +263,48 @@ class SyncTimeView(View):
                 'server_time': server_time
             })
         except json.JSONDecodeError:
-            return JsonResponse({'error': 'Invalid JSON'}, status=400)
\ No newline at end of file
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+
+class MetricsView(View):
+    """Real-time metrics for this process in the Prometheus text format.
+    
+    Served in DEBUG mode, to staff users, and to scrapers that send
+    ``Authorization: Bearer <GAME_METRICS_TOKEN>`` when that is set.
+    """
+    
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        """Handle GET requests."""
+        if not getattr(settings, 'GAME_METRICS_ENABLED', True):
+            raise Http404('Metrics are disabled')
+        if not settings.DEBUG and not request.user.is_staff and not self.has_token(request):
+            raise Http404('Metrics are only available to staff')
+        return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    
+    @staticmethod
+    def has_token(request: HttpRequest) -> bool:
+        token = getattr(settings, 'GAME_METRICS_TOKEN', None)
+        if not token:
+            return False
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+
+class FrameDumpView(View):
+    """Dump the recent WebSocket frames of a game for debugging."""
+    
+    def get(self, request: HttpRequest, game_code: str, *args, **kwargs) -> JsonResponse:
+        """Handle GET requests."""
+        if not settings.DEBUG and not request.user.is_staff:
+            raise Http404('Frame dumps are only available to staff')
+        # Frames received are kept under the game's group, frames sent
+        # under the group of the role they went to
+        game_group = f'game_{game_code}'
+        groups = [game_group] + [role_group(game_group, role) for role in ROLES]
+        frames = sorted(
+            ({**frame, 'group': group} for group in groups for frame in frame_recorder.dump(group)),
+            key=lambda frame: frame['time']
+        )
+        return JsonResponse({
+            'game_code': game_code,
+            'frames': frames
+        })
@@ -0,0 +1,89 @@
+"""Compact binary wire protocol for WebSocket frames.
+
+Clients that offer the ``SUBPROTOCOL`` WebSocket subprotocol get msgpack
+frames in which known field names and message types are replaced by small
+integer codes. Clients that don't keep getting JSON text frames. Unknown
+fields and types are sent as plain strings, so either side can add one
+before the tables know about it.
+"""
+from typing import Any, Dict
+
+import msgpack
+from django.conf import settings
+
+SUBPROTOCOL = 'buzzquiz.msgpack.v1'
+
+# A code is its index. Only ever append: clients hold a copy of these tables
+# and a code must keep its meaning for the lifetime of SUBPROTOCOL.
+FIELDS = (
+    'type', 'version', 'players', 'player', 'player_id', 'player_name', 'name', 'score',
+    'rank', 'buzzer_sound', 'id', 'ordered_buzzes', 'round', 'current_round', 'timestamp',
+    'is_correct', 'patches', 'game', 'state', 'code', 'is_active', 'message', 'client_time',
+    'server_time', 'game_name', 'actual_name', 'is_host', 'device_id', 'epoch', 'reason',
+    'player_count', 'locked', 'size',
+)
+TYPES = (
+    'buzz', 'buzz_order', 'join_game', 'join_confirmed', 'start_round', 'start_round_confirmed',
+    'end_round', 'round_state', 'judge_answer', 'sync_time', 'sync_time_response', 'ping', 'pong',
+    'get_game_state', 'game_state', 'player_list', 'state_patch', 'error',
+    'player_added', 'player_renamed', 'score_changed', 'round_changed',
+    'clock_probe', 'clock_reply', 'buzz_rejected', 'leaderboard', 'standing', 'buzz_rank',
+    'spectator',
+)
+
+FIELD_CODES = {name: code for code, name in enumerate(FIELDS)}
+TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+TYPE_FIELD = FIELD_CODES['type']
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'GAME_BINARY_PROTOCOL', True)
+
+
+def compact(value: Any) -> Any:
+    """Replace known field names and message types with their codes."""
+    if isinstance(value, dict):
+        return {
+            FIELD_CODES.get(key, key): TYPE_CODES.get(item, item) if key == 'type' else compact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value: Any) -> Any:
+    """Undo ``compact``. Field names sent as strings are accepted too."""
+    if isinstance(value, dict):
+        expanded = {}
+        for key, item in value.items():
+            if isinstance(key, int) and 0 <= key < len(FIELDS):
+                key = FIELDS[key]
+            if key == 'type':
+                if isinstance(item, int) and 0 <= item < len(TYPES):
+                    item = TYPES[item]
+            else:
+                item = expand(item)
+            expanded[key] = item
+        return expanded
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+def pack(payload: Any) -> bytes:
+    """Encode a payload as a binary frame."""
+    return msgpack.packb(compact(payload))
+
+
+def unpack(data: bytes) -> Any:
+    """Decode a binary frame. Raises ValueError if it is not valid msgpack."""
+    try:
+        return expand(msgpack.unpackb(data, strict_map_key=False))
+    except (msgpack.UnpackException, ValueError, TypeError) as e:
+        raise ValueError(f'Invalid binary frame: {e}') from e
+
+
+def client_tables() -> Dict[str, Any]:
+    """The code tables as handed to browser clients."""
+    return {'subprotocol': SUBPROTOCOL, 'fields': list(FIELDS), 'types': list(TYPES)}
@@ -0,0 +1,58 @@
+// WebSocket wrapper that speaks the compact binary protocol (see game/wire.py)
+// when the server offers it and the msgpack library has loaded, and plain
+// JSON text frames otherwise.
+function BuzzWire(url, tables) {
+    this.tables = tables;
+    this.open(url);
+}
+
+// (Re)connect, replacing the current socket
+BuzzWire.prototype.open = function(url) {
+    const offer = this.tables && typeof MessagePack !== 'undefined' ? [this.tables.subprotocol] : [];
+    this.socket = new WebSocket(url, offer);
+    this.socket.binaryType = 'arraybuffer';
+    return this.socket;
+};
+
+BuzzWire.prototype.isBinary = function() {
+    return Boolean(this.tables) && this.socket.protocol === this.tables.subprotocol;
+};
+
+// Outgoing frames keep their field names; they are small and the server
+// accepts names as well as codes
+BuzzWire.prototype.send = function(payload) {
+    if (this.isBinary()) {
+        this.socket.send(MessagePack.encode(payload));
+    } else {
+        this.socket.send(JSON.stringify(payload));
+    }
+};
+
+BuzzWire.prototype.decode = function(data) {
+    if (typeof data === 'string') {
+        return JSON.parse(data);
+    }
+    return this.expand(MessagePack.decode(new Uint8Array(data)));
+};
+
+// Turn field and message type codes back into names
+BuzzWire.prototype.expand = function(value) {
+    if (Array.isArray(value)) {
+        return value.map(item => this.expand(item));
+    }
+    if (value === null || typeof value !== 'object') {
+        return value;
+    }
+    const expanded = {};
+    for (const [key, item] of Object.entries(value)) {
+        const name = /^\d+$/.test(key) && this.tables.fields[key] !== undefined ? this.tables.fields[key] : key;
+        if (name === 'type') {
+            expanded[name] = typeof item === 'number' && this.tables.types[item] !== undefined
+                ? this.tables.types[item]
+                : item;
+        } else {
+            expanded[name] = this.expand(item);
+        }
+    }
+    return expanded;
+};